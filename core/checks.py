@@ -0,0 +1,23 @@
+# core/checks.py
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Backends whose data (and add/incr) is private to one process
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """The checkout locks, navbar counters and content versions need one cache for all workers"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        f"The default cache ({backend}) is not shared between worker processes.",
+        hint="Set REDIS_URL (or configure Memcached) when running more than one worker, otherwise "
+             "identical checkouts are not serialized and cached counts and versions go stale.",
+        id='core.W001',
+    )]
@@ -0,0 +1,72 @@
+# core/page_cache.py
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Bumped on every save/delete of homepage content (see core/signals.py)
+CONTENT_VERSION_KEY = 'core:content_version'
+
+SECTION_KEY = 'core:section:{name}:v{version}'
+LATEST_KEY = 'core:section:{name}:latest'
+LOCK_KEY = 'core:section:{name}:lock'
+
+
+def get_content_version():
+    version = cache.get(CONTENT_VERSION_KEY)
+    if version is None:
+        cache.add(CONTENT_VERSION_KEY, 1, None)
+        version = cache.get(CONTENT_VERSION_KEY, 1)
+    return version
+
+
+def bump_content_version():
+    """Invalidate every cached section by moving to a new content version"""
+    try:
+        return cache.incr(CONTENT_VERSION_KEY)
+    except ValueError:
+        # Key evicted or never set: start from a value no old entry can have
+        version = int(time.time())
+        cache.set(CONTENT_VERSION_KEY, version, None)
+        return version
+
+
+def get_or_render(name, render):
+    """
+    Return the cached HTML of a section for the current content version.
+
+    Only the worker that wins the lock re-renders after an invalidation. The others
+    serve the previous version's HTML while that happens. They wait briefly only
+    when there is nothing cached at all (cold cache).
+    """
+    timeout = getattr(settings, 'HOMEPAGE_CACHE_TIMEOUT', 60 * 60)
+    lock_timeout = getattr(settings, 'HOMEPAGE_CACHE_LOCK_TIMEOUT', 30)
+
+    version = get_content_version()
+    key = SECTION_KEY.format(name=name, version=version)
+    html = cache.get(key)
+    if html is not None:
+        return html
+
+    lock_key = LOCK_KEY.format(name=name)
+    if cache.add(lock_key, version, lock_timeout):
+        try:
+            html = render()
+            cache.set(key, html, timeout)
+            cache.set(LATEST_KEY.format(name=name), html, None)
+            return html
+        finally:
+            cache.delete(lock_key)
+
+    stale = cache.get(LATEST_KEY.format(name=name))
+    if stale is not None:
+        return stale
+
+    # Cold cache and another worker is rendering: give it a moment before doing it ourselves
+    deadline = time.monotonic() + getattr(settings, 'HOMEPAGE_CACHE_WAIT', 2)
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        html = cache.get(key)
+        if html is not None:
+            return html
+    return render()
@@ -0,0 +1,16 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from core.models import Banner, Deal, Brand
+from core.page_cache import bump_content_version
+from product.models import Product, Image
+
+
+# Any change to homepage content invalidates the cached homepage sections
+@receiver([post_save, post_delete], sender=Banner)
+@receiver([post_save, post_delete], sender=Deal)
+@receiver([post_save, post_delete], sender=Brand)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Image)
+def homepage_content_changed(sender, **kwargs):
+    bump_content_version()
@@ -0,0 +1,44 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from core.page_cache import get_or_render
+
+register = template.Library()
+
+# Rendered in place of the real CSRF token so cached HTML can be shared between users
+CSRF_PLACEHOLDER = '__kickera_csrf_token__'
+
+
+class CachedSectionNode(template.Node):
+    def __init__(self, nodelist, name):
+        self.nodelist = nodelist
+        self.name = name
+
+    def render(self, context):
+        name = self.name.resolve(context)
+
+        def render_section():
+            with context.push(csrf_token=CSRF_PLACEHOLDER):
+                return self.nodelist.render(context)
+
+        html = get_or_render(name, render_section)
+        csrf_token = context.get('csrf_token')
+        token = '' if csrf_token in (None, 'NOTPROVIDED') else str(csrf_token)
+        return mark_safe(html.replace(CSRF_PLACEHOLDER, token))
+
+
+@register.tag
+def cached_section(parser, token):
+    """
+    {% cached_section "name" %}...{% endcached_section %}
+
+    Caches the rendered block until the homepage content version changes
+    (core/page_cache.py). Querysets used only inside the block are not evaluated
+    on a cache hit.
+    """
+    bits = token.split_contents()
+    if len(bits) != 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' takes exactly one argument (the section name)")
+    nodelist = parser.parse(('endcached_section',))
+    parser.delete_first_token()
+    return CachedSectionNode(nodelist, parser.compile_filter(bits[1]))
@@ -1,3 +1,14 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, override_settings
 
-# Create your tests here.
+from core.checks import check_shared_cache
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    def test_process_local_cache_is_reported(self):
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([w.id for w in check_shared_cache(None)], ['core.W001'])
+
+    def test_redis_cache_passes(self):
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache:6379'}}
+        with override_settings(CACHES=redis):
+            self.assertEqual(check_shared_cache(None), [])
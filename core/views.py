@@ -9,16 +9,17 @@ from django.views.generic import TemplateView, UpdateView, DetailView, FormView
 from django.contrib.auth.views import PasswordChangeView
 from allauth.account.views import ReauthenticateView
 from orders.models import Order
-from pywin.tools.browser import template
 
 class HomePageView(TemplateView):
     template_name='index.html'
     def get_context_data(self, **kwargs):
         context = super(HomePageView, self).get_context_data(**kwargs)
+        # Querysets stay lazy: the {% cached_section %} blocks in index.html only
+        # evaluate them when the section is re-rendered after a content change
         banners = Banner.objects.all().order_by('sort_order')
         context['banners'] = banners
-        context['products_latest'] = Product.objects.filter(product_type='latest')
-        context['products_coming'] = Product.objects.filter(product_type='coming')
+        context['products_latest'] = Product.objects.filter(product_type='latest').select_related('primary_image')
+        context['products_coming'] = Product.objects.filter(product_type='coming').select_related('primary_image')
         context['deals'] = Deal.objects.all()
         context['brands'] = Brand.objects.all()
         return context
@@ -40,7 +41,8 @@ class ConfirmationPageView(LoginRequiredMixin, TemplateView):
                         is_paid='Completed',
                         razorpay_order_id='test_order_id',
                         razorpay_payment_id='test_payment_id',
-                        razorpay_signature='test_signature'
+                        razorpay_signature='test_signature',
+                        **Order.vendor_fields([product.vendor_id]),
                     )
                     print(f"Created test order: {order.id}")
                     from django.shortcuts import redirect
@@ -10,6 +10,10 @@ from django.contrib.messages import constants as messages
 RAZORPAY_KEY_ID = 'rzp_test_LiYIro0JdpKb1h'
 RAZORPAY_KEY_SECRET = 'L9JB08EOR8kZ0ePmFjzNHwli'
 RAZORPAY_CALLBACK_URL = "http://127.0.0.1:8000/payment/callback/"
+RAZORPAY_WEBHOOK_SECRET = None  # set to enable payment/webhook/
+# 'fake' swaps in payment.gateway.FakeGateway for offline development
+PAYMENT_GATEWAY = 'razorpay'
+RAZORPAY_TIMEOUT = (3.05, 10)  # connect, read seconds
 
 # RAZOR pay integrations
 PAYMENT_VARIANTS = {'razorpay': ('django_payments_razorpay.RazorPayProvider',
@@ -63,6 +67,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'product.session_cart.SessionCartMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
@@ -99,6 +104,32 @@ DATABASES = {
     }
 }
 
+# Cache
+# State shared by all workers lives here: the homepage section cache and its
+# content version, the taxonomy version, the navbar cart/wishlist counters and
+# the checkout locks. LocMemCache is private to one process, so it is only
+# correct with a single worker. With several workers set REDIS_URL (Django's
+# RedisCache, needs the redis package) or another backend with atomic add/incr
+# such as Memcached; DatabaseCache will not do, its incr is a read then a write.
+# `manage.py check --deploy` warns while a per-process cache is configured.
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'kickera',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'kickera',
+        }
+    }
+HOMEPAGE_CACHE_TIMEOUT = 60 * 60
+
 # Authentication Backends
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',  # Admin login
@@ -12,14 +12,22 @@ from datetime import datetime
 from django.db.models import Sum, Count
 from django.utils.html import strip_tags
 
-from orders.models import Order
+from orders.models import Invoice, Order, OrderItem
 from product.models import Product
 
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    readonly_fields = ['product', 'quantity', 'unit_price']
+    can_delete = False
+
+
 class OrderAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'product', 'amount', 'is_paid', 'order_status', 'created_at']
     list_filter = ['is_paid', 'order_status', 'created_at']
     search_fields = ['id', 'user__username', 'user__email', 'product__name', 'razorpay_order_id']
     date_hierarchy = 'created_at'
+    inlines = [OrderItemInline]
     
     actions = [
         'export_sales_report_csv', 
@@ -71,10 +79,26 @@ class OrderAdmin(admin.ModelAdmin):
             
         if hasattr(request.user, 'vendor_profile'):
             # For vendors, only show orders containing their products
-            return qs.filter(product__vendor=request.user.vendor_profile)
+            return qs.for_vendor(request.user.vendor_profile)
             
         # For regular users, only show their own orders
         return qs.filter(user=request.user)
+
+    def report_rows(self, queryset, request):
+        """
+        (order, product label, amount) for the report actions.
+
+        An order can hold other vendors' lines, so a vendor gets only their own
+        product names and their share of the amount, never the headline product.
+        """
+        vendor = None if request.user.is_superuser else getattr(request.user, 'vendor_profile', None)
+        if vendor is None:
+            for order in queryset:
+                yield order, order.product.name if order.product else 'N/A', order.amount
+            return
+        names = queryset.vendor_line_names(vendor)
+        for order in queryset.with_vendor_amount(vendor):
+            yield order, names.get(order.id, 'N/A'), order.vendor_amount
     
     @admin.action(description='Export sales report to CSV')
     def export_sales_report_csv(self, request, queryset):
@@ -88,18 +112,13 @@ class OrderAdmin(admin.ModelAdmin):
                          'Amount', 'Payment Status', 'Order Status', 'Date'])
         
         # Write data rows
-        for order in queryset:
-            # Skip this order if user is vendor and product doesn't belong to them
-            if hasattr(request.user, 'vendor_profile') and not request.user.is_superuser:
-                if order.product.vendor != request.user.vendor_profile:
-                    continue
-                    
+        for order, product_name, amount in self.report_rows(queryset, request):
             writer.writerow([
                 order.id,
                 order.user.username if order.user else 'Guest',
                 order.user.email if order.user else 'N/A',
-                order.product.name if order.product else 'N/A',
-                f"₹{order.amount}" if order.amount else 'N/A',
+                product_name,
+                f"₹{amount}" if amount else 'N/A',
                 order.is_paid,
                 order.order_status,
                 order.created_at.strftime("%Y-%m-%d %H:%M") if order.created_at else 'N/A'
@@ -121,17 +140,12 @@ class OrderAdmin(admin.ModelAdmin):
         data = [['Order ID', 'Customer', 'Product', 'Amount', 'Status', 'Date']]
         
         # Add data rows to table
-        for order in queryset:
-            # Skip this order if user is vendor and product doesn't belong to them
-            if hasattr(request.user, 'vendor_profile') and not request.user.is_superuser:
-                if order.product.vendor != request.user.vendor_profile:
-                    continue
-                    
+        for order, product_name, amount in self.report_rows(queryset, request):
             data.append([
                 str(order.id),
                 order.user.username if order.user else 'Guest',
-                order.product.name if order.product else 'N/A',
-                f"₹{order.amount}" if order.amount else 'N/A',
+                product_name,
+                f"₹{amount}" if amount else 'N/A',
                 order.is_paid,
                 order.created_at.strftime("%Y-%m-%d") if order.created_at else 'N/A'
             ])
@@ -172,7 +186,7 @@ class OrderAdmin(admin.ModelAdmin):
                         'Product', 'Amount', 'Payment Status', 'Order Status'])
         
         # Write data rows
-        for order in queryset:
+        for order, product_name, amount in self.report_rows(queryset, request):
             shipping_address = f"{order.address.address}, {order.address.city}, {order.address.state} - {order.address.pincode}" if order.address else "N/A"
             
             writer.writerow([
@@ -180,8 +194,8 @@ class OrderAdmin(admin.ModelAdmin):
                 order.created_at.strftime("%Y-%m-%d %H:%M") if order.created_at else 'N/A',
                 order.user.username if order.user else 'Guest',
                 shipping_address,
-                order.product.name if order.product else 'N/A',
-                f"₹{order.amount}" if order.amount else 'N/A',
+                product_name,
+                f"₹{amount}" if amount else 'N/A',
                 order.is_paid,
                 order.order_status,
             ])
@@ -202,13 +216,13 @@ class OrderAdmin(admin.ModelAdmin):
         data = [['Order ID', 'Customer', 'Order Date', 'Product', 'Amount', 'Status']]
         
         # Add data rows to table
-        for order in queryset:
+        for order, product_name, amount in self.report_rows(queryset, request):
             data.append([
                 str(order.id),
                 order.user.username if order.user else 'Guest',
                 order.created_at.strftime("%Y-%m-%d") if order.created_at else 'N/A',
-                order.product.name if order.product else 'N/A',
-                f"₹{order.amount}" if order.amount else 'N/A',
+                product_name,
+                f"₹{amount}" if amount else 'N/A',
                 order.order_status
             ])
         
@@ -246,11 +260,13 @@ class OrderAdmin(admin.ModelAdmin):
         # Write header row
         writer.writerow(['Product ID', 'Product Name', 'Category', 'Brand', 'Price', 'Stock', 'Vendor'])
         
-        # Get unique products from orders
-        products = set()
-        for order in queryset:
-            if order.product:
-                products.add(order.product)
+        # Get unique products from the order lines
+        products = Product.objects.filter(order_items__order__in=queryset).select_related(
+            'category', 'brand', 'vendor'
+        ).distinct()
+        if hasattr(request.user, 'vendor_profile') and not request.user.is_superuser:
+            # Orders can hold other vendors' lines too
+            products = products.filter(vendor=request.user.vendor_profile)
                 
         # If no products found in orders, get all products
         if not products and (request.user.is_superuser or hasattr(request.user, 'vendor_profile')):
@@ -286,11 +302,13 @@ class OrderAdmin(admin.ModelAdmin):
         # Define table data with header row
         data = [['Product ID', 'Product Name', 'Category', 'Stock', 'Price', 'Vendor']]
         
-        # Get unique products from orders
-        products = set()
-        for order in queryset:
-            if order.product:
-                products.add(order.product)
+        # Get unique products from the order lines
+        products = Product.objects.filter(order_items__order__in=queryset).select_related(
+            'category', 'brand', 'vendor'
+        ).distinct()
+        if hasattr(request.user, 'vendor_profile') and not request.user.is_superuser:
+            # Orders can hold other vendors' lines too
+            products = products.filter(vendor=request.user.vendor_profile)
                 
         # If no products found in orders, get all products
         if not products and (request.user.is_superuser or hasattr(request.user, 'vendor_profile')):
@@ -346,17 +364,12 @@ class OrderAdmin(admin.ModelAdmin):
                          'Payment Status', 'Payment ID', 'Razorpay Order ID'])
         
         # Write data rows
-        for order in queryset:
-            # Skip this order if user is vendor and product doesn't belong to them
-            if hasattr(request.user, 'vendor_profile') and not request.user.is_superuser:
-                if order.product.vendor != request.user.vendor_profile:
-                    continue
-                    
+        for order, product_name, amount in self.report_rows(queryset, request):
             writer.writerow([
                 order.id,
                 order.created_at.strftime("%Y-%m-%d %H:%M") if order.created_at else 'N/A',
                 order.user.username if order.user else 'Guest',
-                f"₹{order.amount}" if order.amount else 'N/A',
+                f"₹{amount}" if amount else 'N/A',
                 order.is_paid,
                 order.razorpay_payment_id or 'N/A',
                 order.razorpay_order_id or 'N/A'
@@ -378,17 +391,12 @@ class OrderAdmin(admin.ModelAdmin):
         data = [['Order ID', 'Date', 'Customer', 'Amount', 'Status', 'Payment ID']]
         
         # Add data rows to table
-        for order in queryset:
-            # Skip this order if user is vendor and product doesn't belong to them
-            if hasattr(request.user, 'vendor_profile') and not request.user.is_superuser:
-                if order.product.vendor != request.user.vendor_profile:
-                    continue
-                    
+        for order, product_name, amount in self.report_rows(queryset, request):
             data.append([
                 str(order.id),
                 order.created_at.strftime("%Y-%m-%d") if order.created_at else 'N/A',
                 order.user.username if order.user else 'Guest',
-                f"₹{order.amount}" if order.amount else 'N/A',
+                f"₹{amount}" if amount else 'N/A',
                 order.is_paid,
                 order.razorpay_payment_id or 'N/A'
             ])
@@ -432,13 +440,13 @@ class OrderAdmin(admin.ModelAdmin):
         refund_orders = queryset.filter(is_paid='Canceled')
         
         # Write data rows
-        for order in refund_orders:
+        for order, product_name, amount in self.report_rows(refund_orders, request):
             writer.writerow([
                 order.id,
                 order.updated_at.strftime("%Y-%m-%d %H:%M") if order.updated_at else 'N/A',
                 order.user.username if order.user else 'Guest',
-                order.product.name if order.product else 'N/A',
-                f"₹{order.amount}" if order.amount else 'N/A',
+                product_name,
+                f"₹{amount}" if amount else 'N/A',
                 'Refunded',
                 'Order canceled' # Add reason field in your model if needed
             ])
@@ -462,13 +470,13 @@ class OrderAdmin(admin.ModelAdmin):
         refund_orders = queryset.filter(is_paid='Canceled')
         
         # Add data rows to table
-        for order in refund_orders:
+        for order, product_name, amount in self.report_rows(refund_orders, request):
             data.append([
                 str(order.id),
                 order.updated_at.strftime("%Y-%m-%d") if order.updated_at else 'N/A',
                 order.user.username if order.user else 'Guest',
-                order.product.name if order.product else 'N/A',
-                f"₹{order.amount}" if order.amount else 'N/A',
+                product_name,
+                f"₹{amount}" if amount else 'N/A',
                 'Refunded'
             ])
         
@@ -497,4 +505,18 @@ class OrderAdmin(admin.ModelAdmin):
         return response
 
 # Register the Order model with the custom admin
-admin.site.register(Order, OrderAdmin)
\ No newline at end of file
+admin.site.register(Order, OrderAdmin)
+
+@admin.register(Invoice)
+class InvoiceAdmin(admin.ModelAdmin):
+    list_display = ['invoice_number', 'order', 'vendor', 'amount', 'issued_at']
+    list_filter = ['financial_year', 'series']
+    search_fields = ['order__id', 'order__razorpay_order_id']
+    readonly_fields = ['order', 'vendor', 'series', 'financial_year', 'number', 'amount', 'issued_at', 'pdf']
+
+    def has_add_permission(self, request):
+        # Numbers come from orders.invoices only, a hand-made invoice would break the sequence
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,185 @@
+# orders/invoices.py
+import hashlib
+import logging
+from collections import defaultdict
+from decimal import Decimal
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from orders.models import Invoice, InvoiceSequence, OrderItem
+
+logger = logging.getLogger(__name__)
+
+# Series of lines without a vendor (store products, deleted products)
+STORE_SERIES = 'KE'
+
+# Concurrent issuers of the same order: the loser rolls back (numbers included) and retries
+ISSUE_ATTEMPTS = 3
+
+
+def financial_year(day):
+    """Indian financial year (April to March) of a date, as '2026-27'"""
+    start = day.year if day.month >= 4 else day.year - 1
+    return f"{start}-{(start + 1) % 100:02d}"
+
+
+def series_for(vendor_id):
+    return f"V{vendor_id}" if vendor_id else STORE_SERIES
+
+
+def _allocate(series, year, count):
+    """
+    Take a block of `count` consecutive numbers of a series, returns the first.
+
+    The UPDATE holds the sequence row until the caller's transaction ends, so a
+    rolled back batch gives its block back and numbers stay gapless.
+    """
+    sequence, _ = InvoiceSequence.objects.get_or_create(series=series, financial_year=year)
+    InvoiceSequence.objects.filter(pk=sequence.pk).update(next_number=F('next_number') + count)
+    return InvoiceSequence.objects.values_list('next_number', flat=True).get(pk=sequence.pk) - count
+
+
+def _issue(order_ids, now):
+    year = financial_year(timezone.localdate(now))
+    invoiced = set(Invoice.objects.filter(order_id__in=order_ids).values_list('order_id', 'series'))
+    lines = (
+        OrderItem.objects.filter(order_id__in=order_ids, order__is_paid='Completed', invoice__isnull=True)
+        .values_list('id', 'order_id', 'product__vendor_id', 'quantity', 'unit_price')
+        .order_by('order_id', 'id')
+    )
+    # One group per (order, vendor) of the paid orders, with the vendor's share and its lines
+    groups = {}
+    for line_id, order_id, vendor_id, quantity, unit_price in lines:
+        group = groups.setdefault((order_id, vendor_id), {
+            'order_id': order_id, 'vendor_id': vendor_id, 'amount': Decimal('0.00'), 'line_ids': [],
+        })
+        group['amount'] += quantity * unit_price
+        group['line_ids'].append(line_id)
+    by_series = defaultdict(list)
+    for group in groups.values():
+        series = series_for(group['vendor_id'])
+        if (group['order_id'], series) not in invoiced:
+            by_series[series].append(group)
+
+    invoices, invoiced_groups = [], []
+    with transaction.atomic():
+        # Sequences are always taken in the same order, concurrent batches cannot deadlock
+        for series in sorted(by_series):
+            rows = by_series[series]
+            first = _allocate(series, year, len(rows))
+            invoices += [
+                Invoice(
+                    order_id=row['order_id'],
+                    vendor_id=row['vendor_id'],
+                    series=series,
+                    financial_year=year,
+                    number=first + offset,
+                    amount=row['amount'].quantize(Decimal('0.01')),
+                    issued_at=now,
+                )
+                for offset, row in enumerate(rows)
+            ]
+            invoiced_groups += rows
+        Invoice.objects.bulk_create(invoices)
+        # The lines are tied to their invoice now: a product deleted or moved to another
+        # vendor later changes neither which invoice a line is on nor the rendered PDF
+        OrderItem.objects.bulk_update(
+            [
+                OrderItem(pk=line_id, invoice_id=invoice.pk)
+                for invoice, group in zip(invoices, invoiced_groups) for line_id in group['line_ids']
+            ],
+            ['invoice'], batch_size=500,
+        )
+    return invoices
+
+
+def issue(order_ids):
+    """
+    Invoice the paid orders among `order_ids`: one invoice per vendor with lines in the order.
+
+    A batch takes one block of numbers per series instead of a lock per order.
+    Orders invoiced before are skipped. Returns the new invoices.
+    """
+    order_ids = list(order_ids)
+    for attempt in range(ISSUE_ATTEMPTS):
+        try:
+            return _issue(order_ids, timezone.now())
+        except IntegrityError:
+            if attempt == ISSUE_ATTEMPTS - 1:
+                raise
+            logger.info("Invoices of orders %s were issued concurrently, retrying", order_ids[:10])
+
+
+def render_pdf(invoice):
+    """PDF bytes of an invoice. Deterministic, so identical invoices hash alike."""
+    order = invoice.order
+    lines = invoice.lines.select_related('product').order_by('id')
+    seller = invoice.vendor.business_name if invoice.vendor else "KickEra"
+    gst_no = invoice.vendor.gst_no if invoice.vendor and invoice.vendor.gst_no else None
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, invariant=1, title=f"Invoice {invoice.invoice_number}")
+    styles = getSampleStyleSheet()
+    elements = [
+        Paragraph("Tax Invoice", styles['Heading1']),
+        Paragraph(f"Invoice No: {invoice.invoice_number}", styles['Normal']),
+        Paragraph(f"Date: {timezone.localtime(invoice.issued_at):%d %b %Y}", styles['Normal']),
+        Paragraph(f"Order: #{order.pk}", styles['Normal']),
+        Spacer(1, 12),
+        Paragraph(f"Sold by: {seller}" + (f" (GSTIN {gst_no})" if gst_no else ""), styles['Normal']),
+    ]
+    if order.address_id:
+        address = order.address
+        elements.append(Paragraph(
+            f"Ship to: {address.name or ''} {address.address}, {address.city}, {address.state} - {address.pincode}",
+            styles['Normal'],
+        ))
+    elements.append(Spacer(1, 12))
+
+    data = [['Product', 'Qty', 'Unit Price', 'Total']]
+    for line in lines:
+        data.append([
+            line.product.name if line.product else 'Deleted product',
+            line.quantity, f"Rs. {line.unit_price}", f"Rs. {line.line_total}",
+        ])
+    data.append(['', '', 'Total', f"Rs. {invoice.amount}"])
+    table = Table(data)
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+        ('GRID', (0, 0), (-1, -2), 1, colors.black),
+    ]))
+    elements.append(table)
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def stored_pdf(invoice):
+    """
+    Storage name of the invoice PDF, rendered and stored the first time only.
+
+    Files are named by the sha256 of their content, so a re-render (two first
+    downloads at once) lands on the same file instead of a new one.
+    """
+    if invoice.pdf:
+        return invoice.pdf.name
+    content = render_pdf(invoice)
+    digest = hashlib.sha256(content).hexdigest()
+    name = f"invoices/{digest[:2]}/{digest}.pdf"
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(content))
+    Invoice.objects.filter(pk=invoice.pk, pdf='').update(pdf=name)
+    invoice.pdf.name = name
+    return name
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from orders.invoices import issue
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = "Issue invoices for paid orders that have none (one per vendor in the order)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help="Orders per transaction, each takes one block of numbers per series")
+
+    def handle(self, *args, **options):
+        uninvoiced = (
+            Order.objects.filter(is_paid='Completed', invoices__isnull=True)
+            .order_by('id').values_list('id', flat=True)
+        )
+        total = 0
+        last_id = 0
+        while True:
+            ids = list(uninvoiced.filter(id__gt=last_id)[:options['batch_size']])
+            if not ids:
+                break
+            total += len(issue(ids))
+            last_id = ids[-1]
+        self.stdout.write(self.style.SUCCESS(f"Issued {total} invoices."))
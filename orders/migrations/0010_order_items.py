@@ -0,0 +1,40 @@
+# Generated by Django 5.1.15 on 2026-10-18 09:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_order_items(apps, schema_editor):
+    # Orders placed before line items existed become a single line of their product
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    orders = Order.objects.filter(product__isnull=False).values_list('id', 'product_id', 'amount', 'product__price')
+    OrderItem.objects.bulk_create(
+        [
+            OrderItem(order_id=order_id, product_id=product_id, quantity=1, unit_price=amount if amount is not None else price)
+            for order_id, product_id, amount, price in orders.iterator()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_alter_order_address'),
+        ('product', '0071_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='orders.order')),
+                ('product', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_items', to='product.product')),
+            ],
+        ),
+        migrations.RunPython(backfill_order_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.15 on 2026-10-18 09:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_order_items'),
+        ('product', '0071_stock_reservations'),
+        ('users', '0019_rename_address_address_address'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='checkout_fingerprint',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'checkout_fingerprint'], name='order_user_fingerprint_idx'),
+        ),
+    ]
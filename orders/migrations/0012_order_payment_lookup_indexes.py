@@ -0,0 +1,25 @@
+# Generated by Django 5.1.15 on 2026-10-18 09:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_order_checkout_fingerprint'),
+        ('product', '0071_stock_reservations'),
+        ('users', '0019_rename_address_address_address'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['razorpay_order_id'], name='order_razorpay_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['is_paid', 'created_at', 'id'], name='order_paid_created_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.15 on 2026-10-18 09:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0012_order_payment_lookup_indexes'),
+        ('vendor', '0024_vendorrequest_password_vendorrequest_updated_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('series', models.CharField(max_length=20)),
+                ('financial_year', models.CharField(max_length=7)),
+                ('next_number', models.PositiveIntegerField(default=1)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('series', 'financial_year'), name='invoice_sequence_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Invoice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('series', models.CharField(max_length=20)),
+                ('financial_year', models.CharField(max_length=7)),
+                ('number', models.PositiveIntegerField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('issued_at', models.DateTimeField()),
+                ('pdf', models.FileField(blank=True, max_length=200, upload_to='invoices/')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='invoices', to='orders.order')),
+                ('vendor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='invoices', to='vendor.vendorprofile')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('series', 'financial_year', 'number'), name='invoice_number_unique'), models.UniqueConstraint(fields=('order', 'series'), name='invoice_order_series_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.15 on 2026-10-18 09:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_invoices'),
+        ('product', '0071_stock_reservations'),
+        ('users', '0019_rename_address_address_address'),
+        ('vendor', '0024_vendorrequest_password_vendorrequest_updated_at_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='multi_vendor',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='vendor',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='vendor.vendorprofile'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['vendor', 'created_at'], name='order_vendor_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['vendor', 'is_paid', 'created_at'], name='order_vendor_paid_created_idx'),
+        ),
+    ]
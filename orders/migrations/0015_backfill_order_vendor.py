@@ -0,0 +1,45 @@
+from collections import defaultdict
+
+from django.db import migrations, transaction
+
+# Orders per chunk, each chunk commits on its own so a large table is not locked for the whole run
+CHUNK_SIZE = 1000
+
+
+def backfill_order_vendor(apps, schema_editor):
+    # Same rule as Order.vendor_fields: one vendor among the lines sets `vendor`, several set `multi_vendor`
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    last_id = 0
+    while True:
+        ids = list(Order.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:CHUNK_SIZE])
+        if not ids:
+            break
+        vendors = defaultdict(set)
+        lines = OrderItem.objects.filter(order_id__in=ids, product__vendor__isnull=False)
+        for order_id, vendor_id in lines.values_list('order_id', 'product__vendor_id').distinct():
+            vendors[order_id].add(vendor_id)
+        by_vendor = defaultdict(list)
+        mixed = []
+        for order_id, vendor_ids in vendors.items():
+            if len(vendor_ids) == 1:
+                by_vendor[next(iter(vendor_ids))].append(order_id)
+            else:
+                mixed.append(order_id)
+        with transaction.atomic():
+            for vendor_id, order_ids in by_vendor.items():
+                Order.objects.filter(id__in=order_ids).update(vendor_id=vendor_id)
+            Order.objects.filter(id__in=mixed).update(multi_vendor=True)
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('orders', '0014_order_vendor'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_order_vendor, migrations.RunPython.noop),
+    ]
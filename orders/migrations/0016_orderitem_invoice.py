@@ -0,0 +1,33 @@
+# Generated by Django 5.1.15 on 2026-10-18 09:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def link_invoiced_lines(apps, schema_editor):
+    # Invoices issued before lines were linked: the product's current vendor is all there is to go by
+    Invoice = apps.get_model('orders', 'Invoice')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    for invoice in Invoice.objects.only('id', 'order_id', 'vendor_id').iterator():
+        lines = OrderItem.objects.filter(order_id=invoice.order_id, invoice__isnull=True)
+        if invoice.vendor_id:
+            lines = lines.filter(product__vendor_id=invoice.vendor_id)
+        else:
+            lines = lines.filter(models.Q(product__isnull=True) | models.Q(product__vendor__isnull=True))
+        lines.update(invoice_id=invoice.id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0015_backfill_order_vendor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='invoice',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lines', to='orders.invoice'),
+        ),
+        migrations.RunPython(link_invoiced_lines, migrations.RunPython.noop),
+    ]
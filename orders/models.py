@@ -1,7 +1,67 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 from product.models import Product
 from users.models import User, Address
 
+# quantity * unit_price of an OrderItem row
+LINE_TOTAL = ExpressionWrapper(F('quantity') * F('unit_price'), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+class OrderQuerySet(models.QuerySet):
+    def for_vendor(self, vendor):
+        """
+        Orders with at least one line of the vendor's products.
+
+        Single-vendor orders match on the indexed `vendor` column, only the (rare)
+        multi-vendor ones are looked up through their lines.
+        """
+        mixed = OrderItem.objects.filter(order__multi_vendor=True, product__vendor=vendor).values('order_id')
+        # vendor IS NULL keeps both branches on the (vendor, ...) indexes
+        return self.filter(Q(vendor=vendor) | Q(vendor__isnull=True, multi_vendor=True, id__in=mixed))
+
+    def vendor_lines(self, vendor):
+        """The vendor's OrderItem rows of these orders"""
+        return OrderItem.objects.filter(order__in=self, product__vendor=vendor)
+
+    def vendor_line_names(self, vendor):
+        """{order id: comma separated names of the vendor's products in that order}"""
+        names = {}
+        for order_id, name in self.vendor_lines(vendor).order_by('id').values_list('order_id', 'product__name'):
+            names.setdefault(order_id, []).append(name)
+        return {order_id: ', '.join(product_names) for order_id, product_names in names.items()}
+
+    def vendor_sales(self, vendor):
+        """Sum of the vendor's line totals over these orders"""
+        return self.vendor_lines(vendor).totals()['sales']
+
+    def with_vendor_amount(self, vendor):
+        """Annotate vendor_amount, the part of each order's amount from the vendor's lines"""
+        lines = (
+            OrderItem.objects.filter(order=OuterRef('pk'), product__vendor=vendor)
+            .values('order')
+            .annotate(total=Sum(LINE_TOTAL))
+            .values('total')
+        )
+        return self.annotate(
+            vendor_amount=Coalesce(Subquery(lines), Decimal('0.00'), output_field=LINE_TOTAL.output_field)
+        )
+
+
+class OrderItemQuerySet(models.QuerySet):
+    def totals(self):
+        """{'orders': distinct orders, 'units': quantity sold, 'sales': sum of line totals}"""
+        totals = self.aggregate(
+            orders=Count('order', distinct=True),
+            units=Coalesce(Sum('quantity'), 0),
+            sales=Coalesce(Sum(LINE_TOTAL), Decimal('0.00'), output_field=LINE_TOTAL.output_field),
+        )
+        # SQLite sums the products in floating point, round back to paise
+        totals['sales'] = Decimal(totals['sales']).quantize(Decimal('0.01'))
+        return totals
+
 
 # Create your models here.
 class Order(models.Model):
@@ -29,5 +89,100 @@ class Order(models.Model):
     shipped = models.CharField(max_length=50, null=True, choices=status)
     created_at = models.DateTimeField(auto_now_add=True,null=True)
     updated_at = models.DateTimeField(auto_now=True,null=True)
+    # Hash of the checkout (lines, prices, address, amount) that created the gateway order
+    checkout_fingerprint = models.CharField(max_length=64, null=True, blank=True)
+    # Denormalized from the lines' products when the order is created (see vendor_fields)
+    # No single-column index: (vendor, created_at) below covers vendor lookups
+    vendor = models.ForeignKey(
+        'vendor.VendorProfile', null=True, blank=True, related_name='orders', on_delete=models.SET_NULL, db_index=False,
+    )
+    multi_vendor = models.BooleanField(default=False)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'checkout_fingerprint'], name='order_user_fingerprint_idx'),
+            models.Index(fields=['razorpay_order_id'], name='order_razorpay_order_idx'),
+            # Pending orders by age, for payment reconciliation
+            models.Index(fields=['is_paid', 'created_at', 'id'], name='order_paid_created_idx'),
+            # Vendor dashboards and reports
+            models.Index(fields=['vendor', 'created_at'], name='order_vendor_created_idx'),
+            models.Index(fields=['vendor', 'is_paid', 'created_at'], name='order_vendor_paid_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username if self.user else 'Unknown User'}'s Order"
+
+    @staticmethod
+    def vendor_fields(vendor_ids):
+        """
+        `vendor` / `multi_vendor` values for an order whose lines are from `vendor_ids`.
+
+        Store products (no vendor) do not count: an order of one vendor's shoes and
+        store socks is that vendor's order.
+        """
+        vendors = {vendor_id for vendor_id in vendor_ids if vendor_id is not None}
+        if len(vendors) == 1:
+            return {'vendor_id': vendors.pop(), 'multi_vendor': False}
+        return {'vendor_id': None, 'multi_vendor': len(vendors) > 1}
+
+
+class OrderItem(models.Model):
+    """One product line of an order, priced when the order was placed"""
+    order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, null=True, related_name='order_items', on_delete=models.SET_NULL)
+    quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Set when the line is invoiced, so the invoice keeps its lines whatever happens to the product
+    invoice = models.ForeignKey('Invoice', null=True, blank=True, related_name='lines', on_delete=models.SET_NULL)
+
+    objects = OrderItemQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product.name if self.product else 'Deleted product'} in order {self.order_id}"
+
+    @property
+    def line_total(self):
+        return self.quantity * self.unit_price
+
+
+class InvoiceSequence(models.Model):
+    """Next invoice number of a series (a vendor, or the store) in a financial year"""
+    series = models.CharField(max_length=20)
+    financial_year = models.CharField(max_length=7)
+    next_number = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['series', 'financial_year'], name='invoice_sequence_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.series} {self.financial_year}: next {self.next_number}"
+
+
+class Invoice(models.Model):
+    """Tax invoice for one vendor's lines of a paid order, numbered by orders/invoices.py"""
+    order = models.ForeignKey(Order, related_name='invoices', on_delete=models.PROTECT)
+    vendor = models.ForeignKey('vendor.VendorProfile', null=True, blank=True, related_name='invoices', on_delete=models.SET_NULL)
+    series = models.CharField(max_length=20)
+    financial_year = models.CharField(max_length=7)
+    number = models.PositiveIntegerField()
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    issued_at = models.DateTimeField()
+    # Rendered once, stored under its sha256 (see orders.invoices.stored_pdf)
+    pdf = models.FileField(upload_to='invoices/', max_length=200, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['series', 'financial_year', 'number'], name='invoice_number_unique'),
+            models.UniqueConstraint(fields=['order', 'series'], name='invoice_order_series_unique'),
+        ]
+
+    def __str__(self):
+        return self.invoice_number
+
+    @property
+    def invoice_number(self):
+        return f"{self.series}/{self.financial_year}/{self.number:05d}"
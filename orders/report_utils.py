@@ -1,46 +1,32 @@
 import csv
 import io
 from datetime import datetime
-from django.db.models import Sum, Count
+from django.db.models import Sum, Count, Q
 from django.db.models.functions import TruncMonth, TruncYear
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter, landscape
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
 
-from orders import models
-
 
 def get_vendor_orders(vendor, report_type):
-    """Get orders for vendor's products with specified report type"""
-    from .models import Order
-    
+    """Per period and product totals of the vendor's order lines"""
+    from .models import LINE_TOTAL, OrderItem
+
     # Base queryset for vendor's products
-    base_query = Order.objects.filter(product__vendor=vendor)
-    
-    if report_type == 'yearly':
-        return base_query.annotate(
-            period=TruncYear('created_at')
-        ).values(
-            'period',
-            'product__name'
-        ).annotate(
-            total_orders=Count('id'),
-            total_amount=Sum('amount'),
-            completed=Count('id', filter=models.Q(is_paid='Completed')),
-            pending=Count('id', filter=models.Q(is_paid='Pending'))
-        ).order_by('-period', 'product__name')
-    else:  # monthly
-        return base_query.annotate(
-            period=TruncMonth('created_at')
-        ).values(
-            'period',
-            'product__name'
-        ).annotate(
-            total_orders=Count('id'),
-            total_amount=Sum('amount'),
-            completed=Count('id', filter=models.Q(is_paid='Completed')),
-            pending=Count('id', filter=models.Q(is_paid='Pending'))
-        ).order_by('-period', 'product__name')
+    base_query = OrderItem.objects.filter(product__vendor=vendor)
+    trunc = TruncYear if report_type == 'yearly' else TruncMonth
+
+    return base_query.annotate(
+        period=trunc('order__created_at')
+    ).values(
+        'period',
+        'product__name'
+    ).annotate(
+        total_orders=Count('order', distinct=True),
+        total_amount=Sum(LINE_TOTAL),
+        completed=Count('order', filter=Q(order__is_paid='Completed'), distinct=True),
+        pending=Count('order', filter=Q(order__is_paid='Pending'), distinct=True)
+    ).order_by('-period', 'product__name')
 
 def generate_csv_report(orders, report_type):
     """Generate CSV report for vendor orders"""
@@ -1,3 +1,162 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import date
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.db import IntegrityError, connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from orders import invoices
+from orders.models import Invoice, InvoiceSequence, Order, OrderItem
+from product.models import Product
+from users.models import User
+from vendor.models import VendorProfile
+
+
+class InvoiceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='pw')
+        cls.vendor = VendorProfile.objects.create(business_name='Soles', email='soles@example.com')
+        cls.shoe = Product.objects.create(name='Runner', price=2500, stock=5, vendor=cls.vendor)
+        cls.sock = Product.objects.create(name='Socks', price=200, stock=5)
+
+    def order(self, *products, is_paid='Completed'):
+        order = Order.objects.create(user=self.user, product=products[0], is_paid=is_paid)
+        OrderItem.objects.bulk_create([OrderItem(order=order, product=p, unit_price=p.price) for p in products])
+        return order
+
+    def test_financial_year(self):
+        self.assertEqual(invoices.financial_year(date(2026, 3, 31)), '2025-26')
+        self.assertEqual(invoices.financial_year(date(2026, 4, 1)), '2026-27')
+
+    def test_numbers_are_sequential_per_series(self):
+        mixed, shoe, pending = self.order(self.shoe, self.sock), self.order(self.shoe), self.order(self.shoe, is_paid='Pending')
+        with CaptureQueriesContext(connection) as queries:
+            issued = invoices.issue([mixed.pk, shoe.pk, pending.pk])
+        # One sequence UPDATE per series for the whole batch, not one per order
+        self.assertEqual(
+            sum(q['sql'].startswith('UPDATE "orders_invoicesequence"') for q in queries.captured_queries), 2
+        )
+        self.assertEqual(
+            sorted((i.series, i.number, i.order_id, str(i.amount)) for i in issued),
+            [('KE', 1, mixed.pk, '200.00'), (f'V{self.vendor.pk}', 1, mixed.pk, '2500.00'), (f'V{self.vendor.pk}', 2, shoe.pk, '2500.00')],
+        )
+        # Issuing again is a no-op, the next batch continues the series
+        self.assertEqual(invoices.issue([mixed.pk, shoe.pk]), [])
+        later = invoices.issue([self.order(self.shoe).pk])
+        self.assertEqual([i.number for i in later], [3])
+
+    def test_lines_stay_on_their_invoice(self):
+        order = self.order(self.shoe, self.sock)
+        vendor_invoice, store_invoice = sorted(invoices.issue([order.pk]), key=lambda i: i.series, reverse=True)
+        self.assertEqual(vendor_invoice.vendor, self.vendor)
+        shoe_line = order.items.get(product=self.shoe)
+        # The product moves to the store and the sock product is deleted after the invoices were issued
+        Product.objects.filter(pk=self.shoe.pk).update(vendor=None)
+        self.sock.delete()
+
+        self.assertEqual(list(vendor_invoice.lines.all()), [shoe_line])
+        self.assertEqual(store_invoice.lines.get().product, None)
+        self.assertEqual(sum(line.line_total for line in vendor_invoice.lines.all()), vendor_invoice.amount)
+        self.assertTrue(invoices.render_pdf(store_invoice).startswith(b'%PDF'))
+
+    def test_failed_batch_gives_its_numbers_back(self):
+        first = self.order(self.shoe)
+        with mock.patch.object(Invoice.objects, 'bulk_create', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                invoices.issue([first.pk])
+        self.assertFalse(InvoiceSequence.objects.filter(next_number__gt=1).exists())
+        self.assertEqual([i.number for i in invoices.issue([first.pk])], [1])
+
+    def test_pdf_is_rendered_once_and_stored_by_content(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        order = self.order(self.shoe)
+        invoice, = invoices.issue([order.pk])
+        self.client.force_login(self.user)
+        with override_settings(MEDIA_ROOT=media):
+            first = self.client.get(f'/orders/invoice/{invoice.pk}/')
+            self.assertEqual(first.status_code, 200)
+            self.assertTrue(b''.join(first.streaming_content).startswith(b'%PDF'))
+            name = Invoice.objects.get(pk=invoice.pk).pdf.name
+            self.assertRegex(name, r'^invoices/[0-9a-f]{2}/[0-9a-f]{64}\.pdf$')
+            with mock.patch('orders.invoices.render_pdf') as render:
+                self.assertEqual(self.client.get(f'/orders/invoice/{invoice.pk}/').status_code, 200)
+            render.assert_not_called()
+
+    def test_other_users_cannot_download(self):
+        invoice, = invoices.issue([self.order(self.shoe).pk])
+        User.objects.create_user(username='other', email='other@example.com', password='pw')
+        self.client.login(username='other', password='pw')
+        self.assertEqual(self.client.get(f'/orders/invoice/{invoice.pk}/').status_code, 403)
+
+
+class VendorOrderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='pw')
+        cls.soles = VendorProfile.objects.create(business_name='Soles', email='soles@example.com')
+        cls.laces = VendorProfile.objects.create(business_name='Laces', email='laces@example.com')
+        cls.shoe = Product.objects.create(name='Runner', price=2500, stock=5, vendor=cls.soles)
+        cls.lace = Product.objects.create(name='Laces', price=100, stock=5, vendor=cls.laces)
+        cls.sock = Product.objects.create(name='Socks', price=200, stock=5)
+
+    def order(self, *products):
+        order = Order.objects.create(
+            user=self.user, product=products[0], **Order.vendor_fields(p.vendor_id for p in products)
+        )
+        OrderItem.objects.bulk_create([OrderItem(order=order, product=p, unit_price=p.price) for p in products])
+        return order
+
+    def test_vendor_fields(self):
+        self.assertEqual(Order.vendor_fields([self.soles.pk, None]), {'vendor_id': self.soles.pk, 'multi_vendor': False})
+        self.assertEqual(Order.vendor_fields([self.soles.pk, self.laces.pk]), {'vendor_id': None, 'multi_vendor': True})
+        self.assertEqual(Order.vendor_fields([None]), {'vendor_id': None, 'multi_vendor': False})
+
+    def test_for_vendor(self):
+        shoe, mixed, socks, with_socks = (
+            self.order(self.shoe), self.order(self.shoe, self.lace), self.order(self.sock), self.order(self.shoe, self.sock)
+        )
+        self.assertEqual(set(Order.objects.for_vendor(self.soles)), {shoe, mixed, with_socks})
+        self.assertEqual(set(Order.objects.for_vendor(self.laces)), {mixed})
+        self.assertNotIn(socks, Order.objects.for_vendor(self.soles))
+
+    def test_vendor_reports_show_only_the_vendors_lines(self):
+        mixed = self.order(self.shoe, self.lace)
+        seller = User.objects.create_user(username='laces', email='laces-owner@example.com', password='pw', is_staff=True)
+        VendorProfile.objects.filter(pk=self.laces.pk).update(user=seller)
+        request = RequestFactory().get('/admin/orders/order/')
+        request.user = User.objects.get(pk=seller.pk)
+        model_admin = admin.site._registry[Order]
+
+        rows = list(model_admin.report_rows(model_admin.get_queryset(request), request))
+        self.assertEqual(rows, [(mixed, 'Laces', 100)])
+
+        self.client.force_login(seller)
+        today = date.today().isoformat()
+        response = self.client.post(reverse('vendor_sales_report'), {'format': 'csv', 'start_date': today, 'end_date': today})
+        lines = response.content.decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[1].split(',')[3], 'Laces')
+        self.assertEqual(Decimal(lines[1].split(',')[4]), 100)
+
+    def test_vendor_queries_use_the_vendor_indexes(self):
+        # A realistic spread: many vendors, each with a small share of the orders
+        vendors = [self.soles] + [
+            VendorProfile.objects.create(business_name=f'Shop {i}', email=f'shop{i}@example.com') for i in range(19)
+        ]
+        Order.objects.bulk_create(
+            [Order(vendor=vendors[i % 20], is_paid=['Completed', 'Pending'][i % 3 % 2]) for i in range(600)]
+            + [Order(multi_vendor=True) for _ in range(3)]
+            + [Order() for _ in range(100)]
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        plan = Order.objects.for_vendor(self.soles).filter(is_paid='Completed').order_by('-created_at').explain()
+        self.assertEqual(plan.count('USING INDEX order_vendor_paid_created_idx'), 2, plan)
+        self.assertNotRegex(plan, r'SCAN orders_order\b')
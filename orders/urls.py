@@ -1,10 +1,11 @@
 from django.urls import path
-from orders.views import OrderListView, UserOrderListView, generate_report
+from orders.views import OrderListView, UserOrderListView, generate_report, invoice_pdf
 
 urlpatterns = [
     path('vendor/orders/', OrderListView.as_view(), name='my_orders'),
     path('user/orders/', UserOrderListView.as_view(), name='user_orders'),
     path('reports/', generate_report, name='generate_report'),
+    path('invoice/<int:pk>/', invoice_pdf, name='invoice_pdf'),
 ]
 
 
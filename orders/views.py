@@ -1,9 +1,11 @@
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView
 from django.contrib.admin.views.decorators import staff_member_required
-from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
-from django.shortcuts import render
-from orders.models import Order
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.shortcuts import get_object_or_404, render
+from orders import invoices
+from orders.models import Invoice, Order
 from .report_utils import get_vendor_orders, generate_csv_report, generate_pdf_report
 from django.contrib import messages
 import datetime
@@ -15,11 +17,11 @@ class OrderListView(LoginRequiredMixin, ListView):
     context_object_name = 'orders'
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).prefetch_related('product', 'product__images')
+        return Order.objects.filter(user=self.request.user).select_related('product__primary_image')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['orders'] = Order.objects.filter(user=self.request.user)
+        context['orders'] = Order.objects.filter(user=self.request.user).select_related('product__primary_image')
         return context
 
 #user view for order list
@@ -29,11 +31,30 @@ class UserOrderListView(LoginRequiredMixin, ListView):
     context_object_name = 'orders'
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).select_related('address', 'user').prefetch_related(
-            'product', 
-            'product__images',
-            'user__addresses'
-        )
+        return Order.objects.filter(user=self.request.user).select_related(
+            'address', 'user', 'product__primary_image'
+        ).prefetch_related('user__addresses', 'invoices')
+
+
+@login_required
+def invoice_pdf(request, pk):
+    """Invoice PDF for the buyer, the invoicing vendor or staff, rendered on first download only"""
+    invoice = get_object_or_404(Invoice.objects.select_related('order__address', 'vendor'), pk=pk)
+    allowed = (
+        request.user.is_staff
+        or invoice.order.user_id == request.user.id
+        or (invoice.vendor is not None and invoice.vendor.user_id == request.user.id)
+    )
+    if not allowed:
+        return HttpResponseForbidden("You cannot view this invoice")
+    name = invoices.stored_pdf(invoice)
+    response = FileResponse(
+        default_storage.open(name, 'rb'), content_type='application/pdf',
+        filename=f"invoice-{invoice.invoice_number.replace('/', '-')}.pdf",
+    )
+    # The stored file never changes
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
 
 @staff_member_required
 def generate_report(request):
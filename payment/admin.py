@@ -1,5 +1,13 @@
 from django.contrib import admin
-from .models import Payment
+from .models import Payment, PaymentEvent
 # Register your models here.
 
-admin.site.register(Payment)
\ No newline at end of file
+admin.site.register(Payment)
+
+
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ['razorpay_payment_id', 'razorpay_order_id', 'kind', 'source', 'status', 'attempts', 'received_at']
+    list_filter = ['status', 'kind', 'source']
+    search_fields = ['razorpay_payment_id', 'razorpay_order_id']
+    readonly_fields = ['received_at', 'processed_at', 'claim']
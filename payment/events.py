@@ -0,0 +1,211 @@
+# payment/events.py
+import logging
+import uuid
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from payment.models import Payment, PaymentEvent
+
+logger = logging.getLogger(__name__)
+
+# Attempts before an event is parked as ERROR for a human to look at
+MAX_ATTEMPTS = 10
+
+# A PROCESSING claim older than this belongs to a worker that died
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+# Wait before retrying a failed event, doubled per attempt up to RETRY_MAX_DELAY:
+# 10 attempts span about 40 minutes, enough to outlast a locked database or a deploy
+RETRY_BASE_DELAY = timedelta(seconds=5)
+RETRY_MAX_DELAY = timedelta(hours=1)
+
+
+def _event(payment_id, order_id, kind, signature, source, wishlist_item_ids):
+    return PaymentEvent(
+        razorpay_payment_id=payment_id,
+        razorpay_order_id=order_id,
+        kind=kind,
+        signature=signature,
+        source=source,
+        wishlist_item_ids=[int(pk) for pk in wishlist_item_ids or () if str(pk).isdigit()],
+    )
+
+
+def enqueue(payment_id, order_id, kind=PaymentEvent.PAID, signature='', source='callback', wishlist_item_ids=None):
+    """
+    Store a verified payment notification, a single INSERT.
+
+    A payment already queued (duplicate callback, webhook retry) is left untouched,
+    except for the wishlist items a callback knows about and a webhook does not.
+    """
+    enqueue_many([_event(payment_id, order_id, kind, signature, source, wishlist_item_ids)])
+
+
+async def aenqueue(payment_id, order_id, kind=PaymentEvent.PAID, signature='', source='callback', wishlist_item_ids=None):
+    """enqueue for async views"""
+    event = _event(payment_id, order_id, kind, signature, source, wishlist_item_ids)
+    await PaymentEvent.objects.abulk_create([event], ignore_conflicts=True)
+    if event.wishlist_item_ids:
+        await _without_wishlist(event).aupdate(wishlist_item_ids=event.wishlist_item_ids)
+
+
+def _without_wishlist(event):
+    """The queued row of event's payment if it was stored with no wishlist items (webhook first)"""
+    return PaymentEvent.objects.filter(
+        razorpay_payment_id=event.razorpay_payment_id, status=PaymentEvent.PENDING, wishlist_item_ids=[],
+    )
+
+
+def enqueue_many(events):
+    """
+    Queue unsaved PaymentEvent objects in one INSERT, skipping payments queued before.
+
+    Returns the number of events newly queued.
+    """
+    if not events:
+        return 0
+    # ignore_conflicts gives no per-row result, count the payments known beforehand
+    known = PaymentEvent.objects.filter(razorpay_payment_id__in={e.razorpay_payment_id for e in events}).count()
+    PaymentEvent.objects.bulk_create(events, ignore_conflicts=True)
+    for event in events:
+        if event.wishlist_item_ids:
+            # Conditional UPDATE: a row already claimed by the worker keeps what it had
+            _without_wishlist(event).update(wishlist_item_ids=event.wishlist_item_ids)
+    return len({e.razorpay_payment_id for e in events}) - known
+
+
+def claim_batch(batch_size=100):
+    """Mark up to batch_size queued events that are due as ours and return them in arrival order"""
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    queued = PaymentEvent.objects.filter(
+        Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now), status=PaymentEvent.PENDING,
+    ).order_by('id')
+    stale = PaymentEvent.objects.filter(status=PaymentEvent.PROCESSING, processed_at__lt=now - CLAIM_TIMEOUT)
+    ids = list(queued.values_list('id', flat=True)[:batch_size])
+    if len(ids) < batch_size:
+        ids += list(stale.order_by('id').values_list('id', flat=True)[:batch_size - len(ids)])
+    # The conditional UPDATE is the claim: a concurrent worker that picked the same ids gets none of them
+    PaymentEvent.objects.filter(
+        pk__in=ids, status__in=(PaymentEvent.PENDING, PaymentEvent.PROCESSING)
+    ).exclude(
+        status=PaymentEvent.PROCESSING, processed_at__gte=now - CLAIM_TIMEOUT
+    ).update(status=PaymentEvent.PROCESSING, claim=token, processed_at=now)
+    return list(PaymentEvent.objects.filter(claim=token, status=PaymentEvent.PROCESSING).order_by('id'))
+
+
+def _clear_purchased(order, event):
+    from product.models import Cart, WishList
+
+    if order.user_id is None:
+        return
+    product_ids = list(order.items.values_list('product_id', flat=True))
+    # Only what was bought: lines added to the cart after checkout stay
+    Cart.objects.filter(user_id=order.user_id, product_id__in=product_ids).delete()
+    if event.wishlist_item_ids:
+        WishList.objects.filter(user_id=order.user_id, id__in=event.wishlist_item_ids).delete()
+
+
+def apply_event(event, order):
+    """Apply one claimed event to its order. Safe to run again for the same event."""
+    from product import reservations
+
+    with transaction.atomic():
+        if Payment.objects.filter(payment_id=event.razorpay_payment_id).exists():
+            # Applied before (a crash after the commit and before the status update)
+            PaymentEvent.objects.filter(pk=event.pk).update(status=PaymentEvent.APPLIED, processed_at=timezone.now())
+            return
+
+        if event.kind == PaymentEvent.PAID:
+            first_payment = order.is_paid != 'Completed'
+            if first_payment:
+                order.razorpay_payment_id = event.razorpay_payment_id
+                order.razorpay_signature = event.signature or order.razorpay_signature
+                order.is_paid = 'Completed'
+                order.save(update_fields=['razorpay_payment_id', 'razorpay_signature', 'is_paid', 'updated_at'])
+                short = reservations.commit(order.razorpay_order_id)
+                if short:
+                    logger.error("Order %s was paid but products %s are oversold", order.id, short)
+                _clear_purchased(order, event)
+            else:
+                logger.warning(
+                    "Order %s received a second payment %s, it needs a refund", order.id, event.razorpay_payment_id
+                )
+        # A failure reported after the payment succeeded never downgrades the order
+
+        Payment.objects.create(
+            order_id=order,
+            payment_id=event.razorpay_payment_id,
+            amount=float(order.amount) if order.amount is not None else None,
+            status='captured' if event.kind == PaymentEvent.PAID else 'failed',
+            currency='INR',
+            customer_details={
+                'user_id': order.user_id,
+                'email': order.user.email if order.user else None,
+                'source': event.source,
+            },
+        )
+        PaymentEvent.objects.filter(pk=event.pk).update(status=PaymentEvent.APPLIED, processed_at=timezone.now())
+
+
+def retry_delay(attempts):
+    """Backoff before the next try of an event that failed `attempts` times"""
+    return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempts - 1))
+
+
+def _retry_later(event, error):
+    attempts = event.attempts + 1
+    status = PaymentEvent.ERROR if attempts >= MAX_ATTEMPTS else PaymentEvent.PENDING
+    PaymentEvent.objects.filter(pk=event.pk).update(
+        status=status, attempts=attempts, last_error=str(error)[:2000], claim=None,
+        next_attempt_at=timezone.now() + retry_delay(attempts),
+    )
+    if status == PaymentEvent.ERROR:
+        logger.error("Payment event %s gave up after %s attempts: %s", event.razorpay_payment_id, attempts, error)
+
+
+def process_pending(batch_size=100):
+    """
+    Claim and apply one batch of due events, returns how many were claimed.
+
+    Failed events count too (they are deferred), so callers draining the queue
+    stop only when nothing is due, not at the first batch that fully failed.
+    """
+    from orders import invoices
+    from orders.models import Order
+
+    events = claim_batch(batch_size)
+    if not events:
+        return 0
+    orders = {
+        order.razorpay_order_id: order
+        for order in Order.objects.select_related('user').filter(
+            razorpay_order_id__in={event.razorpay_order_id for event in events}
+        )
+    }
+    paid = set()
+    for event in events:
+        order = orders.get(event.razorpay_order_id)
+        if order is None:
+            # Notification ahead of the order row (or for an order of another system): try again later
+            _retry_later(event, f"No order with razorpay_order_id {event.razorpay_order_id}")
+            continue
+        try:
+            apply_event(event, order)
+            if event.kind == PaymentEvent.PAID:
+                paid.add(order.pk)
+        except Exception as e:
+            logger.exception("Payment event %s failed", event.razorpay_payment_id)
+            _retry_later(event, e)
+            # The rolled back changes are still on the instance
+            order.refresh_from_db()
+    if paid:
+        # One block of invoice numbers for the whole batch; `issue_invoices` catches up after a failure
+        try:
+            invoices.issue(sorted(paid))
+        except Exception:
+            logger.exception("Invoicing orders %s failed", sorted(paid))
+    return len(events)
@@ -0,0 +1,498 @@
+# payment/gateway.py
+import asyncio
+import hashlib
+import hmac
+import logging
+import random
+import threading
+import time
+import uuid
+import weakref
+from collections import deque
+
+import razorpay
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayError(Exception):
+    """The gateway call failed (after any retries)"""
+
+
+class GatewayUnavailable(GatewayError):
+    """The circuit breaker is open, the gateway is not being called"""
+
+
+class CircuitBreaker:
+    """
+    Fail fast while the gateway is degraded.
+
+    After `failure_threshold` consecutive failures the breaker opens and every call
+    is refused for `reset_timeout` seconds. Then a single trial call is let through
+    (half open): success closes the breaker, failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def before_call(self):
+        with self._lock:
+            state = self._state()
+            if state == self.OPEN or (state == self.HALF_OPEN and self._trial_running):
+                raise GatewayUnavailable("Payment gateway is unavailable, try again shortly")
+            if state == self.HALF_OPEN:
+                self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning("Payment gateway circuit opened after %s failures", self._failures)
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class GatewayMetrics:
+    """Per-operation call counts, failures and latencies of this process"""
+
+    # Latencies kept per operation for the percentiles
+    WINDOW = 500
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ops = {}
+
+    def record(self, operation, seconds, ok):
+        with self._lock:
+            op = self._ops.setdefault(operation, {'calls': 0, 'errors': 0, 'latencies': deque(maxlen=self.WINDOW)})
+            op['calls'] += 1
+            if not ok:
+                op['errors'] += 1
+            op['latencies'].append(seconds)
+
+    def snapshot(self):
+        """{operation: {'calls', 'errors', 'p50_ms', 'p95_ms', 'max_ms'}} over the recent window"""
+        with self._lock:
+            ops = {name: (op['calls'], op['errors'], sorted(op['latencies'])) for name, op in self._ops.items()}
+        result = {}
+        for name, (calls, errors, latencies) in ops.items():
+            def pct(p):
+                return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1) if latencies else None
+            result[name] = {
+                'calls': calls, 'errors': errors,
+                'p50_ms': pct(0.5), 'p95_ms': pct(0.95),
+                'max_ms': round(latencies[-1] * 1000, 1) if latencies else None,
+            }
+        return result
+
+
+class Gateway:
+    """
+    Payment gateway calls behind a circuit breaker, with retries and latency metrics.
+
+    Subclasses implement the `_create_order`, `_fetch_order`, `_fetch_order_payments`
+    and `_fetch_payment` transport methods and list their exception types:
+    `transient_errors` may succeed on retry, `unsent_errors` mean the request never
+    reached the gateway. Reads are retried on any transient error, creating an order
+    only when it was not sent (a read timeout could have created it already).
+    """
+
+    transient_errors = ()
+    unsent_errors = ()
+
+    def __init__(self, key_secret, breaker=None, metrics=None, max_retries=2, backoff=0.2, max_backoff=2.0):
+        self.key_secret = key_secret
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = metrics or GatewayMetrics()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def _backoff(self, attempt):
+        # Full jitter: a random wait up to the exponential backoff
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def _sleep(self, attempt):
+        time.sleep(self._backoff(attempt))
+
+    def _failed(self, operation, started, error, attempt, idempotent):
+        """Record a transport failure, returns whether the call should be retried"""
+        self.metrics.record(operation, time.monotonic() - started, ok=False)
+        self.breaker.record_failure()
+        retryable = self.transient_errors if idempotent else self.unsent_errors
+        if isinstance(error, retryable) and attempt < self.max_retries:
+            logger.info("Gateway %s failed (%s), retrying", operation, error)
+            return True
+        return False
+
+    def _rejected(self, operation, started):
+        # A rejected request (bad amount, unknown id) says nothing about gateway health
+        self.metrics.record(operation, time.monotonic() - started, ok=False)
+        self.breaker.record_success()
+
+    def _succeeded(self, operation, started):
+        self.metrics.record(operation, time.monotonic() - started, ok=True)
+        self.breaker.record_success()
+
+    def _call(self, operation, fn, *args, idempotent=True):
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            started = time.monotonic()
+            try:
+                result = fn(*args)
+            except self.transient_errors as e:
+                if self._failed(operation, started, e, attempt, idempotent):
+                    self._sleep(attempt)
+                    attempt += 1
+                    continue
+                raise GatewayError(f"Payment gateway {operation} failed: {e}") from e
+            except Exception:
+                self._rejected(operation, started)
+                raise
+            self._succeeded(operation, started)
+            return result
+
+    async def _acall(self, operation, fn, *args, idempotent=True):
+        """_call for coroutine transports: waits (and backs off) without holding a thread"""
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            started = time.monotonic()
+            try:
+                result = await fn(*args)
+            except self.transient_errors as e:
+                if self._failed(operation, started, e, attempt, idempotent):
+                    await asyncio.sleep(self._backoff(attempt))
+                    attempt += 1
+                    continue
+                raise GatewayError(f"Payment gateway {operation} failed: {e}") from e
+            except Exception:
+                self._rejected(operation, started)
+                raise
+            self._succeeded(operation, started)
+            return result
+
+    async def _acreate_order(self, data):
+        # Transports without an async client block a thread from the executor, not the event loop
+        return await sync_to_async(self._create_order, thread_sensitive=False)(data)
+
+    @staticmethod
+    def _order_data(amount, currency, receipt, notes):
+        data = {'amount': amount, 'currency': currency}
+        if receipt:
+            data['receipt'] = receipt
+        if notes:
+            data['notes'] = notes
+        return data
+
+    def create_order(self, amount, currency='INR', receipt=None, notes=None):
+        """Create a gateway order for `amount` paise"""
+        data = self._order_data(amount, currency, receipt, notes)
+        return self._call('order.create', self._create_order, data, idempotent=False)
+
+    async def acreate_order(self, amount, currency='INR', receipt=None, notes=None):
+        """create_order for async views"""
+        data = self._order_data(amount, currency, receipt, notes)
+        return await self._acall('order.create', self._acreate_order, data, idempotent=False)
+
+    def fetch_order(self, order_id):
+        return self._call('order.fetch', self._fetch_order, order_id)
+
+    def fetch_order_payments(self, order_id):
+        """List of payment dicts made against a gateway order"""
+        return self._call('order.payments', self._fetch_order_payments, order_id)
+
+    def fetch_payment(self, payment_id):
+        return self._call('payment.fetch', self._fetch_payment, payment_id)
+
+    def close(self):
+        """Close pooled connections. The gateway stays usable and reconnects on its next call."""
+
+    def signature(self, order_id, payment_id):
+        return hmac.new(self.key_secret.encode(), f'{order_id}|{payment_id}'.encode(), hashlib.sha256).hexdigest()
+
+    def verify_payment_signature(self, order_id, payment_id, signature):
+        """Checkout signature check, computed locally (never calls the gateway)"""
+        return hmac.compare_digest(self.signature(order_id, payment_id), signature or '')
+
+
+class _TimeoutSession(requests.Session):
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, *args, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(*args, **kwargs)
+
+
+async def _client_lifetime(client):
+    # Parked at its yield until loop.shutdown_asyncgens() (asyncio.run and asgiref
+    # call it before closing a loop) resumes it, closing the client on its own loop
+    try:
+        yield client
+    finally:
+        await client.aclose()
+
+
+class RazorpayGateway(Gateway):
+    """
+    Razorpay over one pooled keep-alive session with (connect, read) timeouts.
+
+    With httpx installed, async views create orders over a pooled httpx.AsyncClient
+    (one per event loop, closed when the loop shuts down), so a slow gateway costs
+    an ASGI worker no threads. `async_transport` replaces its network transport
+    (tests pass an httpx.MockTransport).
+    """
+
+    API_URL = 'https://api.razorpay.com/v1'
+
+    transient_errors = (requests.exceptions.ConnectionError, requests.exceptions.Timeout, razorpay.errors.ServerError)
+    unsent_errors = (requests.exceptions.ConnectTimeout,)
+    if httpx is not None:
+        transient_errors += (httpx.TransportError,)
+        unsent_errors += (httpx.ConnectError, httpx.ConnectTimeout)
+
+    def __init__(self, key_id, key_secret, timeout=(3.05, 10), pool_size=10, async_pool_size=100,
+                 async_transport=None, **kwargs):
+        super().__init__(key_secret, **kwargs)
+        self.key_id = key_id
+        self.timeout = timeout
+        self.async_pool_size = async_pool_size
+        self.async_transport = async_transport
+        session = _TimeoutSession(timeout)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        session.mount('https://', adapter)
+        self.client = razorpay.Client(session=session, auth=(key_id, key_secret))
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def _create_order(self, data):
+        return self.client.order.create(data)
+
+    def _fetch_order(self, order_id):
+        return self.client.order.fetch(order_id)
+
+    def _fetch_order_payments(self, order_id):
+        return self.client.order.payments(order_id).get('items', [])
+
+    def _fetch_payment(self, payment_id):
+        return self.client.payment.fetch(payment_id)
+
+    async def _async_client(self):
+        # An AsyncClient's connections belong to the loop that opened them
+        loop = asyncio.get_running_loop()
+        entry = self._async_clients.get(loop)
+        if entry is None:
+            connect, read = self.timeout if isinstance(self.timeout, tuple) else (self.timeout, self.timeout)
+            client = httpx.AsyncClient(
+                base_url=self.API_URL,
+                auth=(self.key_id, self.key_secret),
+                timeout=httpx.Timeout(read, connect=connect),
+                limits=httpx.Limits(max_connections=self.async_pool_size),
+                transport=self.async_transport,
+            )
+            lifetime = _client_lifetime(client)
+            # First step registers the generator with the loop's shutdown hooks
+            await lifetime.__anext__()
+            entry = self._async_clients[loop] = (client, lifetime)
+        return entry[0]
+
+    def close(self):
+        self.client.session.close()
+        for loop, (client, lifetime) in list(self._async_clients.items()):
+            del self._async_clients[loop]
+            if not loop.is_closed():
+                # aclose() must run on the client's own loop, which may be another thread's
+                loop.call_soon_threadsafe(loop.create_task, lifetime.aclose())
+
+    async def _acreate_order(self, data):
+        if httpx is None:
+            return await super()._acreate_order(data)
+        client = await self._async_client()
+        response = await client.post('/orders', json=data)
+        if response.status_code >= 500:
+            raise razorpay.errors.ServerError(response.text)
+        if response.status_code >= 400:
+            try:
+                message = response.json()['error']['description']
+            except (ValueError, KeyError, TypeError):
+                message = response.text
+            raise razorpay.errors.BadRequestError(message)
+        return response.json()
+
+
+class FakeGateway(Gateway):
+    """
+    In-memory stand-in for Razorpay, for tests and offline development.
+
+    Orders and payments live in dicts. `pay()` plays the customer completing checkout
+    and returns the callback parameters with a valid signature. `fail_next()` and
+    `latency` simulate a degraded gateway.
+    """
+
+    transient_errors = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+    unsent_errors = (requests.exceptions.ConnectTimeout,)
+
+    def __init__(self, key_secret='fake_secret', latency=0, **kwargs):
+        kwargs.setdefault('backoff', 0)
+        super().__init__(key_secret, **kwargs)
+        self.latency = latency
+        self.orders = {}
+        self.payments = {}
+        self._failures = deque()
+        self._lock = threading.Lock()
+
+    def fail_next(self, count=1, error=requests.exceptions.ConnectionError):
+        """Make the next `count` transport calls raise `error`"""
+        with self._lock:
+            self._failures.extend([error] * count)
+
+    def _fail(self):
+        with self._lock:
+            error = self._failures.popleft() if self._failures else None
+        if error is not None:
+            raise error('Simulated gateway failure')
+
+    def _transport(self):
+        if self.latency:
+            time.sleep(self.latency)
+        self._fail()
+
+    def _create_order(self, data):
+        self._transport()
+        return self._new_order(data)
+
+    async def _acreate_order(self, data):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self._fail()
+        return self._new_order(data)
+
+    def _new_order(self, data):
+        if not isinstance(data.get('amount'), int) or data['amount'] < 100:
+            raise razorpay.errors.BadRequestError('Order amount less than minimum amount allowed')
+        order = dict(
+            data, id=f'order_{uuid.uuid4().hex[:14]}', entity='order', status='created',
+            amount_paid=0, amount_due=data['amount'], attempts=0, created_at=int(time.time()),
+        )
+        self.orders[order['id']] = order
+        return dict(order)
+
+    def _fetch_order(self, order_id):
+        self._transport()
+        if order_id not in self.orders:
+            raise razorpay.errors.BadRequestError('The id provided does not exist')
+        return dict(self.orders[order_id])
+
+    def _fetch_order_payments(self, order_id):
+        self._transport()
+        return [dict(p) for p in self.payments.values() if p['order_id'] == order_id]
+
+    def _fetch_payment(self, payment_id):
+        self._transport()
+        if payment_id not in self.payments:
+            raise razorpay.errors.BadRequestError('The id provided does not exist')
+        return dict(self.payments[payment_id])
+
+    def pay(self, order_id, status='captured', method='card'):
+        """Record a payment for an order, returns the callback's razorpay_* parameters"""
+        order = self.orders[order_id]
+        payment_id = f'pay_{uuid.uuid4().hex[:14]}'
+        self.payments[payment_id] = {
+            'id': payment_id, 'entity': 'payment', 'order_id': order_id, 'amount': order['amount'],
+            'currency': order['currency'], 'status': status, 'method': method, 'created_at': int(time.time()),
+        }
+        order['attempts'] += 1
+        if status == 'captured':
+            order.update(status='paid', amount_paid=order['amount'], amount_due=0)
+        else:
+            order['status'] = 'attempted'
+        return {
+            'razorpay_order_id': order_id,
+            'razorpay_payment_id': payment_id,
+            'razorpay_signature': self.signature(order_id, payment_id),
+        }
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def build_gateway():
+    """Gateway configured by the PAYMENT_GATEWAY ('razorpay' or 'fake') and RAZORPAY_* settings"""
+    options = {
+        'breaker': CircuitBreaker(
+            failure_threshold=getattr(settings, 'PAYMENT_GATEWAY_FAILURE_THRESHOLD', 5),
+            reset_timeout=getattr(settings, 'PAYMENT_GATEWAY_RESET_TIMEOUT', 30),
+        ),
+        'max_retries': getattr(settings, 'PAYMENT_GATEWAY_MAX_RETRIES', 2),
+    }
+    if getattr(settings, 'PAYMENT_GATEWAY', 'razorpay') == 'fake':
+        return FakeGateway(settings.RAZORPAY_KEY_SECRET, **options)
+    return RazorpayGateway(
+        settings.RAZORPAY_KEY_ID,
+        settings.RAZORPAY_KEY_SECRET,
+        timeout=getattr(settings, 'RAZORPAY_TIMEOUT', (3.05, 10)),
+        pool_size=getattr(settings, 'RAZORPAY_POOL_SIZE', 10),
+        async_pool_size=getattr(settings, 'RAZORPAY_ASYNC_POOL_SIZE', 100),
+        **options,
+    )
+
+
+def get_gateway():
+    """The process-wide gateway, built on first use"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = build_gateway()
+    return _gateway
+
+
+def set_gateway(gateway):
+    """
+    Swap the process-wide gateway (tests install a FakeGateway), returns the previous one.
+
+    The previous gateway's pooled connections are closed, it reconnects if used again.
+    """
+    global _gateway
+    previous, _gateway = _gateway, gateway
+    if previous is not None and previous is not gateway:
+        previous.close()
+    return previous
@@ -0,0 +1,75 @@
+# payment/idempotency.py
+import hashlib
+import json
+from contextlib import asynccontextmanager, contextmanager
+
+from django.core.cache import cache
+
+# Seconds a checkout may keep its lock, enough for a gateway call with its retries
+LOCK_TIMEOUT = 60
+
+
+class CheckoutInProgress(Exception):
+    """Another request is creating the payment order of the same checkout"""
+
+
+def checkout_fingerprint(user_id, lines, prices, address_id, amount):
+    """sha256 of everything the gateway order is for: who, which lines at which price, where, how much (paise)"""
+    payload = {
+        'user': user_id,
+        'lines': sorted([pk, quantity, str(prices[pk])] for pk, quantity in lines.items()),
+        'address': address_id,
+        'amount': amount,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+def _lock_key(fingerprint):
+    return f'payment:checkout_lock:{fingerprint}'
+
+
+@contextmanager
+def checkout_lock(fingerprint):
+    """Let one request at a time look up or create the order of a checkout"""
+    key = _lock_key(fingerprint)
+    if not cache.add(key, 1, LOCK_TIMEOUT):
+        raise CheckoutInProgress(fingerprint)
+    try:
+        yield
+    finally:
+        cache.delete(key)
+
+
+@asynccontextmanager
+async def acheckout_lock(fingerprint):
+    """checkout_lock for async views"""
+    key = _lock_key(fingerprint)
+    if not await cache.aadd(key, 1, LOCK_TIMEOUT):
+        raise CheckoutInProgress(fingerprint)
+    try:
+        yield
+    finally:
+        await cache.adelete(key)
+
+
+def find_reusable_order(user, fingerprint):
+    """
+    The pending order of an identical checkout, if its stock is still held.
+
+    Reusing it extends the holds, so the customer gets the same gateway order
+    (and is never charged twice) for as long as they keep retrying.
+    """
+    from orders.models import Order
+    from product import reservations
+
+    order = (
+        Order.objects.filter(
+            user=user, checkout_fingerprint=fingerprint, is_paid='Pending',
+            razorpay_order_id__isnull=False, razorpay_payment_id__isnull=True,
+        )
+        .order_by('-id')
+        .first()
+    )
+    if order is None or not reservations.extend(order.razorpay_order_id):
+        return None
+    return order
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payment.events import process_pending
+
+
+class Command(BaseCommand):
+    help = "Apply queued payment callbacks/webhooks: mark orders paid, record payments, take stock, clear carts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true',
+                            help="Keep running, polling the queue when it is empty")
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help="Seconds between polls of an empty queue with --loop")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            processed = process_pending(options['batch_size'])
+            total += processed
+            if processed:
+                self.stdout.write(f"Processed {processed} payment events.")
+                continue
+            if not options['loop']:
+                break
+            # Nothing due: failed events wait out their backoff
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f"Processed {total} payment events."))
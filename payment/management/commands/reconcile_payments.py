@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from payment.reconciliation import DEFAULT_CANCEL_AFTER, DEFAULT_MIN_AGE, reconcile
+
+
+def _datetime(value):
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Not an ISO date/time: {value}")
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+class Command(BaseCommand):
+    help = "Check pending orders against the payment gateway: apply missed payments, cancel abandoned orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=_datetime,
+                            help="Orders created from this ISO date/time (default: --hours ago)")
+        parser.add_argument('--until', type=_datetime,
+                            help="Orders created before this ISO date/time (default: now)")
+        parser.add_argument('--hours', type=int, default=48,
+                            help="Window length when --since is not given")
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=4,
+                            help="Gateway calls in flight at once")
+        parser.add_argument('--min-age', type=int, default=int(DEFAULT_MIN_AGE.total_seconds() // 60),
+                            help="Minutes an order is left for its callback before it is checked")
+        parser.add_argument('--cancel-after', type=int, default=int(DEFAULT_CANCEL_AFTER.total_seconds() // 3600),
+                            help="Hours after which an order without a successful payment is cancelled")
+        parser.add_argument('--no-apply', action='store_true',
+                            help="Only queue the payments found, leave them to process_payment_events")
+
+    def handle(self, *args, **options):
+        until = options['until'] or timezone.now()
+        since = options['since'] or until - timedelta(hours=options['hours'])
+        stats = reconcile(
+            since, until,
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            min_age=timedelta(minutes=options['min_age']),
+            cancel_after=timedelta(hours=options['cancel_after']),
+            apply=not options['no_apply'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            "Checked {checked} orders: {queued} payments queued, {processed} processed, "
+            "{cancelled} orders cancelled, {errors} lookup errors.".format(**stats)
+        ))
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.15 on 2026-10-18 09:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='payment_id',
+            field=models.CharField(db_index=True, max_length=100, null=True),
+        ),
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('razorpay_payment_id', models.CharField(max_length=100, unique=True)),
+                ('razorpay_order_id', models.CharField(max_length=100)),
+                ('kind', models.CharField(choices=[('paid', 'Paid'), ('failed', 'Failed')], default='paid', max_length=10)),
+                ('signature', models.CharField(blank=True, default='', max_length=128)),
+                ('source', models.CharField(default='callback', max_length=20)),
+                ('wishlist_item_ids', models.JSONField(blank=True, default=list)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('applied', 'Applied'), ('error', 'Error')], default='pending', max_length=12)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('claim', models.CharField(blank=True, max_length=32, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='payment_event_queue_idx')],
+            },
+        ),
+    ]
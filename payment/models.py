@@ -4,7 +4,7 @@ from orders.models import Order
 
 class Payment(models.Model):
     order_id = models.ForeignKey(Order, on_delete=models.CASCADE)
-    payment_id = models.CharField(max_length=100, null=True)
+    payment_id = models.CharField(max_length=100, null=True, db_index=True)
     amount = models.FloatField(null=True)
     status = models.CharField(max_length=100, null=True)
     currency = models.CharField(max_length=3, null=True)
@@ -13,4 +13,41 @@ class Payment(models.Model):
     customer_details = models.JSONField(null=True)
 
     def __str__(self):
-        return f"{self.payment_id}'s Order"
\ No newline at end of file
+        return f"{self.payment_id}'s Order"
+
+
+class PaymentEvent(models.Model):
+    """
+    A verified payment notification (checkout callback or webhook), queued for the
+    process_payment_events worker. One row per Razorpay payment id, so repeated
+    deliveries of the same payment are stored once.
+    """
+    PAID, FAILED = 'paid', 'failed'
+    KINDS = ((PAID, 'Paid'), (FAILED, 'Failed'))
+
+    PENDING, PROCESSING, APPLIED, ERROR = 'pending', 'processing', 'applied', 'error'
+    STATUSES = ((PENDING, 'Pending'), (PROCESSING, 'Processing'), (APPLIED, 'Applied'), (ERROR, 'Error'))
+
+    razorpay_payment_id = models.CharField(max_length=100, unique=True)
+    razorpay_order_id = models.CharField(max_length=100)
+    kind = models.CharField(max_length=10, choices=KINDS, default=PAID)
+    signature = models.CharField(max_length=128, blank=True, default='')
+    source = models.CharField(max_length=20, default='callback')
+    # Wishlist items bought in this checkout (from the buyer's session, callback only)
+    wishlist_item_ids = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=12, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # A failed event is not claimed again before this (exponential backoff), null when due
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    claim = models.CharField(max_length=32, null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='payment_event_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.razorpay_payment_id} ({self.status})"
@@ -0,0 +1,126 @@
+# payment/reconciliation.py
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from payment import events
+from payment.gateway import GatewayUnavailable, get_gateway
+from payment.models import PaymentEvent
+
+logger = logging.getLogger(__name__)
+
+# Razorpay payment statuses that mean the money was taken
+PAID_STATUSES = ('captured', 'authorized')
+
+# Leave orders this young alone, their callback may still be on the way
+DEFAULT_MIN_AGE = timedelta(minutes=15)
+
+# An order with no successful payment after this long is given up on
+DEFAULT_CANCEL_AFTER = timedelta(hours=24)
+
+
+def pending_orders(since, until, batch_size=100):
+    """
+    Yield lists of pending gateway orders created in [since, until), oldest first.
+
+    Pages on (created_at, id) rather than OFFSET, so orders leaving the pending
+    set while the job runs neither shift nor repeat a page.
+    """
+    from orders.models import Order
+
+    window = (
+        Order.objects.filter(
+            is_paid='Pending', created_at__gte=since, created_at__lt=until, razorpay_order_id__isnull=False,
+        )
+        .only('id', 'razorpay_order_id', 'created_at')
+        .order_by('created_at', 'id')
+    )
+    last = None
+    while True:
+        page = window
+        if last is not None:
+            page = page.filter(Q(created_at__gt=last.created_at) | Q(created_at=last.created_at, id__gt=last.id))
+        page = list(page[:batch_size])
+        if not page:
+            return
+        yield page
+        last = page[-1]
+
+
+def _fetch(gateway, order_id):
+    try:
+        return gateway.fetch_order_payments(order_id)
+    except GatewayUnavailable:
+        raise
+    except Exception as e:
+        # A rejected or failed lookup skips this order only, the next run tries it again
+        logger.warning("Reconciliation could not fetch payments of %s: %s", order_id, e)
+        return None
+
+
+def reconcile(since, until=None, batch_size=100, workers=4, gateway=None,
+              min_age=DEFAULT_MIN_AGE, cancel_after=DEFAULT_CANCEL_AFTER, apply=True):
+    """
+    Check pending orders created in [since, until) against the gateway.
+
+    Each page of orders is looked up with at most `workers` gateway calls in flight.
+    Payments found are queued as PaymentEvents in one INSERT per page and applied by
+    the same code as callbacks (payment.events), so an order is never marked paid
+    twice. Orders older than `cancel_after` without a successful payment are
+    cancelled in one UPDATE and their stock holds released.
+
+    Returns counts: orders checked, events newly queued, orders cancelled, lookup errors,
+    and queued events processed (failed ones are retried later by the worker).
+    """
+    from orders.models import Order
+    from product import reservations
+
+    gateway = gateway or get_gateway()
+    now = timezone.now()
+    until = min(until or now, now - min_age)
+    stats = {'checked': 0, 'queued': 0, 'cancelled': 0, 'errors': 0, 'processed': 0}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for page in pending_orders(since, until, batch_size):
+            try:
+                results = list(pool.map(lambda order: _fetch(gateway, order.razorpay_order_id), page))
+            except GatewayUnavailable:
+                logger.error("Payment gateway unavailable, reconciliation stopped")
+                stats['errors'] += 1
+                break
+
+            found, unpaid = [], []
+            for order, payments in zip(page, results):
+                stats['checked'] += 1
+                if payments is None:
+                    stats['errors'] += 1
+                    continue
+                paid = False
+                for payment in payments:
+                    kind = PaymentEvent.PAID if payment.get('status') in PAID_STATUSES else PaymentEvent.FAILED
+                    paid = paid or kind == PaymentEvent.PAID
+                    found.append(PaymentEvent(
+                        razorpay_payment_id=payment['id'],
+                        razorpay_order_id=order.razorpay_order_id,
+                        kind=kind,
+                        source='reconcile',
+                    ))
+                if not paid and order.created_at <= now - cancel_after:
+                    unpaid.append(order)
+
+            stats['queued'] += events.enqueue_many(found)
+            if unpaid:
+                # Conditional on still pending: a payment applied meanwhile wins
+                stats['cancelled'] += Order.objects.filter(
+                    pk__in=[order.pk for order in unpaid], is_paid='Pending'
+                ).update(is_paid='Canceled', updated_at=now)
+                for order in unpaid:
+                    reservations.release(order.razorpay_order_id)
+
+    if apply:
+        while processed := events.process_pending(batch_size):
+            stats['processed'] += processed
+    return stats
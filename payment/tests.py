@@ -1,3 +1,396 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import hmac
+import json
+import unittest
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import razorpay
+import requests
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from orders.models import Order
+from payment.events import enqueue, process_pending
+from payment.gateway import (
+    CircuitBreaker, FakeGateway, GatewayError, GatewayUnavailable, RazorpayGateway, httpx, set_gateway,
+)
+from payment.models import Payment, PaymentEvent
+from payment.reconciliation import reconcile
+from product.models import Cart, Product, WishList
+from product.pricing import Quote, build_quote
+from users.models import Address, User
+
+
+class GatewayTests(SimpleTestCase):
+    """Retry and circuit breaker behaviour, against the in-memory FakeGateway"""
+
+    def gateway(self, **kwargs):
+        kwargs.setdefault('breaker', CircuitBreaker(failure_threshold=3, reset_timeout=30))
+        return FakeGateway(**kwargs)
+
+    def test_reads_are_retried(self):
+        gateway = self.gateway(max_retries=2)
+        order = gateway.create_order(5000)
+        gateway.fail_next(2, requests.exceptions.ReadTimeout)
+        self.assertEqual(gateway.fetch_order(order['id'])['amount'], 5000)
+        self.assertEqual(gateway.metrics.snapshot()['order.fetch']['calls'], 3)
+
+    def test_create_order_is_not_retried_after_it_may_have_been_sent(self):
+        gateway = self.gateway(max_retries=2)
+        gateway.fail_next(1, requests.exceptions.ReadTimeout)
+        with self.assertRaises(GatewayError):
+            gateway.create_order(5000)
+        self.assertEqual(gateway.metrics.snapshot()['order.create']['calls'], 1)
+
+    def test_create_order_is_retried_when_the_connection_failed(self):
+        gateway = self.gateway(max_retries=2)
+        gateway.fail_next(1, requests.exceptions.ConnectTimeout)
+        self.assertTrue(gateway.create_order(5000)['id'].startswith('order_'))
+
+    def test_breaker_opens_and_recovers(self):
+        gateway = self.gateway(max_retries=0)
+        gateway.fail_next(3)
+        for _ in range(3):
+            with self.assertRaises(GatewayError):
+                gateway.create_order(5000)
+        self.assertEqual(gateway.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(GatewayUnavailable):
+            gateway.create_order(5000)
+        self.assertEqual(gateway.metrics.snapshot()['order.create']['calls'], 3)
+
+        # After the reset timeout one trial call goes through and closes the breaker
+        with mock.patch('payment.gateway.time.monotonic', return_value=gateway.breaker._opened_at + 31):
+            gateway.create_order(5000)
+        self.assertEqual(gateway.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_rejected_requests_do_not_open_the_breaker(self):
+        gateway = self.gateway(max_retries=0)
+        for _ in range(5):
+            with self.assertRaises(Exception):
+                gateway.create_order(1)
+        self.assertEqual(gateway.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_async_orders_wait_concurrently(self):
+        gateway = self.gateway(latency=0.05)
+
+        async def checkouts():
+            return await asyncio.gather(*(gateway.acreate_order(5000) for _ in range(200)))
+
+        orders = asyncio.run(asyncio.wait_for(checkouts(), timeout=2))
+        self.assertEqual(len({order['id'] for order in orders}), 200)
+
+    def test_signature(self):
+        gateway = self.gateway()
+        params = gateway.pay(gateway.create_order(5000)['id'])
+        self.assertTrue(gateway.verify_payment_signature(*params.values()))
+        self.assertFalse(gateway.verify_payment_signature(params['razorpay_order_id'], params['razorpay_payment_id'], 'bad'))
+
+
+@unittest.skipIf(httpx is None, 'httpx is not installed')
+class RazorpayAsyncTransportTests(SimpleTestCase):
+    """RazorpayGateway.acreate_order over httpx, against an httpx.MockTransport"""
+
+    def gateway(self, *responses):
+        self.requests = []
+        responses = list(responses)
+
+        def handler(request):
+            self.requests.append(request)
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        return RazorpayGateway(
+            'rzp_key', 'rzp_secret', async_transport=httpx.MockTransport(handler), max_retries=2, backoff=0,
+            breaker=CircuitBreaker(failure_threshold=3),
+        )
+
+    def create(self, gateway, amount=5000):
+        async def run():
+            result = await gateway.acreate_order(amount, receipt='r1')
+            return result, await gateway._async_client()
+        return asyncio.run(run())
+
+    def test_order_is_created(self):
+        gateway = self.gateway(httpx.Response(200, json={'id': 'order_1', 'amount': 5000}))
+        order, client = self.create(gateway)
+        self.assertEqual(order['id'], 'order_1')
+        request = self.requests[0]
+        self.assertEqual(str(request.url), 'https://api.razorpay.com/v1/orders')
+        self.assertEqual(json.loads(request.content), {'amount': 5000, 'currency': 'INR', 'receipt': 'r1'})
+        self.assertTrue(request.headers['authorization'].startswith('Basic '))
+        # The loop's client is closed when asyncio.run shuts the loop down
+        self.assertTrue(client.is_closed)
+
+    def test_rejected_order_raises_the_gateway_message(self):
+        gateway = self.gateway(httpx.Response(400, json={'error': {'description': 'Amount too small'}}))
+        with self.assertRaisesMessage(razorpay.errors.BadRequestError, 'Amount too small'):
+            self.create(gateway, amount=1)
+        # A rejection is not a gateway failure
+        self.assertEqual(gateway.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(gateway.metrics.snapshot()['order.create']['errors'], 1)
+
+    def test_server_error_is_not_retried(self):
+        gateway = self.gateway(httpx.Response(502, text='Bad gateway'), httpx.Response(200, json={'id': 'order_2'}))
+        with self.assertRaises(GatewayError):
+            self.create(gateway)
+        self.assertEqual(len(self.requests), 1)
+
+    def test_unsent_request_is_retried(self):
+        gateway = self.gateway(httpx.ConnectError('refused'), httpx.Response(200, json={'id': 'order_3'}))
+        order, _ = self.create(gateway)
+        self.assertEqual(order['id'], 'order_3')
+        self.assertEqual(gateway.metrics.snapshot()['order.create']['calls'], 2)
+
+    def test_read_timeout_is_not_retried(self):
+        gateway = self.gateway(httpx.ReadTimeout('slow'), httpx.Response(200, json={'id': 'order_4'}))
+        with self.assertRaises(GatewayError):
+            self.create(gateway)
+        self.assertEqual(len(self.requests), 1)
+
+    def test_replaced_gateway_closes_its_clients(self):
+        gateway = self.gateway(httpx.Response(200, json={'id': 'order_5'}))
+        previous = set_gateway(gateway)
+        self.addCleanup(set_gateway, previous)
+
+        async def run():
+            await gateway.acreate_order(5000)
+            client = await gateway._async_client()
+            set_gateway(FakeGateway())
+            # The close is scheduled on the client's loop
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            return client.is_closed
+
+        self.assertTrue(asyncio.run(run()))
+        self.assertEqual(len(gateway._async_clients), 0)
+
+
+class CheckoutTests(TestCase):
+    """Payment creation and callback end to end, with the FakeGateway installed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='pw')
+        cls.address = Address.objects.create(user=cls.user, address='1 Road', city='Pune', state='MH', pincode='411001')
+        cls.product = Product.objects.create(name='Runner', price=2500, stock=5)
+
+    def setUp(self):
+        self.gateway = FakeGateway('secret')
+        previous = set_gateway(self.gateway)
+        self.addCleanup(set_gateway, previous)
+        self.client.force_login(self.user)
+
+    def create_payment(self, quote=None):
+        quote = quote or build_quote(self.user, address_id=self.address.pk)
+        return self.client.post(
+            f'/payment/create-payment/{self.product.pk}/',
+            json.dumps({'quote_id': quote.id}),
+            content_type='application/json',
+        )
+
+    def test_checkout_and_callback(self):
+        Cart.add_product(self.user.id, self.product.pk, 2)
+        response = self.create_payment()
+        self.assertEqual(response.status_code, 200)
+        order_id = response.json()['order_id']
+        self.assertEqual(self.gateway.orders[order_id]['amount'], 500000)
+
+        params = self.gateway.pay(order_id)
+        # A repeated callback (refresh, back button) is queued once
+        self.client.post('/payment/callback/', params)
+        self.client.post('/payment/callback/', params)
+        self.assertEqual(Order.objects.get(razorpay_order_id=order_id).is_paid, 'Pending')
+
+        self.assertEqual(process_pending(), 1)
+        order = Order.objects.get(razorpay_order_id=order_id)
+        self.assertEqual(order.is_paid, 'Completed')
+        self.assertEqual(Payment.objects.get(order_id=order).payment_id, params['razorpay_payment_id'])
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.reserved), (3, 0))
+
+    def test_quote_prices_cart_and_wishlist_in_one_query(self):
+        other = Product.objects.create(name='Trail', price=1000, original_price=1500, stock=5)
+        Cart.add_product(self.user.id, self.product.pk, 2)
+        item = WishList.objects.create(user=self.user, product=other)
+        with self.assertNumQueries(1):
+            quote = build_quote(self.user, [str(item.pk)], address_id=self.address.pk)
+        self.assertEqual(quote.quantities(), {self.product.pk: 2, other.pk: 1})
+        self.assertEqual((quote.subtotal, quote.discount, quote.total), (650000, 50000, 600000))
+
+        loaded = Quote.load(quote.id, self.user)
+        self.assertEqual((loaded.total, loaded.wishlist_item_ids, loaded.address_id), (600000, [item.pk], self.address.pk))
+
+    def test_payment_is_for_the_quoted_total(self):
+        Cart.add_product(self.user.id, self.product.pk, 2)
+        quote = build_quote(self.user, address_id=self.address.pk)
+        # A price change after the checkout page does not change the charge
+        Product.objects.filter(pk=self.product.pk).update(price=1)
+        order_id = self.create_payment(quote).json()['order_id']
+        self.assertEqual(self.gateway.orders[order_id]['amount'], 500000)
+
+    def test_forged_or_foreign_quotes_are_refused(self):
+        other = User.objects.create_user(username='other', email='other@example.com', password='pw')
+        Cart.add_product(other.id, self.product.pk)
+        foreign = build_quote(other, address_id=self.address.pk)
+        self.assertEqual(self.create_payment(foreign).status_code, 400)
+        response = self.client.post(
+            f'/payment/create-payment/{self.product.pk}/', json.dumps({'quote_id': 'x:y:z'}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        Cart.add_product(self.user.id, self.product.pk)
+        with override_settings(CHECKOUT_QUOTE_TTL=-1):
+            self.assertEqual(self.create_payment().status_code, 409)
+        self.assertEqual(len(self.gateway.orders), 0)
+
+    def test_empty_checkout_is_refused(self):
+        response = self.create_payment()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(self.gateway.orders), 0)
+
+    def test_late_failure_does_not_undo_a_payment(self):
+        Cart.add_product(self.user.id, self.product.pk)
+        order_id = self.create_payment().json()['order_id']
+        paid = self.gateway.pay(order_id)
+        enqueue(paid['razorpay_payment_id'], order_id)
+        enqueue('pay_failedattempt', order_id, kind=PaymentEvent.FAILED, source='webhook')
+        self.assertEqual(process_pending(), 2)
+        self.assertEqual(Order.objects.get(razorpay_order_id=order_id).is_paid, 'Completed')
+        self.assertEqual(Payment.objects.filter(status='failed').count(), 1)
+
+    def test_callback_after_the_webhook_still_clears_the_wishlist(self):
+        other = Product.objects.create(name='Trail', price=1000, stock=5)
+        item = WishList.objects.create(user=self.user, product=other)
+        quote = build_quote(self.user, [str(item.pk)], address_id=self.address.pk)
+        order_id = self.create_payment(quote).json()['order_id']
+        params = self.gateway.pay(order_id)
+        enqueue(params['razorpay_payment_id'], order_id, source='webhook')
+
+        self.client.post('/payment/callback/', params)
+
+        self.assertEqual(PaymentEvent.objects.get().wishlist_item_ids, [item.pk])
+        self.assertEqual(process_pending(), 1)
+        self.assertFalse(WishList.objects.filter(pk=item.pk).exists())
+
+    def test_event_for_an_unknown_order_is_retried_after_a_backoff(self):
+        enqueue('pay_early', 'order_notyet')
+        # A batch that only failed still counts, so a draining caller does not stop early
+        self.assertEqual(process_pending(), 1)
+        event = PaymentEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), (PaymentEvent.PENDING, 1))
+        # Not due again straight away
+        self.assertEqual(process_pending(), 0)
+
+        later = event.next_attempt_at + timedelta(seconds=1)
+        with mock.patch('payment.events.timezone.now', return_value=later):
+            self.assertEqual(process_pending(), 1)
+        event.refresh_from_db()
+        self.assertEqual(event.attempts, 2)
+        self.assertEqual(event.next_attempt_at, later + timedelta(seconds=10))
+
+    def test_gateway_failure_releases_the_stock_hold(self):
+        Cart.add_product(self.user.id, self.product.pk)
+        self.gateway.breaker = CircuitBreaker(failure_threshold=1)
+        self.gateway.fail_next(1)
+        # The failed call opens the breaker, the second checkout is refused without a call
+        for _ in range(2):
+            self.assertEqual(self.create_payment().status_code, 503)
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.OPEN)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved, 0)
+        self.assertFalse(Order.objects.exists())
+
+    def test_repeated_checkout_reuses_the_pending_order(self):
+        Cart.add_product(self.user.id, self.product.pk, 2)
+        first = self.create_payment().json()['order_id']
+        second = self.create_payment().json()['order_id']
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.gateway.orders), 1)
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved, 2)
+
+    def test_changed_cart_gets_a_new_order_and_drops_the_old_holds(self):
+        Cart.add_product(self.user.id, self.product.pk, 2)
+        first = self.create_payment().json()['order_id']
+        Cart.add_product(self.user.id, self.product.pk, 2)
+        second = self.create_payment().json()['order_id']
+        self.assertNotEqual(first, second)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved, 4)
+
+    def test_concurrent_identical_checkout_is_refused(self):
+        Cart.add_product(self.user.id, self.product.pk)
+        with mock.patch('payment.idempotency.cache.add', return_value=False):
+            response = self.create_payment()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(len(self.gateway.orders), 0)
+
+    @override_settings(RAZORPAY_WEBHOOK_SECRET='whsec')
+    def test_webhook_queues_signed_events_only(self):
+        body = json.dumps({
+            'event': 'payment.captured',
+            'payload': {'payment': {'entity': {'id': 'pay_hook', 'order_id': 'order_hook', 'status': 'captured'}}},
+        })
+        signature = hmac.new(b'whsec', body.encode(), hashlib.sha256).hexdigest()
+        bad = self.client.post('/payment/webhook/', body, content_type='application/json', HTTP_X_RAZORPAY_SIGNATURE='x')
+        self.assertEqual(bad.status_code, 400)
+        for _ in range(2):
+            response = self.client.post(
+                '/payment/webhook/', body, content_type='application/json', HTTP_X_RAZORPAY_SIGNATURE=signature
+            )
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(PaymentEvent.objects.filter(razorpay_payment_id='pay_hook', source='webhook').count(), 1)
+
+
+class ReconciliationTests(TestCase):
+    """Pending orders checked against the FakeGateway"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='pw')
+        cls.product = Product.objects.create(name='Runner', price=2500, stock=5)
+
+    def setUp(self):
+        self.gateway = FakeGateway('secret')
+
+    def order(self, hours_ago):
+        gateway_order = self.gateway.create_order(250000)
+        order = Order.objects.create(
+            user=self.user, product=self.product, amount=2500, razorpay_order_id=gateway_order['id'],
+        )
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(hours=hours_ago))
+        return order
+
+    def test_missed_payments_are_applied_and_abandoned_orders_cancelled(self):
+        paid, failed, abandoned, recent = self.order(2), self.order(3), self.order(30), self.order(1)
+        self.gateway.pay(paid.razorpay_order_id)
+        self.gateway.pay(failed.razorpay_order_id, status='failed')
+
+        stats = reconcile(timezone.now() - timedelta(days=2), gateway=self.gateway, batch_size=2, workers=2)
+        self.assertEqual((stats['checked'], stats['queued'], stats['processed'], stats['cancelled']), (4, 2, 2, 1))
+        statuses = dict(Order.objects.values_list('id', 'is_paid'))
+        self.assertEqual(
+            [statuses[o.pk] for o in (paid, failed, abandoned, recent)],
+            ['Completed', 'Pending', 'Canceled', 'Pending'],
+        )
+        self.assertEqual(
+            sorted(Payment.objects.values_list('status', flat=True)), ['captured', 'failed'],
+        )
+
+        # A second run finds nothing new to queue or record
+        stats = reconcile(timezone.now() - timedelta(days=2), gateway=self.gateway)
+        self.assertEqual((stats['queued'], stats['processed'], Payment.objects.count()), (0, 0, 2))
+
+    def test_lookup_errors_leave_the_order_pending(self):
+        order = self.order(30)
+        self.gateway.max_retries = 0
+        self.gateway.fail_next(1)
+        stats = reconcile(timezone.now() - timedelta(days=2), gateway=self.gateway)
+        self.assertEqual((stats['errors'], stats['cancelled']), (1, 0))
+        self.assertEqual(Order.objects.get(pk=order.pk).is_paid, 'Pending')
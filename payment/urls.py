@@ -1,8 +1,10 @@
 from django.urls import path
-from payment.views import CreatePaymentView, CreateCallbackView
+from payment.views import CreatePaymentView, CreateCallbackView, gateway_status, razorpay_webhook
 
 urlpatterns = [
     path('create-payment/<int:product_id>/', CreatePaymentView.as_view(), name='payment'),
     path('callback/', CreateCallbackView.as_view(), name='payment_callback'),
+    path('webhook/', razorpay_webhook, name='payment_webhook'),
+    path('gateway-status/', gateway_status, name='payment_gateway_status'),
 ]
 
@@ -1,158 +1,220 @@
+import hashlib
+import hmac
 import json
-import razorpay
-from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import JsonResponse
-from django.shortcuts import get_object_or_404, redirect
+import logging
+
+from asgiref.sync import sync_to_async
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.views import redirect_to_login
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import aget_object_or_404, redirect
 from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
-from kickera import settings
-from orders.models import Order
-from product.models import Product, Cart, WishList
+from django.views.decorators.http import require_POST
+from django.conf import settings
+from orders.models import Order, OrderItem
+from payment import events
+from payment.gateway import GatewayError, get_gateway
+from payment.idempotency import CheckoutInProgress, acheckout_lock, checkout_fingerprint, find_reusable_order
+from product import reservations
+from product.models import Product
+from product.pricing import InvalidQuote, Quote, QuoteExpired, paise
+
+logger = logging.getLogger(__name__)
 
-# Initialize Razorpay client
-client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
+# Webhook events that carry a payment entity, by the PaymentEvent kind they queue
+WEBHOOK_EVENTS = {
+    'payment.captured': events.PaymentEvent.PAID,
+    'order.paid': events.PaymentEvent.PAID,
+    'payment.failed': events.PaymentEvent.FAILED,
+}
 
 @method_decorator(csrf_exempt, name='dispatch')
-class CreatePaymentView(LoginRequiredMixin, View):
-    def post(self, request, product_id):
+class CreatePaymentView(View):
+    """
+    Async: the gateway round-trip is awaited, so a slow gateway holds no worker thread.
+
+    Database work goes through the async ORM, the transactional steps (stock holds,
+    saving the order) run in Django's sync thread.
+    """
+
+    async def post(self, request, product_id):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
         try:
-            # Get request body data
+            # The signed quote from the checkout page is the only input: lines, prices, address
             body_data = json.loads(request.body) if request.body else {}
-            
+            try:
+                quote = Quote.load(body_data.get('quote_id'), user)
+            except QuoteExpired:
+                return JsonResponse({'error': 'Prices may have changed, please reload the checkout page'}, status=409)
+            except InvalidQuote:
+                return JsonResponse({'error': 'Invalid checkout quote'}, status=400)
+
             # Get the product
-            product = get_object_or_404(Product, pk=product_id)
-
-            # Calculate payment amount
-            if 'cart_total' in body_data and body_data['cart_total']:
-                payment_amount = int(float(body_data['cart_total']) * 100)
-            else:
-                payment_amount = int(product.price * 100)  # Razorpay expects amount in paise
-            
+            product = await aget_object_or_404(Product, pk=product_id)
+
+            lines, prices, amount = quote.quantities(), quote.unit_prices(), quote.amount
+            payment_amount = quote.total  # Razorpay expects amount in paise
+
             # Validate payment amount
             if payment_amount <= 0:
                 return JsonResponse({'error': 'Invalid payment amount'}, status=400)
 
-            # Create Razorpay order
-            order_data = {
-                'amount': payment_amount,
-                'currency': "INR",
-                'receipt': f"order_{product_id}_{request.user.id}"
-            }
-            
-            razorpay_order = client.order.create(order_data)
-            
-            # Get address from request
-            address_id = body_data.get('address_id') or request.GET.get('address_id')
-            if not address_id:
+            if not quote.address_id:
                 return JsonResponse({'error': 'Delivery address is required'}, status=400)
 
             try:
                 from users.models import Address
-                address = Address.objects.get(id=address_id, user=request.user)
+                address = await Address.objects.aget(id=quote.address_id, user=user)
             except Address.DoesNotExist:
                 return JsonResponse({'error': 'Invalid delivery address'}, status=400)
 
-            # Create order in database
-            order = Order.objects.create(
-                user=request.user,
-                product=product,
-                amount=payment_amount / 100,  # Store in rupees
-                razorpay_order_id=razorpay_order['id'],
-                address=address,
-            )
+            # An identical checkout (double click, retry, back button) reuses its pending order
+            fingerprint = checkout_fingerprint(user.id, lines, prices, address.pk, payment_amount)
+            try:
+                async with acheckout_lock(fingerprint):
+                    order = await sync_to_async(find_reusable_order)(user, fingerprint)
+                    if order is None:
+                        order = await self.create_order(user, product, lines, prices, amount, address, fingerprint)
+            except CheckoutInProgress:
+                return JsonResponse({'error': 'This checkout is already being processed'}, status=409)
+            except reservations.OutOfStock as e:
+                name = next((line['name'] for line in quote.lines if line['product_id'] == e.product_id), product.name)
+                return JsonResponse({'error': f'Sorry, "{name}" is out of stock'}, status=409)
+            except GatewayError:
+                return JsonResponse({'error': 'Payment service is busy, please try again in a moment'}, status=503)
 
             # Store wishlist items in session if present
-            wishlist_item_ids = request.GET.getlist('wishlist_item_id')
-            if wishlist_item_ids:
-                request.session['wishlist_item_ids'] = wishlist_item_ids
-            
+            if quote.wishlist_item_ids:
+                await request.session.aset('wishlist_item_ids', quote.wishlist_item_ids)
+
             return JsonResponse({
-                'order_id': razorpay_order['id'],
+                'order_id': order.razorpay_order_id,
                 'razorpay_key_id': settings.RAZORPAY_KEY_ID,
                 'product_name': product.name,
                 'amount': payment_amount,
                 'razorpay_callback_url': settings.RAZORPAY_CALLBACK_URL,
             })
-            
+
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
 
+    async def create_order(self, user, product, lines, prices, amount, address, fingerprint):
+        """Hold the stock, create one gateway order and save the order with its lines"""
+        hold = await sync_to_async(self.hold_stock)(user, lines)
+        try:
+            razorpay_order = await get_gateway().acreate_order(
+                paise(amount), currency="INR", receipt=f"chk_{fingerprint[:32]}"
+            )
+            return await sync_to_async(self.save_order)(
+                user, product, lines, prices, amount, address, fingerprint, hold, razorpay_order['id']
+            )
+        except BaseException:
+            await sync_to_async(reservations.release)(hold)
+            raise
+
+    def hold_stock(self, user, lines):
+        # Holds of the user's earlier, different checkouts would count against this one
+        reservations.release_user_holds(user)
+        return reservations.reserve(lines, user=user)
+
+    def save_order(self, user, product, lines, prices, amount, address, fingerprint, hold, razorpay_order_id):
+        vendor_ids = Product.objects.filter(pk__in=lines).values_list('vendor_id', flat=True)
+        # Create the order and its lines together
+        with transaction.atomic():
+            order = Order.objects.create(
+                user=user,
+                # Headline product shown in order lists
+                product_id=product.pk if product.pk in lines else next(iter(lines)),
+                amount=amount,
+                razorpay_order_id=razorpay_order_id,
+                address=address,
+                checkout_fingerprint=fingerprint,
+                **Order.vendor_fields(vendor_ids),
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_id=pk, quantity=quantity, unit_price=prices[pk])
+                for pk, quantity in lines.items()
+            ])
+            reservations.rename(hold, razorpay_order_id)
+        return order
+
 @method_decorator(csrf_exempt, name='dispatch')
 class CreateCallbackView(View):
-    def get(self, request):
+    async def get(self, request):
         # Handle GET request from Razorpay (as seen in your URL)
         order_id = request.GET.get('razorpay_order_id')
         payment_id = request.GET.get('razorpay_payment_id')
         signature = request.GET.get('razorpay_signature')
         
-        print(f"Payment callback GET: order_id={order_id}, payment_id={payment_id}")
-        return self._process_payment(request, order_id, payment_id, signature)
+        logger.info("Payment callback GET: order_id=%s, payment_id=%s", order_id, payment_id)
+        return await self._process_payment(request, order_id, payment_id, signature)
     
-    def post(self, request):
+    async def post(self, request):
         # Handle POST request (original method)
         order_id = request.POST.get('razorpay_order_id')
         payment_id = request.POST.get('razorpay_payment_id')
         signature = request.POST.get('razorpay_signature')
         
-        print(f"Payment callback POST: order_id={order_id}, payment_id={payment_id}")
-        return self._process_payment(request, order_id, payment_id, signature)
+        logger.info("Payment callback POST: order_id=%s, payment_id=%s", order_id, payment_id)
+        return await self._process_payment(request, order_id, payment_id, signature)
     
-    def _process_payment(self, request, order_id, payment_id, signature):
-        if order_id and payment_id and signature:
-            try:
-                # Get the order
-                order = Order.objects.get(razorpay_order_id=order_id)
-                print(f"Processing payment for order: {order.id}, current is_paid: {order.is_paid}")
-                
-                # Verify signature
-                params_dict = {
-                    'razorpay_order_id': order_id,
-                    'razorpay_payment_id': payment_id,
-                    'razorpay_signature': signature
-                }
-                
-                try:
-                    # Verify the payment signature
-                    client.utility.verify_payment_signature(params_dict)
-                    print(f"Payment signature verified for order: {order.id}")
-                    
-                    # Mark order as paid
-                    order.razorpay_payment_id = payment_id
-                    order.razorpay_signature = signature
-                    order.is_paid = 'Completed'  # Make sure this is a string value
-                    order.save()
-                    print(f"Order {order.id} saved as paid (Completed)")
-                    
-                    # Clear cart items if user is authenticated
-                    if request.user.is_authenticated:
-                        Cart.objects.filter(user=request.user).delete()
-                        print(f"Cart items deleted for user: {request.user.id}")
-                    
-                    # Clear wishlist items if present
-                    wishlist_item_ids = request.session.get('wishlist_item_ids', [])
-                    if wishlist_item_ids and request.user.is_authenticated:
-                        WishList.objects.filter(id__in=wishlist_item_ids, user=request.user).delete()
-                        if 'wishlist_item_ids' in request.session:
-                            del request.session['wishlist_item_ids']
-                        print(f"Wishlist items deleted: {wishlist_item_ids}")
-                    
-                except Exception as e:
-                    # Log the exception
-                    print(f"Payment verification failed: {str(e)}")
-                
-                # Redirect to confirmation page
-                redirect_url = f'/product/confirmation/?order_id={order.id}'
-                print(f"Redirecting to: {redirect_url}")
-                return redirect(redirect_url)
-                
-            except Order.DoesNotExist:
-                print(f"Order not found with razorpay_order_id: {order_id}")
-                return redirect('/product/confirmation/')
-            except Exception as e:
-                # Log the exception
-                print(f"Payment callback error: {str(e)}")
-                return redirect('/product/confirmation/')
-        else:
-            print("Missing required payment parameters")
-            return redirect('/product/confirmation/')
\ No newline at end of file
+    async def _process_payment(self, request, order_id, payment_id, signature):
+        if not (order_id and payment_id and signature):
+            logger.warning("Payment callback without the razorpay_* parameters")
+            return redirect('/product/confirmation/')
+
+        # The signature check is a local HMAC, everything else is left to the worker
+        if not get_gateway().verify_payment_signature(order_id, payment_id, signature):
+            # Not released here: a forged callback must not free a real checkout's stock, the hold just expires
+            logger.warning("Payment callback with a bad signature for %s / %s", order_id, payment_id)
+            return redirect('/product/confirmation/')
+
+        await events.aenqueue(
+            payment_id, order_id, signature=signature, source='callback',
+            wishlist_item_ids=await request.session.apop('wishlist_item_ids', None),
+        )
+        order_pk = await Order.objects.filter(razorpay_order_id=order_id).values_list('id', flat=True).afirst()
+        if order_pk is None:
+            return redirect('/product/confirmation/')
+        return redirect(f'/product/confirmation/?order_id={order_pk}')
+
+
+@csrf_exempt
+@require_POST
+def razorpay_webhook(request):
+    """
+    Razorpay webhook: payment.captured / order.paid / payment.failed are queued like callbacks.
+
+    Covers buyers who closed the tab before the callback redirect.
+    """
+    secret = getattr(settings, 'RAZORPAY_WEBHOOK_SECRET', None)
+    received = request.headers.get('X-Razorpay-Signature', '')
+    expected = hmac.new((secret or '').encode(), request.body, hashlib.sha256).hexdigest()
+    if not secret or not hmac.compare_digest(expected, received):
+        return HttpResponse(status=400)
+    try:
+        body = json.loads(request.body)
+        payment = body['payload']['payment']['entity']
+    except (ValueError, KeyError, TypeError):
+        # Events without a payment (refunds, disputes...) are not ours to handle
+        return HttpResponse(status=200)
+    kind = WEBHOOK_EVENTS.get(body.get('event'))
+    if kind and payment.get('order_id'):
+        events.enqueue(payment['id'], payment['order_id'], kind=kind, source='webhook')
+    return HttpResponse(status=200)
+
+
+@staff_member_required
+def gateway_status(request):
+    """Circuit breaker state and recent call latencies of this worker's gateway client"""
+    gateway = get_gateway()
+    return JsonResponse({
+        'gateway': type(gateway).__name__,
+        'circuit': gateway.breaker.state,
+        'operations': gateway.metrics.snapshot(),
+    })
@@ -8,10 +8,10 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
 from reportlab.lib.styles import getSampleStyleSheet
 from io import BytesIO
 from datetime import datetime
-from django.db.models import Sum, Count, Avg
+from django.db.models import Sum, Count
 
 from product.models import Cart, Confirmation, Product, Image, Category, Brand, WishList, SubCategory, Review
-from orders.models import Order
+from orders.models import OrderItem
 
 class ReviewInline(admin.TabularInline):
     model = Review
@@ -26,6 +26,8 @@ class ProductAdmin(admin.ModelAdmin):
     list_display = ['id', 'name', 'price', 'stock', 'category', 'brand', 'vendor']
     list_filter = ['category', 'brand', 'vendor', 'product_type']
     search_fields = ['name', 'id', 'category__category_name', 'brand__brand_name']
+    readonly_fields = ['primary_image', 'image_count', 'reserved', 'rating_count', 'rating_sum',
+                       'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count']
     inlines = [ReviewInline]
     
     actions = [
@@ -89,16 +91,14 @@ class ProductAdmin(admin.ModelAdmin):
                 if product.vendor != request.user.vendor_profile:
                     continue
                     
-            # Get order data for this product
-            orders = Order.objects.filter(product=product)
-            total_orders = orders.count()
-            total_sales = orders.filter(is_paid='Completed').aggregate(total=Sum('amount'))['total'] or 0
+            # Get order line data for this product
+            lines = OrderItem.objects.filter(product=product)
+            total_orders = lines.totals()['orders']
+            total_sales = lines.filter(order__is_paid='Completed').totals()['sales']
             
-            # Get average rating
-            reviews = Review.objects.filter(product=product)
-            avg_rating = reviews.aggregate(avg=Avg('rating'))['avg'] or 'N/A'
-            if avg_rating != 'N/A':
-                avg_rating = f"{avg_rating:.1f}"
+            # Average rating (denormalized on Product)
+            avg_rating = product.average_rating
+            avg_rating = f"{avg_rating:.1f}" if avg_rating is not None else 'N/A'
             
             writer.writerow([
                 product.id,
@@ -133,16 +133,14 @@ class ProductAdmin(admin.ModelAdmin):
                 if product.vendor != request.user.vendor_profile:
                     continue
                     
-            # Get order data for this product
-            orders = Order.objects.filter(product=product)
-            total_orders = orders.count()
-            total_sales = orders.filter(is_paid='Completed').aggregate(total=Sum('amount'))['total'] or 0
+            # Get order line data for this product
+            lines = OrderItem.objects.filter(product=product)
+            total_orders = lines.totals()['orders']
+            total_sales = lines.filter(order__is_paid='Completed').totals()['sales']
             
-            # Get average rating
-            reviews = Review.objects.filter(product=product)
-            avg_rating = reviews.aggregate(avg=Avg('rating'))['avg'] or 'N/A'
-            if avg_rating != 'N/A':
-                avg_rating = f"{avg_rating:.1f}"
+            # Average rating (denormalized on Product)
+            avg_rating = product.average_rating
+            avg_rating = f"{avg_rating:.1f}" if avg_rating is not None else 'N/A'
             
             data.append([
                 str(product.id),
@@ -300,12 +298,11 @@ class ProductAdmin(admin.ModelAdmin):
             products = Product.objects.filter(category=category)
             product_count = products.count()
             
-            # Get orders for these products
-            product_ids = products.values_list('id', flat=True)
-            orders = Order.objects.filter(product__in=product_ids, is_paid='Completed')
+            # Get completed order lines of these products
+            totals = OrderItem.objects.filter(product__category=category, order__is_paid='Completed').totals()
             
-            total_orders = orders.count()
-            total_sales = orders.aggregate(total=Sum('amount'))['total'] or 0
+            total_orders = totals['orders']
+            total_sales = totals['sales']
             
             writer.writerow([
                 category.category_name,
@@ -341,12 +338,11 @@ class ProductAdmin(admin.ModelAdmin):
             products = Product.objects.filter(category=category)
             product_count = products.count()
             
-            # Get orders for these products
-            product_ids = products.values_list('id', flat=True)
-            orders = Order.objects.filter(product__in=product_ids, is_paid='Completed')
+            # Get completed order lines of these products
+            totals = OrderItem.objects.filter(product__category=category, order__is_paid='Completed').totals()
             
-            total_orders = orders.count()
-            total_sales = orders.aggregate(total=Sum('amount'))['total'] or 0
+            total_orders = totals['orders']
+            total_sales = totals['sales']
             
             data.append([
                 category.category_name,
@@ -0,0 +1,246 @@
+# product/autocomplete.py
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count, Q
+
+# Suggestions kept per trie node, lookups can never return more than this
+TOP_K = 10
+
+# Entry kinds, in the order they win a weight tie
+KINDS = ('category', 'brand', 'product')
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize(text):
+    """Lower-cased words joined by single spaces ("Nike  Air-Max" -> "nike air max")"""
+    return ' '.join(_WORD_RE.findall((text or '').lower()))
+
+
+def _terms(label):
+    # Every word suffix is indexed, so "max" and "air m" both find "Nike Air Max"
+    words = normalize(label).split(' ')
+    return {' '.join(words[i:]) for i in range(len(words)) if words[i]}
+
+
+class Entry:
+    __slots__ = ('kind', 'id', 'label', 'weight', 'terms')
+
+    def __init__(self, kind, id, label, weight):
+        self.kind = kind
+        self.id = id
+        self.label = label
+        self.weight = weight
+        self.terms = _terms(label)
+
+    @property
+    def key(self):
+        return (self.kind, self.id)
+
+    def rank(self):
+        return (-self.weight, KINDS.index(self.kind), self.label.lower(), self.id)
+
+
+class _Node:
+    """Compressed trie node, `edge` is the label of the edge leading into it"""
+
+    __slots__ = ('edge', 'children', 'keys', 'top')
+
+    def __init__(self, edge=''):
+        self.edge = edge
+        self.children = {}
+        self.keys = set()
+        self.top = ()
+
+
+class AutocompleteIndex:
+    """
+    Process-local compressed prefix trie over product names, brand names and
+    category names.
+
+    Every node keeps the TOP_K best entries of its subtree ordered by popularity,
+    so a lookup walks len(prefix) characters and returns a precomputed list.
+    The post_save/post_delete signals in product/signals.py insert and remove
+    single entries. The trie is rebuilt from the database when it is older than
+    AUTOCOMPLETE_INDEX_MAX_AGE seconds (popularity comes from completed orders).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built_at = None
+        self._root = _Node()
+        self._entries = {}
+
+    def _max_age(self):
+        return getattr(settings, 'AUTOCOMPLETE_INDEX_MAX_AGE', 600)
+
+    def _is_stale(self):
+        if self._built_at is None:
+            return True
+        max_age = self._max_age()
+        return bool(max_age) and time.monotonic() - self._built_at > max_age
+
+    def build(self):
+        """Load products (with their paid order line count), brands and categories in three queries"""
+        from product.models import Brand, Category, Product
+
+        products = list(
+            Product.objects.annotate(popularity=Count('order_items', filter=Q(order_items__order__is_paid='Completed')))
+            .values_list('id', 'name', 'brand_id', 'category_id', 'popularity')
+        )
+        brand_weight = {}
+        category_weight = {}
+        for _, _, brand_id, category_id, popularity in products:
+            # A brand or category is as popular as its products, plus one per product
+            brand_weight[brand_id] = brand_weight.get(brand_id, 0) + popularity + 1
+            category_weight[category_id] = category_weight.get(category_id, 0) + popularity + 1
+
+        entries = [Entry('product', pk, name, popularity) for pk, name, _, _, popularity in products if name]
+        entries += [
+            Entry('brand', pk, name, brand_weight.get(pk, 0))
+            for pk, name in Brand.objects.values_list('id', 'brand_name') if name
+        ]
+        entries += [
+            Entry('category', pk, name, category_weight.get(pk, 0))
+            for pk, name in Category.objects.values_list('id', 'category_name') if name
+        ]
+
+        with self._lock:
+            self._root = _Node()
+            self._entries = {}
+            for entry in entries:
+                self._entries[entry.key] = entry
+                for term in entry.terms:
+                    self._insert_term(term, entry.key, refresh=False)
+            self._refresh_subtree(self._root)
+            self._built_at = time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._built_at = None
+            self._root = _Node()
+            self._entries = {}
+
+    def _best(self, node):
+        candidates = set(node.keys)
+        for child in node.children.values():
+            candidates.update(child.top)
+        return tuple(sorted(candidates, key=lambda key: self._entries[key].rank())[:TOP_K])
+
+    def _refresh_subtree(self, node):
+        for child in node.children.values():
+            self._refresh_subtree(child)
+        node.top = self._best(node)
+
+    def _insert_term(self, term, key, refresh=True):
+        node = self._root
+        path = [node]
+        rest = term
+        while rest:
+            child = node.children.get(rest[0])
+            if child is None:
+                child = _Node(rest)
+                node.children[rest[0]] = child
+                node = child
+                path.append(node)
+                break
+            common = 0
+            limit = min(len(child.edge), len(rest))
+            while common < limit and child.edge[common] == rest[common]:
+                common += 1
+            if common < len(child.edge):
+                # Split the edge: node -> middle -> child
+                middle = _Node(child.edge[:common])
+                child.edge = child.edge[common:]
+                middle.children[child.edge[0]] = child
+                middle.top = child.top
+                node.children[middle.edge[0]] = middle
+                child = middle
+            node = child
+            path.append(node)
+            rest = rest[common:]
+        node.keys.add(key)
+        if refresh:
+            for node in reversed(path):
+                node.top = self._best(node)
+
+    def _remove_term(self, term, key):
+        node = self._root
+        path = [node]
+        rest = term
+        while rest:
+            child = node.children.get(rest[0])
+            if child is None or not rest.startswith(child.edge):
+                return
+            node = child
+            path.append(node)
+            rest = rest[len(child.edge):]
+        node.keys.discard(key)
+        # Drop nodes left without entries or children, refresh the rest bottom up
+        for depth in range(len(path) - 1, -1, -1):
+            node = path[depth]
+            if depth and not node.keys and not node.children:
+                del path[depth - 1].children[node.edge[0]]
+            else:
+                node.top = self._best(node)
+
+    def _add(self, entry):
+        self._entries[entry.key] = entry
+        for term in entry.terms:
+            self._insert_term(term, entry.key)
+
+    def _remove(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        for term in entry.terms:
+            self._remove_term(term, key)
+        del self._entries[key]
+        return entry
+
+    def update(self, kind, id, label):
+        """Insert or rename a single entry (called from post_save), keeping its popularity"""
+        with self._lock:
+            if self._built_at is None:
+                return
+            previous = self._remove((kind, id))
+            if label:
+                self._add(Entry(kind, id, label, previous.weight if previous else 0))
+
+    def remove(self, kind, id):
+        """Drop a single entry (called from post_delete)"""
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._remove((kind, id))
+
+    def lookup(self, prefix, limit=TOP_K):
+        """Return up to `limit` Entry objects whose label has a word starting with `prefix`"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            if self._is_stale():
+                self.build()
+            node = self._root
+            rest = prefix
+            while rest:
+                child = node.children.get(rest[0])
+                if child is None:
+                    return []
+                if len(rest) <= len(child.edge):
+                    if not child.edge.startswith(rest):
+                        return []
+                    node = child
+                    break
+                if not rest.startswith(child.edge):
+                    return []
+                node = child
+                rest = rest[len(child.edge):]
+            return [self._entries[key] for key in node.top[:limit]]
+
+
+autocomplete_index = AutocompleteIndex()
@@ -0,0 +1,110 @@
+# product/cart_summary.py
+from decimal import Decimal
+
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum, Value, Window
+from django.db.models.functions import Coalesce, Greatest
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+ZERO = Decimal('0.00')
+
+
+def _money(value):
+    # SQLite computes the products in floating point, round back to paise
+    return Decimal(value).quantize(ZERO)
+
+
+class CartSummary:
+    """Lines of a cart (or wishlist selection) with their totals"""
+
+    def __init__(self, lines, subtotal=ZERO, grand_total=ZERO):
+        self.lines = lines
+        # subtotal is the MRP (original_price when set), grand_total what is charged
+        self.subtotal = subtotal
+        self.grand_total = grand_total
+
+    @property
+    def discount(self):
+        return self.subtotal - self.grand_total
+
+    @property
+    def item_count(self):
+        return len(self.lines)
+
+    def __add__(self, other):
+        return CartSummary(
+            self.lines + other.lines,
+            self.subtotal + other.subtotal,
+            self.grand_total + other.grand_total,
+        )
+
+
+def summarize(queryset, quantity=None):
+    """
+    Load the lines of a Cart/WishList queryset with their products and totals in one query.
+
+    Every line gets `line_total` (quantity * price). The cart-wide totals are computed by
+    the database as window sums over the same rows. `quantity` overrides the
+    per-row quantity (the checkout counts wishlist items once).
+    """
+    quantity = F('quantity') if quantity is None else Value(quantity)
+    line_total = ExpressionWrapper(quantity * F('product__price'), output_field=MONEY)
+    line_mrp = ExpressionWrapper(
+        quantity * Greatest(Coalesce(F('product__original_price'), F('product__price')), F('product__price')),
+        output_field=MONEY,
+    )
+    lines = list(
+        queryset.filter(product__isnull=False)
+        .select_related('product__primary_image')
+        .annotate(
+            line_total=line_total,
+            cart_subtotal=Window(Sum(line_mrp), output_field=MONEY),
+            cart_grand_total=Window(Sum(line_total), output_field=MONEY),
+        )
+        .order_by('id')
+    )
+    if not lines:
+        return CartSummary(lines)
+    for line in lines:
+        line.line_total = _money(line.line_total)
+    return CartSummary(lines, _money(lines[0].cart_subtotal), _money(lines[0].cart_grand_total))
+
+
+def get_cart_summary(user):
+    from product.models import Cart
+
+    return summarize(Cart.objects.filter(user=user))
+
+
+def get_session_cart_summary(session_cart):
+    """
+    Summary of an anonymous visitor's cookie cart, read with one Product query.
+
+    Lines are unsaved Cart objects whose id is the product id, which is what the
+    cart update/remove URLs expect for anonymous visitors.
+    """
+    from product.models import Cart, Product
+
+    products = Product.objects.select_related('primary_image').in_bulk(list(session_cart.lines))
+    lines = []
+    subtotal = grand_total = ZERO
+    for product_id, quantity in session_cart.lines.items():
+        product = products.get(product_id)
+        if product is None:
+            continue
+        line = Cart(id=product_id, product=product, quantity=quantity)
+        line.line_total = _money(quantity * product.price)
+        mrp = max(product.original_price or product.price, product.price)
+        subtotal += _money(quantity * mrp)
+        grand_total += line.line_total
+        lines.append(line)
+    return CartSummary(lines, subtotal, grand_total)
+
+
+def get_wishlist_summary(user, item_ids=None):
+    """Wishlist items (optionally only `item_ids`) priced at quantity 1, as on the checkout page"""
+    from product.models import WishList
+
+    queryset = WishList.objects.filter(user=user)
+    if item_ids is not None:
+        queryset = queryset.filter(id__in=item_ids)
+    return summarize(queryset, quantity=1)
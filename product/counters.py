@@ -0,0 +1,54 @@
+# product/counters.py
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Per-user number of cart / wishlist rows shown in the navbar badges
+COUNT_KEYS = {
+    'cart_count': 'product:cart_count:{user_id}',
+    'wishlist_count': 'product:wishlist_count:{user_id}',
+}
+
+
+def _timeout():
+    # A count can miss an add that commits while it runs (its incr finds no key yet),
+    # so a counted value is only trusted this long before the rows are counted again
+    return getattr(settings, 'CART_COUNT_CACHE_TIMEOUT', 60)
+
+
+def _count(name, user_id):
+    from product.models import Cart, WishList
+
+    model = Cart if name == 'cart_count' else WishList
+    return model.objects.filter(user_id=user_id).count()
+
+
+def get_counts(user_id):
+    """Return {'cart_count': n, 'wishlist_count': n}, counting only what is not cached yet"""
+    keys = {name: key.format(user_id=user_id) for name, key in COUNT_KEYS.items()}
+    cached = cache.get_many(keys.values())
+    counts = {}
+    for name, key in keys.items():
+        value = cached.get(key)
+        if value is None:
+            value = _count(name, user_id)
+            cache.add(key, value, _timeout())
+        counts[name] = value
+    return counts
+
+
+def _adjust(key, delta):
+    try:
+        if cache.incr(key, delta) < 0:
+            cache.delete(key)
+    except ValueError:
+        # Not cached: the next get_counts() counts the rows
+        pass
+
+
+def adjust_count(name, user_id, delta):
+    """Move a cached counter by delta once the current transaction commits"""
+    if user_id is None:
+        return
+    key = COUNT_KEYS[name].format(user_id=user_id)
+    transaction.on_commit(lambda: _adjust(key, delta))
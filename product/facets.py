@@ -0,0 +1,242 @@
+# product/facets.py
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+
+# Upper bounds (inclusive) of the sidebar price buckets, the last bucket is open ended
+PRICE_BUCKETS = [1000, 2500, 5000, 10000]
+
+# Fields that get a posting list (value -> set of product ids)
+FACET_FIELDS = ('category', 'subcategory', 'brand', 'product_type', 'price_bucket')
+
+# Whitelist of catalog sort fields (CategoryListView falls back to 'name' for anything else).
+# 'relevance' keeps the order of the ranked ids passed as `within`.
+SORT_FIELDS = ('name', 'price', 'product_type', 'id', 'relevance')
+
+
+def price_bucket(price):
+    """Return the index of the PRICE_BUCKETS bucket the price falls into"""
+    return bisect_left(PRICE_BUCKETS, price)
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_decimal(value):
+    try:
+        return Decimal(value)
+    except (TypeError, ValueError, InvalidOperation):
+        return None
+
+
+class FacetResult:
+    """Matching product ids (already sorted) plus per-facet counts"""
+
+    def __init__(self, ids, counts):
+        self.ids = ids
+        self.counts = counts
+
+
+class FacetIndex:
+    """
+    Process-local posting lists over the product catalog.
+
+    The index is built lazily from Product on first use and then kept up to date
+    by the post_save/post_delete signals in product/signals.py. Changes made in
+    another worker process are picked up when the index is older than
+    FACET_INDEX_MAX_AGE seconds (set it to 0 to never rebuild).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built_at = None
+        self._docs = {}
+        self._postings = {field: {} for field in FACET_FIELDS}
+        self._sorted = {}
+
+    def _max_age(self):
+        return getattr(settings, 'FACET_INDEX_MAX_AGE', 300)
+
+    def _is_stale(self):
+        if self._built_at is None:
+            return True
+        max_age = self._max_age()
+        return bool(max_age) and time.monotonic() - self._built_at > max_age
+
+    def build(self):
+        """Load every product row in one query and rebuild all posting lists"""
+        from product.models import Product
+
+        rows = Product.objects.values(
+            'id', 'name', 'price', 'product_type', 'category_id', 'subcategory_id', 'brand_id'
+        )
+        with self._lock:
+            self._docs = {}
+            self._postings = {field: {} for field in FACET_FIELDS}
+            self._sorted = {}
+            for row in rows:
+                self._add_doc(self._doc_from_row(row))
+            self._built_at = time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._built_at = None
+            self._docs = {}
+            self._postings = {field: {} for field in FACET_FIELDS}
+            self._sorted = {}
+
+    def _doc_from_row(self, row):
+        return {
+            'id': row['id'],
+            'name': row['name'],
+            'price': row['price'],
+            'product_type': row['product_type'],
+            'category': row['category_id'],
+            'subcategory': row['subcategory_id'],
+            'brand': row['brand_id'],
+            'price_bucket': price_bucket(row['price']),
+        }
+
+    def _add_doc(self, doc):
+        self._docs[doc['id']] = doc
+        for field in FACET_FIELDS:
+            self._postings[field].setdefault(doc[field], set()).add(doc['id'])
+
+    def _remove_doc(self, product_id):
+        doc = self._docs.pop(product_id, None)
+        if doc is None:
+            return
+        for field in FACET_FIELDS:
+            posting = self._postings[field].get(doc[field])
+            if posting is not None:
+                posting.discard(product_id)
+                if not posting:
+                    del self._postings[field][doc[field]]
+
+    def update(self, product):
+        """Insert or replace a single product (called from post_save)"""
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._remove_doc(product.pk)
+            self._add_doc(self._doc_from_row({
+                'id': product.pk,
+                'name': product.name,
+                'price': _to_decimal(product.price) or Decimal('0'),
+                'product_type': product.product_type,
+                'category_id': product.category_id,
+                'subcategory_id': product.subcategory_id,
+                'brand_id': product.brand_id,
+            }))
+            self._sorted = {}
+
+    def remove(self, product_id):
+        """Drop a single product (called from post_delete)"""
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._remove_doc(product_id)
+            self._sorted = {}
+
+    def _sorted_ids(self, sort_by):
+        # Full catalog order per sort key, id is the tie breaker
+        order = self._sorted.get(sort_by)
+        if order is None:
+            order = sorted(self._docs, key=lambda pk: (self._docs[pk][sort_by], pk))
+            self._sorted[sort_by] = order
+        return order
+
+    def _match(self, filters, min_price, max_price, within=None, skip=None):
+        """Intersect the posting lists of every active filter except `skip`"""
+        result = None if within is None else set(within)
+        for field, value in filters.items():
+            if field == skip or value is None:
+                continue
+            posting = self._postings[field].get(value, set())
+            result = set(posting) if result is None else result & posting
+            if not result:
+                return set()
+        if result is None:
+            result = set(self._docs)
+        if min_price is not None or max_price is not None:
+            result = {
+                pk for pk in result
+                if (min_price is None or self._docs[pk]['price'] >= min_price)
+                and (max_price is None or self._docs[pk]['price'] <= max_price)
+            }
+        return result
+
+    def search(self, filters=None, sort_by='name', sort_order='asc', min_price=None, max_price=None, within=None):
+        """
+        Return a FacetResult for the given filters.
+
+        `filters` maps facet fields (category, subcategory, brand, product_type) to
+        raw request values. Facet counts for a field ignore that field's own filter,
+        so the sidebar keeps showing the other choices of the same facet.
+        `within` optionally restricts the result to a ranked list of ids (e.g. text
+        search hits).
+        """
+        if sort_by not in SORT_FIELDS or (sort_by == 'relevance' and within is None):
+            raise ValueError(f"Cannot sort the facet index by {sort_by!r}")
+
+        cleaned = {}
+        for field, value in (filters or {}).items():
+            if value in (None, ''):
+                continue
+            cleaned[field] = value if field == 'product_type' else _to_int(value)
+        min_price = _to_decimal(min_price) if min_price not in (None, '') else None
+        max_price = _to_decimal(max_price) if max_price not in (None, '') else None
+
+        with self._lock:
+            if self._is_stale():
+                self.build()
+
+            matching = self._match(cleaned, min_price, max_price, within)
+            order = within if sort_by == 'relevance' else self._sorted_ids(sort_by)
+            ids = [pk for pk in order if pk in matching]
+            if sort_order == 'desc':
+                ids.reverse()
+
+            counts = {}
+            for field in FACET_FIELDS:
+                base = matching if field not in cleaned else self._match(cleaned, min_price, max_price, within, skip=field)
+                counts[field] = Counter(self._docs[pk][field] for pk in base)
+
+        return FacetResult(ids, counts)
+
+
+class HydratedIdList:
+    """
+    Sequence of product ids that only loads Product rows for the slice asked for.
+
+    Django's Paginator takes len() instead of running COUNT(*) and slices out one
+    page, so only the products on that page are fetched from the database.
+    """
+
+    def __init__(self, ids, queryset):
+        self.ids = ids
+        self.queryset = queryset
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            page_ids = self.ids[index]
+            products = self.queryset.in_bulk(page_ids)
+            return [products[pk] for pk in page_ids if pk in products]
+        return self.queryset.get(pk=self.ids[index])
+
+
+facet_index = FacetIndex()
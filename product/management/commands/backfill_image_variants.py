@@ -0,0 +1,56 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from product.models import Image
+
+
+def _init_worker():
+    # Each worker process needs its own app registry and DB connection
+    import django
+    django.setup()
+    connections.close_all()
+
+
+def _render(image_id, force):
+    from product.thumbnails import generate_variants
+    return image_id, generate_variants(image_id, force=force)
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnail/WebP variants for product images that do not have them yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Number of worker processes (default: CPU count)")
+        parser.add_argument('--force', action='store_true',
+                            help="Re-render variants for every image, even ones already processed")
+
+    def handle(self, *args, **options):
+        images = Image.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['force']:
+            images = images.filter(content_hash='')
+        image_ids = list(images.values_list('id', flat=True))
+        if not image_ids:
+            self.stdout.write("No product images need variants.")
+            return
+
+        # Forked workers must not share the parent's DB connection
+        connections.close_all()
+
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+            futures = [pool.submit(_render, image_id, options['force']) for image_id in image_ids]
+            for future in as_completed(futures):
+                try:
+                    image_id, content_hash = future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f"Failed: {exc}")
+                    continue
+                done += 1
+                self.stdout.write(f"Image {image_id}: {content_hash or 'skipped (no file)'}")
+
+        self.stdout.write(self.style.SUCCESS(f"Generated variants for {done} image(s), {failed} failed."))
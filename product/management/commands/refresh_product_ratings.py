@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from product.models import Product
+
+
+class Command(BaseCommand):
+    help = "Recompute every product's rating count, sum and per-star histogram from the reviews"
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_ids', nargs='*', type=int,
+                            help="Only repair these products (default: all)")
+
+    def handle(self, *args, **options):
+        count = Product.refresh_rating_summary(options['product_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f"Refreshed ratings of {count} products."))
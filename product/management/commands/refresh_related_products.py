@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from product.recommendations import DEFAULT_TOP_K, refresh_related_products, sparse
+
+
+class Command(BaseCommand):
+    help = "Rebuild the related-products table from order co-purchases (category neighbours as fallback)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K,
+                            help=f"Related products to keep per product (default: {DEFAULT_TOP_K})")
+
+    def handle(self, *args, **options):
+        if sparse is None:
+            self.stdout.write("NumPy/SciPy not installed, using the pure Python co-purchase counter.")
+        count = refresh_related_products(options['top_k'])
+        self.stdout.write(self.style.SUCCESS(f"Stored {count} related product rows."))
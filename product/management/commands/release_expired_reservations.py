@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from product.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = "Give back the stock of checkout reservations whose hold has expired (run every minute from cron)"
+
+    def handle(self, *args, **options):
+        count = release_expired()
+        self.stdout.write(self.style.SUCCESS(f"Released {count} expired stock reservations."))
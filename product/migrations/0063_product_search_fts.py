@@ -0,0 +1,36 @@
+from django.db import migrations
+
+
+def create_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5("
+        "name, brand_name, category_name, sub_category_name, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    schema_editor.execute(
+        "INSERT INTO product_search (rowid, name, brand_name, category_name, sub_category_name) "
+        "SELECT p.id, p.name, COALESCE(b.brand_name, ''), COALESCE(c.category_name, ''), COALESCE(s.sub_category_name, '') "
+        "FROM product_product p "
+        "LEFT JOIN product_brand b ON b.id = p.brand_id "
+        "LEFT JOIN product_category c ON c.id = p.category_id "
+        "LEFT JOIN product_subcategory s ON s.id = p.subcategory_id"
+    )
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS product_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0062_review'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
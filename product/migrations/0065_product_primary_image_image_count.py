@@ -0,0 +1,37 @@
+# Generated by Django 5.1.15 on 2026-10-18 08:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def backfill_image_summary(apps, schema_editor):
+    Product = apps.get_model('product', 'Product')
+    Image = apps.get_model('product', 'Image')
+    summary = Image.objects.values('product_id').annotate(first_id=Min('id'), total=Count('id'))
+    for row in list(summary):
+        Product.objects.filter(pk=row['product_id']).update(
+            primary_image_id=row['first_id'],
+            image_count=row['total'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0064_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='product.image'),
+        ),
+        migrations.RunPython(backfill_image_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 08:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0065_product_primary_image_image_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
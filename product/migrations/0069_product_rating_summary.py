@@ -0,0 +1,66 @@
+# Generated by Django 5.1.15 on 2026-10-18 08:56
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_rating_summary(apps, schema_editor):
+    Product = apps.get_model('product', 'Product')
+    Review = apps.get_model('product', 'Review')
+    summary = defaultdict(dict)
+    for row in Review.objects.values('product_id', 'rating').annotate(total=Count('id')).order_by():
+        summary[row['product_id']][row['rating']] = row['total']
+    for product_id, stars in summary.items():
+        Product.objects.filter(pk=product_id).update(
+            rating_count=sum(stars.values()),
+            rating_sum=sum(rating * total for rating, total in stars.items()),
+            **{f'rating_{rating}_count': stars.get(rating, 0) for rating in range(1, 6)},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0068_product_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_summary, migrations.RunPython.noop),
+    ]
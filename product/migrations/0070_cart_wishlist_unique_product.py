@@ -0,0 +1,41 @@
+# Generated by Django 5.1.15 on 2026-10-18 09:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    # Fold duplicate (user, product) rows into the oldest one before adding the constraints
+    for model_name in ('Cart', 'WishList'):
+        model = apps.get_model('product', model_name)
+        duplicates = (
+            model.objects.filter(user__isnull=False, product__isnull=False)
+            .values('user_id', 'product_id')
+            .annotate(rows=Count('id'), keep_id=Min('id'), total=Sum('quantity'))
+            .filter(rows__gt=1)
+            .order_by()
+        )
+        for row in list(duplicates):
+            model.objects.filter(pk=row['keep_id']).update(quantity=row['total'])
+            model.objects.filter(user_id=row['user_id'], product_id=row['product_id']).exclude(pk=row['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0069_product_rating_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='cart_user_product_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='wishlist',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='wishlist_user_product_unique'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from typing import Any
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from users.models import User
 from vendor.models import VendorProfile
 
@@ -17,14 +19,122 @@ class Product(models.Model):
     original_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
     vendor = models.ForeignKey(VendorProfile, on_delete=models.CASCADE ,null=True)
     stock = models.PositiveIntegerField(default=0)
+    # Units held by unexpired checkout reservations (see product/reservations.py)
+    reserved = models.PositiveIntegerField(default=0)
     category = models.ForeignKey('Category', on_delete=models.CASCADE, null=True)
     subcategory = models.ForeignKey('SubCategory', on_delete=models.CASCADE, null=True, blank=True)
     brand = models.ForeignKey('Brand', on_delete=models.CASCADE, null=True)
+    # Denormalized from Image (kept in sync by product/signals.py) so product cards need no image queries
+    primary_image = models.ForeignKey('Image', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    image_count = models.PositiveIntegerField(default=0)
+    # Denormalized from Review (kept in sync by product/signals.py), repaired by `manage.py refresh_product_ratings`
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
 
+    # Written only by their own UPDATE statements, never by a full save() of a possibly
+    # stale instance (edit forms, admin), which would put old values back
+    MAINTAINED_FIELDS = (
+        'reserved', 'primary_image', 'image_count', 'rating_count', 'rating_sum',
+        'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+    )
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not args and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.MAINTAINED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    @property
+    def available_stock(self):
+        return max(self.stock - self.reserved, 0)
+
+    @property
+    def average_rating(self):
+        if not self.rating_count:
+            return None
+        return self.rating_sum / self.rating_count
+
+    @property
+    def rating_histogram(self):
+        """[(stars, count, percent), ...] from 5 stars down to 1"""
+        histogram = []
+        for stars in range(5, 0, -1):
+            count = getattr(self, f'rating_{stars}_count')
+            percent = round(count * 100 / self.rating_count) if self.rating_count else 0
+            histogram.append((stars, count, percent))
+        return histogram
+
+    @classmethod
+    def apply_rating_delta(cls, product_id, rating, delta):
+        """Add (delta=1) or remove (delta=-1) one review's rating with a single UPDATE"""
+        cls.objects.filter(pk=product_id).update(**{
+            'rating_count': F('rating_count') + delta,
+            'rating_sum': F('rating_sum') + rating * delta,
+            f'rating_{rating}_count': F(f'rating_{rating}_count') + delta,
+        })
+
+    @classmethod
+    def refresh_rating_summary(cls, product_ids=None):
+        """Recompute the rating columns from Review in one UPDATE (all products by default)"""
+        reviews = Review.objects.filter(product_id=OuterRef('pk')).order_by().values('product_id')
+
+        def aggregate(expression, **filters):
+            return Coalesce(Subquery(
+                reviews.filter(**filters).annotate(value=expression).values('value')[:1]
+            ), 0)
+
+        products = cls.objects.all()
+        if product_ids is not None:
+            products = products.filter(pk__in=product_ids)
+        return products.update(
+            rating_count=aggregate(Count('id')),
+            rating_sum=aggregate(Sum('rating')),
+            **{f'rating_{stars}_count': aggregate(Count('id'), rating=stars) for stars in range(1, 6)},
+        )
+
+    @classmethod
+    def refresh_image_summary(cls, product_id):
+        """Recompute primary_image and image_count of one product in a single UPDATE"""
+        images = Image.objects.filter(product_id=product_id)
+        cls.objects.filter(pk=product_id).update(
+            primary_image=Subquery(images.order_by('id').values('id')[:1]),
+            image_count=Coalesce(Subquery(
+                images.order_by().values('product_id').annotate(total=Count('id')).values('total')[:1]
+            ), 0),
+        )
+
+    class Meta:
+        # Catalog listing indexes: (filter, sort key, id) for every equality filter and
+        # sortable field of CategoryListView, so a filtered page is read in index order
+        # without a temp B-tree sort. The plans are checked in product/tests.py.
+        # Sorting by id under a single filter uses the plain foreign key indexes.
+        indexes = [
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+            models.Index(fields=['product_type', 'id'], name='product_type_id_idx'),
+            models.Index(fields=['category', 'name', 'id'], name='product_cat_name_idx'),
+            models.Index(fields=['category', 'price', 'id'], name='product_cat_price_idx'),
+            models.Index(fields=['category', 'product_type', 'id'], name='product_cat_type_idx'),
+            models.Index(fields=['subcategory', 'name', 'id'], name='product_subcat_name_idx'),
+            models.Index(fields=['subcategory', 'price', 'id'], name='product_subcat_price_idx'),
+            models.Index(fields=['subcategory', 'product_type', 'id'], name='product_subcat_type_idx'),
+            models.Index(fields=['brand', 'name', 'id'], name='product_brand_name_idx'),
+            models.Index(fields=['brand', 'price', 'id'], name='product_brand_price_idx'),
+            models.Index(fields=['brand', 'product_type', 'id'], name='product_brand_type_idx'),
+            models.Index(fields=['product_type', 'name', 'id'], name='product_type_name_idx'),
+            models.Index(fields=['product_type', 'price', 'id'], name='product_type_price_idx'),
+        ]
+
 
 class Brand(models.Model):
     brand_name =models.CharField(max_length=255 ,null=True)
@@ -36,6 +146,56 @@ class Brand(models.Model):
 class Image(models.Model):
     image = models.ImageField(upload_to='product/images/', blank=True, null=True)
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
+    # sha256 prefix of the source file, names the resized variants (see product/thumbnails.py)
+    content_hash = models.CharField(max_length=32, blank=True, default='')
+
+
+# Precomputed "related products" strip, refreshed by `manage.py refresh_related_products`
+class RelatedProduct(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_in')
+    score = models.FloatField(default=0)
+    rank = models.PositiveSmallIntegerField()
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} (#{self.rank})"
+
+    class Meta:
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='related_product_rank_unique'),
+        ]
+
+
+# Stock held for a checkout until its payment is verified or the hold expires
+class StockReservation(models.Model):
+    HELD = 'held'
+    COMMITTED = 'committed'
+    RELEASED = 'released'
+    STATUS_CHOICES = [
+        (HELD, 'Held'),
+        (COMMITTED, 'Committed'),
+        (RELEASED, 'Released'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    # Razorpay order id once the gateway order exists, a temporary key before that
+    reference = models.CharField(max_length=100, db_index=True)
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=HELD)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for {self.reference} ({self.status})"
+
+    class Meta:
+        indexes = [
+            # The sweeper's "held and expired" scan
+            models.Index(fields=['status', 'expires_at'], name='reservation_status_exp_idx'),
+        ]
 
 
 #category model
@@ -69,6 +229,44 @@ class Confirmation(models.Model):
         verbose_name_plural = "Confirmations"
 
 
+# Rows per INSERT, keeps the bound parameters well under SQLite's limit
+UPSERT_BATCH_SIZE = 300
+
+
+def upsert_quantities(model, user_id, quantities):
+    """
+    Add {product_id: quantity} to a user's Cart/WishList rows.
+
+    One INSERT ... ON CONFLICT (user_id, product_id) DO UPDATE statement per batch
+    inserts the missing rows and increments the existing ones, so concurrent clicks
+    can neither lose an increment nor create a duplicate row. Returns
+    {product_id: (new_quantity, created)}. Signals are not sent, the cached navbar
+    counters are adjusted here instead.
+    """
+    from product.counters import adjust_count
+
+    product_ids = list(quantities)
+    table = connection.ops.quote_name(model._meta.db_table)
+    result = {}
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for start in range(0, len(product_ids), UPSERT_BATCH_SIZE):
+                batch = product_ids[start:start + UPSERT_BATCH_SIZE]
+                cursor.execute(
+                    f'INSERT INTO {table} (user_id, product_id, quantity) '
+                    f'VALUES {", ".join(["(%s, %s, %s)"] * len(batch))} '
+                    f'ON CONFLICT (user_id, product_id) DO UPDATE SET quantity = {table}.quantity + excluded.quantity '
+                    f'RETURNING product_id, quantity',
+                    [value for product_id in batch for value in (user_id, product_id, quantities[product_id])],
+                )
+                for product_id, new_quantity in cursor.fetchall():
+                    result[product_id] = (new_quantity, new_quantity == quantities[product_id])
+        created = sum(1 for _, is_new in result.values() if is_new)
+        if created:
+            adjust_count('cart_count' if model is Cart else 'wishlist_count', user_id, created)
+    return result
+
+
 #cart model
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cart_items', null=True)
@@ -82,6 +280,23 @@ class Cart(models.Model):
     def total_price(self):
         return self.quantity * self.product.price
 
+    @classmethod
+    def add_product(cls, user_id, product_id, quantity=1):
+        """Insert or increment one line in a single statement, returns (quantity, created)"""
+        return upsert_quantities(cls, user_id, {product_id: quantity})[product_id]
+
+    @classmethod
+    def add_products(cls, user_id, product_ids, quantity=1):
+        """Bulk add: an iterable of ids (quantity each) or a {product_id: quantity} mapping"""
+        if not isinstance(product_ids, dict):
+            product_ids = dict.fromkeys(product_ids, quantity)
+        return upsert_quantities(cls, user_id, product_ids)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='cart_user_product_unique'),
+        ]
+
 
 #wishlist
 class WishList(models.Model):
@@ -97,6 +312,16 @@ class WishList(models.Model):
     def total_price(self):
         return self.quantity * self.product.price
 
+    @classmethod
+    def add_product(cls, user_id, product_id, quantity=1):
+        """Insert or increment one line in a single statement, returns (quantity, created)"""
+        return upsert_quantities(cls, user_id, {product_id: quantity})[product_id]
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='wishlist_user_product_unique'),
+        ]
+
 # Review model
 class Review(models.Model):
     RATING_CHOICES = [
@@ -117,6 +342,15 @@ class Review(models.Model):
     
     def __str__(self):
         return f"{self.user.username if self.user else 'Anonymous'}'s review on {self.product.name}"
+
+    def save(self, *args, **kwargs):
+        # The signals updating Product's rating columns run inside the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
     
     class Meta:
         ordering = ['-created_at']
@@ -0,0 +1,111 @@
+# product/pagination.py
+from django.core import signing
+from django.db.models import Q
+
+CURSOR_SALT = 'product.catalog.cursor'
+
+# Sort keys backed by a (field, id) index, see Product.Meta.indexes
+CURSOR_SORT_FIELDS = ('name', 'price', 'product_type', 'id')
+
+
+class CursorPage:
+    """One page of a keyset paginated listing (no total count)"""
+
+    def __init__(self, items, next_cursor=None, previous_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __bool__(self):
+        # An empty page is still a page; templates test for its presence
+        return True
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def encode_cursor(sort_field, descending, row, direction):
+    """Opaque, signed token holding the sort key and id of the boundary row"""
+    return signing.dumps({
+        's': sort_field,
+        'o': 'desc' if descending else 'asc',
+        'v': str(getattr(row, sort_field)),
+        'id': row.pk,
+        'd': direction,
+    }, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token, sort_field, descending):
+    """Return the cursor payload, or None if it is missing, tampered or for another sort"""
+    if not token:
+        return None
+    try:
+        cursor = signing.loads(token, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        return None
+    if cursor.get('s') != sort_field or cursor.get('o') != ('desc' if descending else 'asc'):
+        return None
+    if cursor.get('d') not in ('next', 'previous'):
+        return None
+    return cursor
+
+
+def keyset_queryset(queryset, sort_field, descending, cursor=None):
+    """Order by (sort_field, id) and, given a decoded cursor, start right after its row"""
+    walk_desc = descending != (cursor is not None and cursor['d'] == 'previous')
+
+    if walk_desc:
+        queryset = queryset.order_by(f'-{sort_field}', '-id')
+        op = 'lt'
+    else:
+        queryset = queryset.order_by(sort_field, 'id')
+        op = 'gt'
+
+    if cursor is not None:
+        # sort_field >= v AND (sort_field > v OR id > pk) keeps the leading column a range scan
+        queryset = queryset.filter(**{f'{sort_field}__{op}e': cursor['v']}).filter(
+            Q(**{f'{sort_field}__{op}': cursor['v']}) | Q(**{f'id__{op}': cursor['id']})
+        )
+    return queryset
+
+
+def paginate_by_cursor(queryset, sort_field, descending, token, page_size):
+    """
+    Keyset pagination over (sort_field, id).
+
+    Instead of OFFSET the page is read with a range condition on the composite
+    (sort_field, id) index, so deep pages cost the same as the first one and no
+    COUNT(*) is needed. Previous pages are read by walking the index backwards
+    and flipping the rows.
+    """
+    cursor = decode_cursor(token, sort_field, descending)
+    backwards = cursor is not None and cursor['d'] == 'previous'
+
+    rows = list(keyset_queryset(queryset, sort_field, descending, cursor)[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    if backwards:
+        rows.reverse()
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, cursor is not None
+
+    if not rows:
+        return CursorPage(rows)
+    return CursorPage(
+        rows,
+        next_cursor=encode_cursor(sort_field, descending, rows[-1], 'next') if has_next else None,
+        previous_cursor=encode_cursor(sort_field, descending, rows[0], 'previous') if has_previous else None,
+    )
@@ -0,0 +1,145 @@
+# product/pricing.py
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Exists, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+QUOTE_SALT = 'product.pricing.quote'
+
+
+class InvalidQuote(Exception):
+    """The quote id was not issued by us, or not to this user"""
+
+
+class QuoteExpired(InvalidQuote):
+    """The quote is older than CHECKOUT_QUOTE_TTL, prices must be looked up again"""
+
+
+def _ttl():
+    return getattr(settings, 'CHECKOUT_QUOTE_TTL', 30 * 60)
+
+
+def _tax_rate():
+    # GST percentage included in the listed prices (reported, never added on top)
+    return str(getattr(settings, 'CHECKOUT_TAX_RATE', '0'))
+
+
+def paise(amount):
+    return int((Decimal(amount) * 100).quantize(Decimal('1'), ROUND_HALF_UP))
+
+
+def rupees(amount_paise):
+    return (Decimal(amount_paise) / 100).quantize(Decimal('0.01'))
+
+
+class Quote:
+    """
+    The priced checkout a payment is created for. All amounts are in paise.
+
+    Each line is {'product_id', 'name', 'quantity', 'unit_price', 'mrp', 'total'}:
+    unit_price is what is charged, mrp the original_price when higher. The quote
+    id is the signed quote itself, so any worker can verify and reuse it without
+    a query or a shared store.
+    """
+
+    def __init__(self, user_id, lines, address_id=None, wishlist_item_ids=(), tax_rate='0'):
+        self.user_id = user_id
+        self.lines = lines
+        self.address_id = address_id
+        self.wishlist_item_ids = list(wishlist_item_ids)
+        self.tax_rate = tax_rate
+        self.total = sum(line['total'] for line in lines)
+        self.subtotal = sum(line['mrp'] * line['quantity'] for line in lines)
+        self.discount = self.subtotal - self.total
+        rate = Decimal(tax_rate)
+        self.tax = self.total - int((self.total * 100 / (100 + rate)).quantize(Decimal('1'), ROUND_HALF_UP)) if rate else 0
+        self._id = None
+
+    @property
+    def id(self):
+        if self._id is None:
+            self._id = signing.dumps({
+                'user': self.user_id,
+                'lines': self.lines,
+                'address': self.address_id,
+                'wishlist': self.wishlist_item_ids,
+                'tax_rate': self.tax_rate,
+            }, salt=QUOTE_SALT, compress=True)
+        return self._id
+
+    @classmethod
+    def load(cls, quote_id, user):
+        """The quote behind a quote id issued to `user`, raises InvalidQuote / QuoteExpired"""
+        try:
+            data = signing.loads(quote_id or '', salt=QUOTE_SALT, max_age=_ttl())
+        except signing.SignatureExpired:
+            raise QuoteExpired(quote_id)
+        except signing.BadSignature:
+            raise InvalidQuote(quote_id)
+        if data['user'] != user.pk:
+            raise InvalidQuote(quote_id)
+        quote = cls(data['user'], data['lines'], data['address'], data['wishlist'], data['tax_rate'])
+        quote._id = quote_id
+        return quote
+
+    def quantities(self):
+        return {line['product_id']: line['quantity'] for line in self.lines}
+
+    def unit_prices(self):
+        return {line['product_id']: rupees(line['unit_price']) for line in self.lines}
+
+    # Rupee amounts for templates and Order.amount
+
+    @property
+    def amount(self):
+        return rupees(self.total)
+
+    @property
+    def subtotal_amount(self):
+        return rupees(self.subtotal)
+
+    @property
+    def discount_amount(self):
+        return rupees(self.discount)
+
+    @property
+    def tax_amount(self):
+        return rupees(self.tax)
+
+
+def build_quote(user, wishlist_item_ids=(), address_id=None):
+    """
+    Price a checkout with one query: the user's cart lines plus the selected wishlist
+    items (once each). An empty checkout gets an empty quote, which cannot be paid.
+    """
+    from product.models import Cart, Product, WishList
+
+    wishlist_ids = [int(pk) for pk in wishlist_item_ids if str(pk).isdigit()]
+    cart = Cart.objects.filter(user=user, product=OuterRef('pk'))
+    wishlist = WishList.objects.filter(user=user, id__in=wishlist_ids, product=OuterRef('pk'))
+    rows = (
+        Product.objects.filter(Q(Exists(cart)) | Q(Exists(wishlist)))
+        .annotate(
+            cart_quantity=Coalesce(Subquery(cart.values('quantity')[:1]), Value(0)),
+            wishlisted=Exists(wishlist),
+        )
+        .order_by('id')
+        .values_list('id', 'name', 'price', 'original_price', 'cart_quantity', 'wishlisted')
+    )
+    lines = []
+    for pk, name, price, original_price, cart_quantity, wishlisted in rows:
+        quantity = cart_quantity + (1 if wishlisted else 0)
+        if not quantity:
+            continue
+        line = {
+            'product_id': pk,
+            'name': name,
+            'quantity': quantity,
+            'unit_price': paise(price),
+            'mrp': paise(max(original_price or price, price)),
+        }
+        line['total'] = line['unit_price'] * quantity
+        lines.append(line)
+    return Quote(user.pk, lines, address_id, wishlist_ids, _tax_rate())
@@ -0,0 +1,129 @@
+# product/recommendations.py
+from collections import defaultdict, Counter
+from itertools import combinations
+
+from django.db import transaction
+
+try:
+    # Sparse matrices make the co-occurrence product cheap on big order tables
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = None
+    sparse = None
+
+# Number of related products stored per product
+DEFAULT_TOP_K = 8
+
+
+def _purchase_pairs():
+    """Distinct (user_id, product_id) pairs from the lines of completed orders"""
+    from orders.models import OrderItem
+
+    return list(
+        OrderItem.objects.filter(order__is_paid='Completed', order__user__isnull=False, product__isnull=False)
+        .values_list('order__user_id', 'product_id')
+        .distinct()
+    )
+
+
+def _co_purchases_sparse(pairs, top_k):
+    user_index = {}
+    product_ids = []
+    product_index = {}
+    rows, cols = [], []
+    for user_id, product_id in pairs:
+        rows.append(user_index.setdefault(user_id, len(user_index)))
+        if product_id not in product_index:
+            product_index[product_id] = len(product_ids)
+            product_ids.append(product_id)
+        cols.append(product_index[product_id])
+
+    purchases = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+        shape=(len(user_index), len(product_ids)),
+    )
+    # products x products: number of users who bought both
+    co_counts = (purchases.T @ purchases).tocsr()
+    co_counts.setdiag(0)
+    co_counts.eliminate_zeros()
+
+    related = {}
+    for row, product_id in enumerate(product_ids):
+        start, end = co_counts.indptr[row], co_counts.indptr[row + 1]
+        if start == end:
+            continue
+        scores = co_counts.data[start:end]
+        best = np.argsort(-scores, kind='stable')[:top_k]
+        related[product_id] = [
+            (product_ids[co_counts.indices[start + i]], float(scores[i])) for i in best
+        ]
+    return related
+
+
+def _co_purchases_python(pairs, top_k):
+    baskets = defaultdict(set)
+    for user_id, product_id in pairs:
+        baskets[user_id].add(product_id)
+
+    co_counts = defaultdict(Counter)
+    for products in baskets.values():
+        for a, b in combinations(sorted(products), 2):
+            co_counts[a][b] += 1
+            co_counts[b][a] += 1
+
+    return {
+        product_id: [(other, float(score)) for other, score in counter.most_common(top_k)]
+        for product_id, counter in co_counts.items()
+    }
+
+
+def compute_related(top_k=DEFAULT_TOP_K):
+    """
+    Return {product_id: [(related_id, score), ...]} for every product.
+
+    Products bought by the same users rank first (score = number of shared buyers).
+    Remaining slots are filled with products from the same category (score 0).
+    """
+    from product.models import Product
+
+    pairs = _purchase_pairs()
+    if pairs and sparse is not None:
+        related = _co_purchases_sparse(pairs, top_k)
+    else:
+        related = _co_purchases_python(pairs, top_k)
+
+    by_category = defaultdict(list)
+    catalog = list(Product.objects.order_by('-id').values_list('id', 'category_id'))
+    for product_id, category_id in catalog:
+        if category_id is not None:
+            by_category[category_id].append(product_id)
+
+    result = {}
+    for product_id, category_id in catalog:
+        entries = [entry for entry in related.get(product_id, []) if entry[0] != product_id]
+        if len(entries) < top_k and category_id is not None:
+            seen = {product_id, *(other for other, _ in entries)}
+            for other in by_category[category_id]:
+                if other not in seen:
+                    entries.append((other, 0.0))
+                    if len(entries) >= top_k:
+                        break
+        result[product_id] = entries[:top_k]
+    return result
+
+
+def refresh_related_products(top_k=DEFAULT_TOP_K):
+    """Recompute and replace the whole RelatedProduct table, returns the number of rows"""
+    from product.models import RelatedProduct
+
+    related = compute_related(top_k)
+    rows = [
+        RelatedProduct(product_id=product_id, related_id=other, score=score, rank=rank)
+        for product_id, entries in related.items()
+        for rank, (other, score) in enumerate(entries)
+    ]
+    with transaction.atomic():
+        RelatedProduct.objects.all().delete()
+        RelatedProduct.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
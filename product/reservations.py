@@ -0,0 +1,169 @@
+# product/reservations.py
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from product.models import Product, StockReservation
+
+logger = logging.getLogger(__name__)
+
+# Every stock change is a single-row conditional UPDATE on product_product, so
+# concurrent checkouts of the same product serialize on that row only and a
+# reservation or decrement can never take stock below zero.
+
+
+class OutOfStock(Exception):
+    def __init__(self, product_id, requested):
+        super().__init__(f"Product {product_id} does not have {requested} units available")
+        self.product_id = product_id
+        self.requested = requested
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, 'STOCK_RESERVATION_TTL', 15 * 60))
+
+
+def _hold(product_id, quantity):
+    """reserved += quantity, only if that many units are still unreserved"""
+    return Product.objects.filter(
+        pk=product_id, stock__gte=F('reserved') + quantity
+    ).update(reserved=F('reserved') + quantity)
+
+
+def _unhold(product_id, quantity):
+    Product.objects.filter(pk=product_id, reserved__gte=quantity).update(reserved=F('reserved') - quantity)
+
+
+def _set_status(reservation_id, old, new, **conditions):
+    # The status flip is the claim: only one of callback / sweeper / cancel wins it
+    return StockReservation.objects.filter(pk=reservation_id, status=old, **conditions).update(
+        status=new, updated_at=timezone.now()
+    )
+
+
+def reserve(lines, user=None, reference=None):
+    """
+    Hold stock for {product_id: quantity} lines, all or nothing.
+
+    Raises OutOfStock (and holds nothing) when a product cannot cover its line.
+    Expired holds on that product are released once before giving up.
+    Returns the reference the reservations are filed under.
+    """
+    reference = reference or f'hold_{uuid.uuid4().hex}'
+    expires_at = timezone.now() + _ttl()
+    with transaction.atomic():
+        # Fixed product order keeps concurrent multi-product checkouts from deadlocking
+        for product_id in sorted(lines):
+            quantity = lines[product_id]
+            if quantity <= 0:
+                continue
+            if not _hold(product_id, quantity):
+                release_expired(product_ids=[product_id])
+                if not _hold(product_id, quantity):
+                    raise OutOfStock(product_id, quantity)
+        StockReservation.objects.bulk_create([
+            StockReservation(
+                product_id=product_id, user=user, reference=reference,
+                quantity=quantity, expires_at=expires_at,
+            )
+            for product_id, quantity in lines.items() if quantity > 0
+        ])
+    return reference
+
+
+def rename(old_reference, new_reference):
+    """File the holds under the gateway order id once it is known"""
+    StockReservation.objects.filter(reference=old_reference).update(reference=new_reference)
+
+
+def release(reference):
+    """Give back every still-held unit of a checkout (cancelled or failed payment)"""
+    released = 0
+    for reservation in StockReservation.objects.filter(reference=reference, status=StockReservation.HELD):
+        with transaction.atomic():
+            if _set_status(reservation.pk, StockReservation.HELD, StockReservation.RELEASED):
+                _unhold(reservation.product_id, reservation.quantity)
+                released += 1
+    return released
+
+
+def release_expired(now=None, product_ids=None):
+    """Sweeper: release holds past their expiry, returns how many were released"""
+    now = now or timezone.now()
+    expired = StockReservation.objects.filter(status=StockReservation.HELD, expires_at__lte=now)
+    if product_ids is not None:
+        expired = expired.filter(product_id__in=product_ids)
+    released = 0
+    for reservation in expired.only('id', 'product_id', 'quantity'):
+        with transaction.atomic():
+            # Skipped when extend() pushed the expiry back since the select
+            if _set_status(reservation.pk, StockReservation.HELD, StockReservation.RELEASED, expires_at__lte=now):
+                _unhold(reservation.product_id, reservation.quantity)
+                released += 1
+    return released
+
+
+def extend(reference):
+    """
+    Push back the expiry of a checkout's holds for a reused payment order.
+
+    Returns False (and releases what is left) when any of its holds is gone already.
+    """
+    with transaction.atomic():
+        extended = StockReservation.objects.filter(reference=reference, status=StockReservation.HELD).update(
+            expires_at=timezone.now() + _ttl(), updated_at=timezone.now()
+        )
+        lost = StockReservation.objects.filter(reference=reference).exclude(status=StockReservation.HELD).exists()
+    if extended and not lost:
+        return True
+    release(reference)
+    return False
+
+
+def release_user_holds(user):
+    """Release every hold of the user's earlier checkouts, returns how many were released"""
+    references = (
+        StockReservation.objects.filter(user=user, status=StockReservation.HELD)
+        .values_list('reference', flat=True).distinct()
+    )
+    return sum(release(reference) for reference in list(references))
+
+
+def commit(reference):
+    """
+    Turn the holds of a verified payment into stock decrements.
+
+    A held reservation moves its units out of both `reserved` and `stock`. One the
+    sweeper already released is decremented from unreserved stock if there still
+    is some. Returns the product ids that could not be covered (oversold), whose
+    held units are still given back to `reserved`.
+    """
+    short = []
+    for reservation in StockReservation.objects.filter(reference=reference).exclude(status=StockReservation.COMMITTED):
+        with transaction.atomic():
+            if _set_status(reservation.pk, StockReservation.HELD, StockReservation.COMMITTED):
+                decremented = Product.objects.filter(
+                    pk=reservation.product_id, stock__gte=reservation.quantity, reserved__gte=reservation.quantity
+                ).update(stock=F('stock') - reservation.quantity, reserved=F('reserved') - reservation.quantity)
+                if not decremented:
+                    # Stock was lowered under the hold: the reservation is settled either way,
+                    # so its units must leave `reserved` or nothing would ever release them
+                    _unhold(reservation.product_id, reservation.quantity)
+            elif _set_status(reservation.pk, StockReservation.RELEASED, StockReservation.COMMITTED):
+                decremented = Product.objects.filter(
+                    pk=reservation.product_id, stock__gte=F('reserved') + reservation.quantity
+                ).update(stock=F('stock') - reservation.quantity)
+            else:
+                continue
+        if not decremented:
+            logger.error(
+                "Paid order %s could not take %s units of product %s from stock",
+                reference, reservation.quantity, reservation.product_id,
+            )
+            short.append(reservation.product_id)
+    return short
@@ -0,0 +1,104 @@
+# product/search.py
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+# FTS5 virtual table created by migration 0063_product_search_fts, rowid == product id
+SEARCH_TABLE = 'product_search'
+
+# bm25() column weights: name, brand, category, subcategory
+BM25_WEIGHTS = (10.0, 5.0, 2.0, 2.0)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+_SELECT_PRODUCT_TEXT = """
+    SELECT p.id, p.name, COALESCE(b.brand_name, ''), COALESCE(c.category_name, ''), COALESCE(s.sub_category_name, '')
+    FROM product_product p
+    LEFT JOIN product_brand b ON b.id = p.brand_id
+    LEFT JOIN product_category c ON c.id = p.category_id
+    LEFT JOIN product_subcategory s ON s.id = p.subcategory_id
+"""
+
+
+def fts_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 MATCH expression (every word as a quoted prefix)"""
+    tokens = _TOKEN_RE.findall(text or '')
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def rebuild_search_index():
+    """Repopulate the whole search table from the catalog tables"""
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, brand_name, category_name, sub_category_name) '
+            + _SELECT_PRODUCT_TEXT
+        )
+
+
+def index_products(where, params):
+    """Re-index the products matched by a WHERE clause over product_product (aliased p)"""
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN (SELECT p.id FROM product_product p WHERE {where})', params)
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, brand_name, category_name, sub_category_name) '
+            + _SELECT_PRODUCT_TEXT + f' WHERE {where}',
+            params,
+        )
+
+
+def index_product(product_id):
+    index_products('p.id = %s', [product_id])
+
+
+def remove_product(product_id):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [product_id])
+
+
+def search_product_ids(text, limit=None):
+    """
+    Return product ids matching the text, best BM25 match first.
+
+    On databases without FTS5 this falls back to icontains lookups.
+    """
+    match = build_match_query(text)
+    if not match:
+        return []
+
+    if not fts_enabled():
+        from product.models import Product
+
+        query = Q()
+        for token in _TOKEN_RE.findall(text):
+            query &= (
+                Q(name__icontains=token) | Q(brand__brand_name__icontains=token)
+                | Q(category__category_name__icontains=token)
+                | Q(subcategory__sub_category_name__icontains=token)
+            )
+        ids = Product.objects.filter(query).order_by('name').values_list('id', flat=True)
+        return list(ids[:limit] if limit else ids)
+
+    weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+    sql = (
+        f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+        f'ORDER BY bm25({SEARCH_TABLE}, {weights}), rowid'
+    )
+    params = [match]
+    if limit:
+        sql += ' LIMIT %s'
+        params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
@@ -0,0 +1,123 @@
+# product/session_cart.py
+import json
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+SESSION_CART_SALT = 'product.session_cart'
+
+# Keeps the signed cookie far below the 4 KB browser limit
+MAX_LINES = 50
+MAX_QUANTITY = 99
+
+
+def _cookie_name():
+    return getattr(settings, 'SESSION_CART_COOKIE_NAME', 'kickera_cart')
+
+
+def _cookie_age():
+    return getattr(settings, 'SESSION_CART_COOKIE_AGE', 60 * 60 * 24 * 30)
+
+
+class SessionCart:
+    """
+    Cart of an anonymous visitor, kept in a signed cookie ({product_id: quantity}).
+
+    Adding, updating and removing lines never touches the database. The lines are
+    merged into product.models.Cart when the visitor logs in (see product/signals.py).
+    """
+
+    def __init__(self, lines=None):
+        self.lines = dict(lines or {})
+        self.modified = False
+
+    @classmethod
+    def from_request(cls, request):
+        # A missing, tampered or expired cookie reads as an empty cart
+        data = request.get_signed_cookie(_cookie_name(), default=None, salt=SESSION_CART_SALT, max_age=_cookie_age())
+        try:
+            lines = {int(pk): int(quantity) for pk, quantity in json.loads(data).items()} if data else {}
+        except (ValueError, TypeError, AttributeError):
+            lines = {}
+        return cls({pk: min(quantity, MAX_QUANTITY) for pk, quantity in lines.items() if quantity > 0})
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __contains__(self, product_id):
+        return product_id in self.lines
+
+    def quantity(self, product_id):
+        return self.lines.get(product_id, 0)
+
+    def add(self, product_id, quantity=1):
+        """Add to a line and return its new quantity (None when the cart is full)"""
+        if product_id not in self.lines and len(self.lines) >= MAX_LINES:
+            return None
+        return self.set(product_id, self.lines.get(product_id, 0) + quantity)
+
+    def set(self, product_id, quantity):
+        if quantity <= 0:
+            self.remove(product_id)
+            return 0
+        self.lines[product_id] = min(quantity, MAX_QUANTITY)
+        self.modified = True
+        return self.lines[product_id]
+
+    def remove(self, product_id):
+        if self.lines.pop(product_id, None) is not None:
+            self.modified = True
+
+    def clear(self):
+        if self.lines:
+            self.lines = {}
+            self.modified = True
+
+    def save(self, response):
+        name = _cookie_name()
+        if not self.lines:
+            response.delete_cookie(name)
+            return
+        response.set_signed_cookie(
+            name,
+            json.dumps({str(pk): quantity for pk, quantity in self.lines.items()}, separators=(',', ':')),
+            salt=SESSION_CART_SALT,
+            max_age=_cookie_age(),
+            httponly=True,
+            samesite='Lax',
+            secure=settings.SESSION_COOKIE_SECURE,
+        )
+
+
+class SessionCartMiddleware:
+    """
+    Attach request.session_cart and write the cookie back when a view changed it.
+
+    Sync and async capable: it only reads and writes a cookie, so under ASGI it
+    awaits the rest of the chain directly instead of making Django run the whole
+    chain in the single thread-sensitive executor.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.session_cart = SessionCart.from_request(request)
+        response = self.get_response(request)
+        if request.session_cart.modified:
+            request.session_cart.save(response)
+        return response
+
+    async def __acall__(self, request):
+        request.session_cart = SessionCart.from_request(request)
+        response = await self.get_response(request)
+        if request.session_cart.modified:
+            request.session_cart.save(response)
+        return response
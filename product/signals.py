@@ -1,7 +1,14 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 from django.contrib import messages
-from .models import Cart
+from django.contrib.auth.signals import user_logged_in
+from .autocomplete import autocomplete_index
+from .counters import adjust_count
+from .facets import facet_index
+from .models import Cart, Product, Brand, Category, SubCategory, Image, Review, WishList
+from . import search
+from .taxonomy import invalidate_taxonomy
+from .thumbnails import schedule_variants
 
 @receiver(post_save, sender=Cart)
 def cart_item_added_or_updated(sender, instance, created, **kwargs):
@@ -17,3 +24,144 @@ def cart_item_removed(sender, instance, **kwargs):
     request = getattr(instance, '_request', None)
     if request:
         messages.success(request, "Product removed from cart successfully. also this is Signal's file code Message")
+
+
+# Keep the in-memory catalog facet index in sync with product writes
+@receiver(post_save, sender=Product)
+def product_saved_update_facets(sender, instance, **kwargs):
+    facet_index.update(instance)
+
+@receiver(post_delete, sender=Product)
+def product_deleted_update_facets(sender, instance, **kwargs):
+    facet_index.remove(instance.pk)
+
+
+# Keep the FTS5 product search table in sync
+@receiver(post_save, sender=Product)
+def product_saved_update_search(sender, instance, **kwargs):
+    search.index_product(instance.pk)
+
+@receiver(post_delete, sender=Product)
+def product_deleted_update_search(sender, instance, **kwargs):
+    search.remove_product(instance.pk)
+
+@receiver(post_save, sender=Brand)
+def brand_saved_update_search(sender, instance, created, **kwargs):
+    if not created:
+        search.index_products('p.brand_id = %s', [instance.pk])
+
+@receiver(post_save, sender=Category)
+def category_saved_update_search(sender, instance, created, **kwargs):
+    if not created:
+        search.index_products('p.category_id = %s', [instance.pk])
+
+@receiver(post_save, sender=SubCategory)
+def subcategory_saved_update_search(sender, instance, created, **kwargs):
+    if not created:
+        search.index_products('p.subcategory_id = %s', [instance.pk])
+
+
+# Keep Product.primary_image / image_count in sync with the Image rows
+@receiver(post_save, sender=Image)
+def image_saved_update_product(sender, instance, created, **kwargs):
+    if created:
+        Product.refresh_image_summary(instance.product_id)
+
+# Render thumbnails / WebP variants off the request thread
+@receiver(post_save, sender=Image)
+def image_saved_generate_variants(sender, instance, **kwargs):
+    if instance.image:
+        schedule_variants(instance.pk)
+
+@receiver(post_delete, sender=Image)
+def image_deleted_update_product(sender, instance, **kwargs):
+    Product.refresh_image_summary(instance.product_id)
+
+
+# Any write to the taxonomy makes every process reload its snapshot
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=SubCategory)
+@receiver([post_save, post_delete], sender=Brand)
+def taxonomy_changed(sender, **kwargs):
+    invalidate_taxonomy()
+
+
+# Keep Product's rating count/sum/histogram in sync with the Review rows
+@receiver(pre_save, sender=Review)
+def review_saving_remember_rating(sender, instance, **kwargs):
+    instance._rating_before = None
+    if instance.pk:
+        instance._rating_before = Review.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+
+@receiver(post_save, sender=Review)
+def review_saved_update_product(sender, instance, **kwargs):
+    before = getattr(instance, '_rating_before', None)
+    after = (instance.product_id, int(instance.rating))
+    if before == after:
+        return
+    if before is not None:
+        Product.apply_rating_delta(before[0], before[1], -1)
+    Product.apply_rating_delta(after[0], after[1], 1)
+
+@receiver(post_delete, sender=Review)
+def review_deleted_update_product(sender, instance, **kwargs):
+    Product.apply_rating_delta(instance.product_id, int(instance.rating), -1)
+
+
+# Keep the autocomplete trie in sync with product, brand and category names
+@receiver(post_save, sender=Product)
+def product_saved_update_autocomplete(sender, instance, **kwargs):
+    autocomplete_index.update('product', instance.pk, instance.name)
+
+@receiver(post_delete, sender=Product)
+def product_deleted_update_autocomplete(sender, instance, **kwargs):
+    autocomplete_index.remove('product', instance.pk)
+
+@receiver(post_save, sender=Brand)
+def brand_saved_update_autocomplete(sender, instance, **kwargs):
+    autocomplete_index.update('brand', instance.pk, instance.brand_name)
+
+@receiver(post_delete, sender=Brand)
+def brand_deleted_update_autocomplete(sender, instance, **kwargs):
+    autocomplete_index.remove('brand', instance.pk)
+
+@receiver(post_save, sender=Category)
+def category_saved_update_autocomplete(sender, instance, **kwargs):
+    autocomplete_index.update('category', instance.pk, instance.category_name)
+
+@receiver(post_delete, sender=Category)
+def category_deleted_update_autocomplete(sender, instance, **kwargs):
+    autocomplete_index.remove('category', instance.pk)
+
+
+# Keep the cached navbar cart/wishlist counters in step with the rows
+@receiver(post_save, sender=Cart)
+def cart_saved_update_count(sender, instance, created, **kwargs):
+    if created:
+        adjust_count('cart_count', instance.user_id, 1)
+
+@receiver(post_delete, sender=Cart)
+def cart_deleted_update_count(sender, instance, **kwargs):
+    adjust_count('cart_count', instance.user_id, -1)
+
+@receiver(post_save, sender=WishList)
+def wishlist_saved_update_count(sender, instance, created, **kwargs):
+    if created:
+        adjust_count('wishlist_count', instance.user_id, 1)
+
+@receiver(post_delete, sender=WishList)
+def wishlist_deleted_update_count(sender, instance, **kwargs):
+    adjust_count('wishlist_count', instance.user_id, -1)
+
+
+# Move an anonymous visitor's cookie cart into their Cart rows on login (allauth or admin)
+@receiver(user_logged_in)
+def merge_session_cart(sender, request, user, **kwargs):
+    session_cart = getattr(request, 'session_cart', None)
+    if not session_cart:
+        return
+    existing = set(Product.objects.filter(pk__in=list(session_cart.lines)).values_list('id', flat=True))
+    quantities = {pk: quantity for pk, quantity in session_cart.lines.items() if pk in existing}
+    if quantities:
+        Cart.add_products(user.pk, quantities)
+    session_cart.clear()
@@ -0,0 +1,91 @@
+# product/taxonomy.py
+import threading
+import time
+from collections import defaultdict
+from types import MappingProxyType
+
+from django.core.cache import cache
+from django.db import transaction
+
+# Shared version counter, bumped after every committed Category/SubCategory/Brand write
+TAXONOMY_VERSION_KEY = 'product:taxonomy_version'
+
+_lock = threading.Lock()
+_snapshot = None
+
+
+class TaxonomySnapshot:
+    """
+    Read-only view of every category, subcategory and brand.
+
+    Built in one pass and shared by all requests of this process until the
+    taxonomy version changes. The model instances inside must not be modified.
+    """
+
+    __slots__ = ('version', 'categories', 'subcategories', 'brands', 'subcategories_by_category')
+
+    def __init__(self, version, categories, subcategories, brands):
+        self.version = version
+        self.categories = tuple(categories)
+        self.subcategories = tuple(subcategories)
+        self.brands = tuple(brands)
+
+        grouped = defaultdict(list)
+        for subcategory in self.subcategories:
+            grouped[subcategory.category_id].append(subcategory)
+        self.subcategories_by_category = MappingProxyType({
+            category.id: tuple(grouped.get(category.id, ())) for category in self.categories
+        })
+
+    def subcategories_for(self, category_id):
+        return self.subcategories_by_category.get(category_id, ())
+
+
+def _initial_version():
+    # Time based so a counter lost from the cache never repeats an old version
+    return int(time.time() * 1000)
+
+
+def _current_version():
+    version = cache.get(TAXONOMY_VERSION_KEY)
+    if version is None:
+        cache.add(TAXONOMY_VERSION_KEY, _initial_version(), None)
+        version = cache.get(TAXONOMY_VERSION_KEY)
+    return version
+
+
+def _load(version):
+    from product.models import Brand, Category, SubCategory
+
+    return TaxonomySnapshot(
+        version,
+        Category.objects.all(),
+        SubCategory.objects.select_related('category'),
+        Brand.objects.all(),
+    )
+
+
+def get_taxonomy():
+    """Return the current TaxonomySnapshot, reloading it only when the version moved"""
+    global _snapshot
+    version = _current_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    with _lock:
+        if _snapshot is None or _snapshot.version != version:
+            # Version is read before loading, so a concurrent write only makes us reload again
+            _snapshot = _load(version)
+        return _snapshot
+
+
+def _bump_version():
+    try:
+        cache.incr(TAXONOMY_VERSION_KEY)
+    except ValueError:
+        cache.set(TAXONOMY_VERSION_KEY, _initial_version(), None)
+
+
+def invalidate_taxonomy():
+    """Bump the version once the current transaction commits (other workers must see the new rows)"""
+    transaction.on_commit(_bump_version)
@@ -8,4 +8,29 @@ def subtract(value, arg):
     try:
         return float(value) - float(arg)
     except (ValueError, TypeError):
-        return value 
\ No newline at end of file
+        return value
+
+@register.filter
+def get_item(mapping, key):
+    """Looks up a key in a dict (e.g. facet counts keyed by id)"""
+    try:
+        return mapping.get(key)
+    except AttributeError:
+        return None
+
+@register.filter
+def star_icons(rating):
+    """Five Font Awesome star classes (full / half / empty) for a 0-5 rating"""
+    try:
+        halves = round(float(rating or 0) * 2)
+    except (ValueError, TypeError):
+        halves = 0
+    icons = []
+    for star in range(1, 6):
+        if halves >= star * 2:
+            icons.append('fa-star')
+        elif halves == star * 2 - 1:
+            icons.append('fa-star-half-o')
+        else:
+            icons.append('fa-star-o')
+    return icons
@@ -0,0 +1,45 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from product.thumbnails import VARIANT_WIDTHS, variant_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def image_srcset(image, ext='webp'):
+    """srcset listing every variant width of a product Image ('' until its variants exist)"""
+    if not image or not image.content_hash:
+        return ''
+    return ', '.join(
+        f'{variant_url(image.content_hash, width, ext)} {width}w'
+        for width in sorted(VARIANT_WIDTHS.values())
+    )
+
+
+@register.simple_tag
+def responsive_image(image, size='card', alt='', css_class='', style='', sizes=''):
+    """
+    <picture> with WebP and JPEG srcsets for a product Image.
+
+    Falls back to a plain <img> of the original upload while the variants are
+    still being generated.
+    """
+    if not image or not image.image:
+        return ''
+    attrs = {'alt': alt, 'class': css_class or None, 'style': style or None, 'loading': 'lazy'}
+    if not image.content_hash:
+        return format_html('<img src="{}"{}>', image.image.url, flatatt(attrs))
+
+    width = VARIANT_WIDTHS[size]
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        image_srcset(image, 'webp'),
+        sizes or f'{width}px',
+        variant_url(image.content_hash, width, 'jpg'),
+        image_srcset(image, 'jpg'),
+        sizes or f'{width}px',
+        flatatt(attrs),
+    )
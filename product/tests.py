@@ -1,3 +1,194 @@
-from django.test import TestCase
+import itertools
+import re
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from PIL import Image as PILImage
+
+from core.page_cache import get_content_version
+from product.models import Brand, Category, Image, Product, Review, SubCategory
+from product import reservations
+from product.thumbnails import generate_variants
+from product.pagination import decode_cursor, encode_cursor, keyset_queryset
+from product.views import CategoryListView
+from users.models import User
+
+# Equality filters of the catalog sidebar, combined up to two at a time below
+EQUALITY_FILTERS = ('category', 'subcategory', 'brand', 'product_type')
+
+PRICE_RANGES = (
+    {},
+    {'min_price': '1000'},
+    {'min_price': '1000', 'max_price': '5000'},
+)
+
+# A plain "SCAN <table>" line (no index) is a full table scan. Sorted by id it is
+# the walk of the rowid B-tree itself, which stops after one page.
+FULL_SCAN = re.compile(r'\bSCAN \w+$')
+
+SORT_BY = ('name', 'price', 'product_type', 'id')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN checks are SQLite specific')
+class CatalogQueryPlanTests(TestCase):
+    """
+    Every filter/sort combination CategoryListView sends to the database must be
+    answered from an index, in index order: no full table scan and no temp B-tree sort.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(category_name='Shoes')
+        cls.subcategory = SubCategory.objects.create(category=cls.category, sub_category_name='Running')
+        cls.brand = Brand.objects.create(brand_name='Kickera')
+        cls.product = Product.objects.create(
+            name='Runner', price=2500, product_type='latest',
+            category=cls.category, subcategory=cls.subcategory, brand=cls.brand,
+        )
+
+    def filter_values(self):
+        return {
+            'category': str(self.category.id),
+            'subcategory': str(self.subcategory.id),
+            'brand': str(self.brand.id),
+            'product_type': 'latest',
+        }
+
+    def filter_combinations(self):
+        values = self.filter_values()
+        for size in range(3):
+            for names in itertools.combinations(EQUALITY_FILTERS, size):
+                for price_range in PRICE_RANGES:
+                    params = {name: values[name] for name in names}
+                    params.update(price_range)
+                    yield params
+
+    def listing_view(self, params):
+        view = CategoryListView()
+        view.setup(RequestFactory().get('/product/category/', {**params, 'pagination': 'cursor'}))
+        return view
+
+    def assertIndexedPlan(self, queryset, sort_field, label):
+        plan = queryset.explain()
+        for line in plan.splitlines():
+            self.assertNotIn('USE TEMP B-TREE', line, f'{label} sorts in a temp B-tree:\n{plan}')
+            if sort_field != 'id':
+                self.assertIsNone(FULL_SCAN.search(line.strip()), f'{label} scans the whole table:\n{plan}')
+
+    def assertPagePlans(self, directions):
+        for params, sort_by, descending, direction in itertools.product(
+            self.filter_combinations(), SORT_BY, (False, True), directions
+        ):
+            view = self.listing_view({**params, 'sort_by': sort_by})
+            sort_field = view.get_cursor_sort_field()
+            cursor = None
+            if direction:
+                token = encode_cursor(sort_field, descending, self.product, direction)
+                cursor = decode_cursor(token, sort_field, descending)
+            queryset = keyset_queryset(view.get_queryset(), sort_field, descending, cursor)[:11]
+            label = f'{params} sorted by {sort_by} desc={descending} cursor={direction}'
+            self.assertIndexedPlan(queryset, sort_field, label)
+
+    def test_first_page_plans(self):
+        self.assertPagePlans([None])
+
+    def test_next_and_previous_page_plans(self):
+        self.assertPagePlans(['next', 'previous'])
+
+    def test_unknown_sort_field_falls_back_to_name(self):
+        view = CategoryListView()
+        view.setup(RequestFactory().get('/product/category/', {'sort_by': 'vendor__user__password'}))
+        self.assertEqual(view.get_sort_by(), 'name')
+
+    def test_empty_cursor_page_shows_no_paginator_count(self):
+        response = self.client.get('/product/category/', {'pagination': 'cursor', 'q': 'no such shoe'})
+        self.assertContains(response, 'Showing 0 results')
+
+
+class ProductSaveTests(TestCase):
+    """A full save() of a stale Product must not undo the columns kept by UPDATE statements"""
+
+    def test_rating_summary_survives_a_stale_save(self):
+        product = Product.objects.create(name='Runner', price=2500, stock=5)
+        stale = Product.objects.get(pk=product.pk)
+        user = User.objects.create_user(username='rater', email='rater@example.com', password='pw')
+        Review.objects.create(product=product, user=user, rating=4)
+
+        stale.price = 2400
+        stale.save()
+
+        product.refresh_from_db()
+        self.assertEqual(product.price, 2400)
+        self.assertEqual((product.rating_count, product.rating_sum, product.rating_4_count), (1, 4, 1))
+
+    def test_reserved_survives_a_stale_save(self):
+        product = Product.objects.create(name='Runner', price=2500, stock=5)
+        stale = Product.objects.get(pk=product.pk)
+        reservations.reserve({product.pk: 2})
+
+        stale.name = 'Runner 2'
+        stale.save()
+
+        product.refresh_from_db()
+        self.assertEqual((product.name, product.reserved), ('Runner 2', 2))
+
+
+class VariantTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_recorded_hash_invalidates_cached_sections(self):
+        output = BytesIO()
+        PILImage.new('RGB', (40, 20), (200, 30, 30)).save(output, 'PNG')
+        product = Product.objects.create(name='Runner', price=2500, stock=5)
+        image = Image.objects.create(
+            product=product, image=SimpleUploadedFile('a.png', output.getvalue(), content_type='image/png')
+        )
+        version = get_content_version()
+
+        content_hash = generate_variants(image.pk)
+
+        image.refresh_from_db()
+        self.assertEqual(image.content_hash, content_hash)
+        self.assertNotEqual(get_content_version(), version)
+
+
+class ReservationTests(TestCase):
+    def test_commit_below_stock_still_gives_the_hold_back(self):
+        product = Product.objects.create(name='Runner', price=2500, stock=5)
+        reference = reservations.reserve({product.pk: 3})
+        # An admin lowers the stock under the hold
+        Product.objects.filter(pk=product.pk).update(stock=2)
+
+        self.assertEqual(reservations.commit(reference), [product.pk])
+
+        product.refresh_from_db()
+        self.assertEqual((product.stock, product.reserved), (2, 0))
+
+
+class AsyncMiddlewareChainTests(SimpleTestCase):
+    @override_settings(DEBUG=True)
+    def test_asgi_chain_is_not_adapted_to_sync(self):
+        # With DEBUG on, Django logs every middleware it has to wrap in async_to_sync
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            handler = ASGIHandler()
+        self.assertTrue(iscoroutinefunction(handler._middleware_chain))
+
+
+class SessionCartMiddlewareTests(TestCase):
+    async def test_async_view_writes_the_cart_cookie(self):
+        product = await Product.objects.acreate(name='Runner', price=2500, stock=5)
+        response = await self.async_client.post(f'/product/add-cart/{product.pk}/')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('kickera_cart', response.cookies)
@@ -0,0 +1,122 @@
+# product/thumbnails.py
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image as PILImage, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Fixed variant widths in px, rendered for every uploaded product image
+VARIANT_WIDTHS = {
+    'card': 300,
+    'detail': 600,
+    'zoom': 1200,
+}
+
+# extension -> (Pillow format, save options)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+VARIANT_DIR = 'product/variants'
+
+# Small pool so variant rendering never runs on the request thread, started on first use
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_name(content_hash, width, ext):
+    """Storage path of a variant, stable for the same source bytes"""
+    return f'{VARIANT_DIR}/{content_hash[:2]}/{content_hash}-{width}w.{ext}'
+
+
+def variant_url(content_hash, width, ext):
+    return default_storage.url(variant_name(content_hash, width, ext))
+
+
+def _render(source, width, pil_format, options):
+    image = source.copy()
+    if image.width > width:
+        height = round(image.height * width / image.width)
+        image = image.resize((width, height), PILImage.LANCZOS)
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        # JPEG has no alpha channel, flatten transparent PNGs onto white
+        background = PILImage.new('RGB', image.size, (255, 255, 255))
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.split()[-1])
+        image = background
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    output = BytesIO()
+    image.save(output, pil_format, **options)
+    return output.getvalue()
+
+
+def generate_variants(image_id, force=False):
+    """
+    Render every width/format variant of one product Image and record its content hash.
+
+    Variants are named after a hash of the source bytes, so re-running for the same
+    upload finds the files already in storage and skips them.
+    """
+    from product.models import Image
+
+    image = Image.objects.filter(pk=image_id).first()
+    if image is None or not image.image:
+        return None
+
+    with image.image.open('rb') as source_file:
+        data = source_file.read()
+    content_hash = hashlib.sha256(data).hexdigest()[:32]
+
+    with PILImage.open(BytesIO(data)) as source:
+        source = ImageOps.exif_transpose(source)
+        source.load()
+        for width in VARIANT_WIDTHS.values():
+            for ext, (pil_format, options) in VARIANT_FORMATS.items():
+                name = variant_name(content_hash, width, ext)
+                if default_storage.exists(name):
+                    if not force:
+                        continue
+                    default_storage.delete(name)
+                default_storage.save(name, ContentFile(_render(source, width, pil_format, options)))
+
+    # update() instead of save() so the post_save signal does not fire again,
+    # which also skips its cache bump: cached sections still hold the old URLs
+    if Image.objects.filter(pk=image_id).update(content_hash=content_hash):
+        from core.page_cache import bump_content_version
+        bump_content_version()
+    return content_hash
+
+
+def _generate_in_background(image_id):
+    try:
+        generate_variants(image_id)
+    except Exception:
+        logger.exception("Could not generate variants for product image %s", image_id)
+    finally:
+        close_old_connections()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'IMAGE_VARIANT_THREADS', 2))
+        return _executor
+
+
+def schedule_variants(image_id):
+    """Queue variant generation once the current transaction has committed"""
+    if getattr(settings, 'IMAGE_VARIANTS_SYNC', False):
+        transaction.on_commit(lambda: generate_variants(image_id))
+    else:
+        transaction.on_commit(lambda: _get_executor().submit(_generate_in_background, image_id))
@@ -1,13 +1,14 @@
 from  django.urls import  path
 from product.views import CategoryListView, CheckoutListView, \
     CartItemAddView, CartListView, CartRemoveView, CheckoutPageView, SelectUserAddressView, CartUpdateView, \
-    WishListView, AddWishListView, RemoveWishListView, ProductDetailView, AddAllToCartView
+    WishListView, AddWishListView, RemoveWishListView, ProductDetailView, AddAllToCartView, AutocompleteView
 from django.http import JsonResponse
 
 from vendor.views import load_subcategory
 
 urlpatterns = [
     path('category/',CategoryListView.as_view(),name='category_list'),
+    path('autocomplete/', AutocompleteView.as_view(), name='product_autocomplete'),
 
     # path('product/',ProductListView.as_view(),name='product_list'),
     path('product/<int:pk>/', ProductDetailView.as_view(), name='product_detail'),
@@ -1,10 +1,23 @@
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.shortcuts import get_object_or_404, redirect, render
-from django.urls import reverse_lazy
+from django.contrib.auth.views import redirect_to_login
+from django.http import JsonResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect, render
+from django.db.models.functions import Cast
+from django.urls import reverse, reverse_lazy
 from django.views.generic import ListView, View, DetailView
 from core.models import Deal
-from product.models import Product, Cart, Confirmation, WishList, Category, Brand, SubCategory
+from product.autocomplete import autocomplete_index, TOP_K
+from product.cart_summary import get_cart_summary, get_session_cart_summary, get_wishlist_summary
+from product.counters import get_counts
+from product.facets import facet_index, HydratedIdList, SORT_FIELDS
+from product.pagination import paginate_by_cursor, CURSOR_SORT_FIELDS
+from product.pricing import build_quote
+from product.recommendations import DEFAULT_TOP_K
+from product.search import search_product_ids
+from product.taxonomy import get_taxonomy
+from product.models import Product, Cart, Confirmation, WishList
 from users.forms import AddressForm
 from users.models import Address
 
@@ -16,12 +29,79 @@ class CategoryListView(ListView):
     context_object_name = 'products'
     paginate_by = 10  #showing the object in  the page you can use the paginate_by = number of page's
 
+    def get_facet_filters(self):
+        return {
+            'category': self.request.GET.get('category'),
+            'subcategory': self.kwargs.get('sub_category_id') or self.request.GET.get('subcategory'),
+            'brand': self.request.GET.get('brand'),
+            'product_type': self.request.GET.get('product_type'),
+        }
+
+    def get_sort_by(self):
+        # Search results default to relevance order, plain browsing to name
+        has_query = bool(self.request.GET.get('q', '').strip())
+        sort_by = self.request.GET.get('sort_by', 'relevance' if has_query else 'name')
+        # Only whitelisted fields can be sorted on, each one is backed by an index
+        if sort_by not in SORT_FIELDS or (sort_by == 'relevance' and not has_query):
+            sort_by = 'name'
+        return sort_by
+
+    def get_sort_order(self):
+        return 'desc' if self.request.GET.get('sort_order') == 'desc' else 'asc'
+
+    def get_cursor_sort_field(self):
+        sort_by = self.get_sort_by()
+        if sort_by not in CURSOR_SORT_FIELDS:
+            return 'name'
+        # Every row shares the filtered type, so the listing is in id order anyway
+        if sort_by == 'product_type' and self.request.GET.get('product_type'):
+            return 'id'
+        return sort_by
+
+    def use_cursor_pagination(self):
+        # Opt-in keyset pagination: ?pagination=cursor
+        return self.request.GET.get('pagination') == 'cursor'
+
+    def get_paginate_by(self, queryset):
+        # Cursor pages are sliced in get_context_data, not by Django's Paginator
+        if self.use_cursor_pagination():
+            return None
+        return super().get_paginate_by(queryset)
+
     def get_queryset(self):
-        queryset = Product.objects.all().prefetch_related('images', 'category', 'brand','subcategory')
+        queryset = Product.objects.all().select_related('primary_image').prefetch_related('category', 'brand','subcategory')
         # import pdb; pdb.set_trace()
 
+        # Filters, sorting and facet counts are answered by the in-memory facet index,
+        # the database is only hit to load the products of the current page
+        self.facet_result = None
+
+        # Full-text search (ranked by BM25), combined with the filters below
+        search_ids = None
+        query = self.request.GET.get('q', '').strip()
+        if query:
+            search_ids = search_product_ids(query)
+
+        # Cursor pages are read with range scans, ordering is applied by paginate_by_cursor
+        if self.use_cursor_pagination():
+            return self.filter_queryset(queryset, search_ids, self.get_cursor_sort_field())
+
+        self.facet_result = facet_index.search(
+            self.get_facet_filters(),
+            sort_by=self.get_sort_by(),
+            sort_order=self.get_sort_order(),
+            min_price=self.request.GET.get('min_price'),
+            max_price=self.request.GET.get('max_price'),
+            within=search_ids,
+        )
+        return HydratedIdList(self.facet_result.ids, queryset)
+
+    def filter_queryset(self, queryset, search_ids=None, sort_field=None):
+        if search_ids is not None:
+            queryset = queryset.filter(id__in=search_ids)
+
         #Filter by subcategory
-        sub_category_id = self.kwargs.get('sub_category_id')
+        sub_category_id = self.get_facet_filters()['subcategory']
         if sub_category_id:
             queryset = queryset.filter(subcategory_id=sub_category_id)
 
@@ -40,44 +120,65 @@ class CategoryListView(ListView):
         min_price = self.request.GET.get('min_price')
         max_price = self.request.GET.get('max_price')
         #check product price ()
+        price = 'price'
+        if (min_price or max_price) and sort_field not in (None, 'price'):
+            # Compare a cast of the column so the planner walks the (filter, sort_field, id)
+            # index and stops after one page, instead of range scanning the price index
+            # and sorting every match (see CatalogQueryPlanTests)
+            queryset = queryset.alias(price_value=Cast('price', Product._meta.get_field('price')))
+            price = 'price_value'
         if min_price:
-            queryset = queryset.filter(price__gte=min_price)
+            queryset = queryset.filter(**{f'{price}__gte': min_price})
         if max_price:
-            queryset = queryset.filter(price__lte=max_price)
+            queryset = queryset.filter(**{f'{price}__lte': max_price})
             
         # Filter by product type
         product_type = self.request.GET.get('product_type')
         if product_type:
             queryset = queryset.filter(product_type=product_type)
-            
-        # Sort results
-        sort_by = self.request.GET.get('sort_by', 'name')
-        sort_order = self.request.GET.get('sort_order', 'asc')
-        
-        if sort_order == 'desc':
-            sort_by = f'-{sort_by}'
-
-        queryset = queryset.order_by(sort_by)
         return queryset
 
     def get_context_data(self, **kwargs):
+        self.cursor_page = None
+        if self.use_cursor_pagination():
+            self.cursor_page = paginate_by_cursor(
+                self.object_list,
+                self.get_cursor_sort_field(),
+                self.get_sort_order() == 'desc',
+                self.request.GET.get('cursor'),
+                self.paginate_by,
+            )
+            kwargs['object_list'] = self.cursor_page.items
+
         context = super(CategoryListView, self).get_context_data(**kwargs)
         
         # Add categories and brands for filter sidebar
-        context['categories'] = Category.objects.all()
-        context['sub_categories'] = SubCategory.objects.all()
-        context['brands'] = Brand.objects.all()
+        taxonomy = get_taxonomy()
+        context['categories'] = taxonomy.categories
+        context['sub_categories'] = taxonomy.subcategories
+        context['brands'] = taxonomy.brands
+
+        # Per-facet product counts for the sidebar (None for cursor pages)
+        context['facet_counts'] = self.facet_result.counts if self.facet_result else None
         
         # Add current filter parameters for maintaining state
         context['current_filters'] = self.request.GET.copy()
+
+        # Filters as a query string (built once, reused by every pagination link)
+        filter_params = self.request.GET.copy()
+        for key in ('page', 'cursor'):
+            filter_params.pop(key, None)
+        context['filter_query'] = f'{filter_params.urlencode()}&' if filter_params else ''
+        context['cursor_page'] = self.cursor_page
         
         # Add price ranges
         context['min_price'] = self.request.GET.get('min_price', '')
         context['max_price'] = self.request.GET.get('max_price', '')
         
         # Add sort parameters
-        context['sort_by'] = self.request.GET.get('sort_by', 'name')
-        context['sort_order'] = self.request.GET.get('sort_order', 'asc')
+        context['sort_by'] = self.get_sort_by()
+        context['query'] = self.request.GET.get('q', '')
+        context['sort_order'] = self.get_sort_order()
         
         return context
 
@@ -92,30 +193,44 @@ class ConfirmationListView(LoginRequiredMixin,ListView):
     template_name = 'product/confirmation.html'
 
 
-class CartListView(LoginRequiredMixin, ListView):
+class CartListView(ListView):
     model = Cart
     template_name = 'product/cart.html'
     context_object_name = 'cart_items'
 
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user)
+        # Lines and totals come from a single query
+        if self.request.user.is_authenticated:
+            self.cart_summary = get_cart_summary(self.request.user)
+        else:
+            self.cart_summary = get_session_cart_summary(self.request.session_cart)
+        return self.cart_summary.lines
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['cart_total'] = sum(item.total_price for item in self.get_queryset())
+        context['cart_summary'] = self.cart_summary
+        context['cart_total'] = self.cart_summary.grand_total
         return context
 
 
-class CartItemAddView(LoginRequiredMixin,View):
-    def post(self, request, pk):
+class CartItemAddView(View):
+    async def post(self, request, pk):
         try:
-            product = get_object_or_404(Product, pk=pk)
-            cart_item, created = Cart.objects.get_or_create(product=product, user=request.user)
+            product = await aget_object_or_404(Product.objects.only('id', 'name'), pk=pk)
+            user = await request.auser()
+            if user.is_authenticated:
+                # Single INSERT ... ON CONFLICT DO UPDATE, safe against double clicks
+                quantity, created = await sync_to_async(Cart.add_product)(user.pk, product.pk)
+            else:
+                # Anonymous visitors keep their cart in a signed cookie, no database write
+                created = product.pk not in request.session_cart
+                quantity = request.session_cart.add(product.pk)
+                if quantity is None:
+                    messages.error(request, "Your cart is full. Please log in to add more products.")
+                    return redirect('cart_list')
 
             if not created:
-                cart_item.quantity += 1
-                cart_item.save()
-                messages.success(request, f'"{product.name}" quantity updated to {cart_item.quantity} in your cart.')
+                messages.success(request, f'"{product.name}" quantity updated to {quantity} in your cart.')
             else:
                 messages.success(request, f'"{product.name}" added to your cart successfully.')
 
@@ -129,8 +244,13 @@ class CartItemAddView(LoginRequiredMixin,View):
         return redirect('cart_list')
 
 
-class CartRemoveView(LoginRequiredMixin,View):
+class CartRemoveView(View):
     def get(self, request, pk):
+        if not request.user.is_authenticated:
+            # Anonymous cart lines are keyed by product id
+            request.session_cart.remove(pk)
+            messages.success(request, "Product removed from cart successfully.")
+            return redirect('cart_list')
         try:
             cart_item = get_object_or_404(Cart, pk=pk, user=request.user)
             cart_item.delete()
@@ -141,8 +261,15 @@ class CartRemoveView(LoginRequiredMixin,View):
         return redirect('cart_list')
 
 
-class CartUpdateView(LoginRequiredMixin,View):
+class CartUpdateView(View):
     def post(self, request, pk):
+        if not request.user.is_authenticated:
+            try:
+                request.session_cart.set(pk, int(request.POST.get('quantity', 1)))
+                messages.success(request, "Cart quantity updated successfully.")
+            except ValueError:
+                messages.error(request, "An error occurred while updating the cart: invalid quantity.")
+            return redirect('cart_list')
         try:
             cart_item = get_object_or_404(Cart, pk=pk, user=request.user)
             new_quantity = int(request.POST.get('quantity', 1))
@@ -166,7 +293,7 @@ class WishListView(LoginRequiredMixin, ListView):
     context_object_name = 'wish_list'
 
     def get_queryset(self):
-        return WishList.objects.filter(user=self.request.user).prefetch_related('product')
+        return WishList.objects.filter(user=self.request.user).select_related('product__primary_image')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -179,11 +306,9 @@ class AddWishListView(LoginRequiredMixin,View):
     def post(self, request, pk):
         try:
             product = get_object_or_404(Product, pk=pk)
-            wish_list, created = WishList.objects.get_or_create(product=product, user=request.user)
+            quantity, created = WishList.add_product(request.user.pk, product.pk)
 
             if not created:
-                wish_list.quantity += 1
-                wish_list.save()
                 messages.success(request, f'"{product.name}" quantity updated in your wishlist.')
             else:
                 messages.success(request, f'"{product.name}" added to your wishlist successfully.')
@@ -209,10 +334,13 @@ class RemoveWishListView(View,LoginRequiredMixin):
         return redirect('wishlist')
 
 
-class AddAllToCartView(LoginRequiredMixin, View):
+class AddAllToCartView(View):
     """Add all selected wishlist items to the cart"""
     
-    def post(self, request):
+    async def post(self, request):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
         product_ids = request.POST.getlist('product_ids')
         next_url = request.POST.get('next') or reverse_lazy('cart_list')
         
@@ -220,18 +348,18 @@ class AddAllToCartView(LoginRequiredMixin, View):
             messages.warning(request, "No products were selected to add to cart.")
             return redirect('wishlist')
         
-        added_count = 0
+        # One query to validate the ids, one upsert for all of them (same transaction)
+        requested_ids = [int(pk) for pk in product_ids if pk.isdigit()]
+        existing_ids = {pk async for pk in Product.objects.filter(pk__in=requested_ids).values_list('id', flat=True)}
         for product_id in product_ids:
-            try:
-                product = get_object_or_404(Product, pk=product_id)
-                cart_item, created = Cart.objects.get_or_create(product=product, user=request.user)
-                
-                if not created:
-                    cart_item.quantity += 1
-                    cart_item.save()
-                added_count += 1
-            except Exception as e:
-                messages.error(request, f"Error adding product #{product_id} to cart: {str(e)}")
+            if not product_id.isdigit() or int(product_id) not in existing_ids:
+                messages.error(request, f"Error adding product #{product_id} to cart: product not found.")
+
+        added_count = 0
+        try:
+            added_count = len(await sync_to_async(Cart.add_products)(user.pk, [pk for pk in requested_ids if pk in existing_ids]))
+        except Exception as e:
+            messages.error(request, f"Error adding products to cart: {str(e)}")
         
         if added_count > 0:
             messages.success(request, f"Added {added_count} product(s) to your cart successfully.")
@@ -248,22 +376,13 @@ class CheckoutPageView(LoginRequiredMixin, ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Get items from cart
-        cart_items = self.get_queryset()
-        cart_total = sum(item.product.price * item.quantity for item in cart_items)
-        
         # Check if there are wishlist items in request
-        wishlist_item_ids = self.request.GET.getlist('wishlist_item_id')
+        wishlist_item_ids = [pk for pk in self.request.GET.getlist('wishlist_item_id') if pk.isdigit()]
         wishlist_items = []
-        wishlist_total = 0
         
         if wishlist_item_ids:
             # Get wishlist items
-            wishlist_items = WishList.objects.filter(
-                id__in=wishlist_item_ids,
-                user=self.request.user
-            )
-            wishlist_total = sum(item.product.price for item in wishlist_items)
+            wishlist_items = get_wishlist_summary(self.request.user, wishlist_item_ids).lines
             
         # Get selected address
         address_id = self.request.GET.get('address_id')
@@ -274,21 +393,25 @@ class CheckoutPageView(LoginRequiredMixin, ListView):
             except Address.DoesNotExist:
                 pass
                 
-        # Calculate total price (cart + wishlist)
-        total_price = cart_total + wishlist_total
-        
-        # Update context with all information
+        # The signed quote is what the payment is created for, its totals are the ones shown
+        quote = build_quote(
+            self.request.user, wishlist_item_ids, address_id=selected_address.pk if selected_address else None,
+        )
+
+        # Update context with all information (total is cart + wishlist)
         context.update({
-            'cart_items': cart_items,
+            'cart_items': self.cart_summary.lines,
             'wishlist_items': wishlist_items,
-            'total_price': total_price,
+            'quote': quote,
+            'total_price': quote.amount,
             'selected_address': selected_address,
         })
         
         return context
 
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user)
+        self.cart_summary = get_cart_summary(self.request.user)
+        return self.cart_summary.lines
 
 
 class SelectUserAddressView(ListView):
@@ -305,15 +428,12 @@ class SelectUserAddressView(ListView):
         context = super().get_context_data(**kwargs)
         user_id = self.kwargs.get('pk')
         if user_id:
-            # Get the wishlist items for the use    r
-            wishlist_items = WishList.objects.filter(user_id=user_id)
-            cart_items = Cart.objects.filter(user_id=user_id)
-            context['wishlist_items'] = wishlist_items
-            context['cart_items'] = cart_items
-
-            # Calculate total price
-            total_price = sum(item.product.price for item in wishlist_items)
-            context['total_price'] = total_price
+            # Get the wishlist and cart items of the user, each with its totals in one query
+            wishlist_summary = get_wishlist_summary(user_id)
+            cart_summary = get_cart_summary(user_id)
+            context['wishlist_items'] = wishlist_summary.lines
+            context['cart_items'] = cart_summary.lines
+            context['cart_summary'] = cart_summary
         return context
 
 
@@ -334,19 +454,47 @@ def cart_wishlist_count(request):
     }
     #It will only show the product number of the user who has added the product to their wish list or cart. also filter the user
     if request.user.is_authenticated:
-        context['cart_count'] = Cart.objects.filter(user=request.user).count()
-        context['wishlist_count'] = WishList.objects.filter(user=request.user).count()
+        # Cached per user and kept current by the Cart/WishList signals (product/counters.py)
+        context.update(get_counts(request.user.pk))
+    elif hasattr(request, 'session_cart'):
+        context['cart_count'] = len(request.session_cart)
     return context
 
 # Product Detail View for use or check the product fully details
 class ProductDetailView(DetailView):
     model = Product
+    queryset = Product.objects.select_related('primary_image')
     template_name = 'product/product_detail.html'
     context_object_name = 'product'
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        if self.object.category:
-            related_products = Product.objects.filter(category=self.object.category).exclude(id=self.object.id)
-            context['related_products'] = related_products
-        return context
\ No newline at end of file
+        # Precomputed co-purchase neighbours, one lookup on the (product, rank) index
+        related_products = list(
+            Product.objects.filter(related_in__product=self.object)
+            .order_by('related_in__rank')
+            .select_related('primary_image')
+        )
+        if not related_products and self.object.category:
+            # Table not refreshed yet for this product, show a bounded category strip
+            related_products = Product.objects.filter(category=self.object.category).exclude(id=self.object.id).select_related('primary_image')[:DEFAULT_TOP_K]
+        context['related_products'] = related_products
+        return context
+
+# Type-ahead suggestions for the catalog search box, answered from the in-memory trie
+class AutocompleteView(View):
+    def get(self, request):
+        try:
+            limit = min(max(int(request.GET.get('limit', 8)), 1), TOP_K)
+        except ValueError:
+            limit = 8
+        query = request.GET.get('q', '')
+        category_url = reverse('category_list')
+        results = []
+        for entry in autocomplete_index.lookup(query, limit):
+            if entry.kind == 'product':
+                url = reverse('product_detail', args=[entry.id])
+            else:
+                url = f'{category_url}?{entry.kind}={entry.id}'
+            results.append({'type': entry.kind, 'id': entry.id, 'label': entry.label, 'url': url})
+        return JsonResponse({'query': query, 'results': results})